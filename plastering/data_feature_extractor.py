@@ -3,6 +3,7 @@ import scipy as sp
 import time
 import pdb
 
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy import stats
 from collections import Counter,defaultdict
 from multiprocessing import Pool
@@ -79,6 +80,64 @@ def get_ts_slopes(S):
 def get_bucket_slope(a):
     return np.arctan((a[2]-a[3])/(a[1]-a[0])*np.sign(a[4]-a[5])) if a[0]!=a[1] else 0
 
+def get_bucket_slopes(X, B=2):
+    '''
+    Slopes of the buckets of every row of X, same as get_ts_slopes(getS(x, B))
+    for each row x but all the rows are merged together step by step.
+    '''
+    N, D = X.shape
+    K = min(2*B, D)
+    rows = np.arange(N)
+    cols = np.arange(K)
+    # K buckets and a slot for the next sample. Values are (max_val, min_val)
+    # and indices are (beg_i, end_i, max_val_i, min_val_i) as in getS.
+    vals = np.empty((2, N, K+1), dtype=X.dtype)
+    idxs = np.empty((4, N, K+1), dtype=int)
+    vals[:, :, :K] = X[:, :K]
+    idxs[:, :, :K] = cols
+    for i in range(K, D):
+        vals[:, :, K] = X[:, i]
+        idxs[:, :, K] = i
+        max_val, min_val = vals
+        # Same errors and tie breaking as merge_neighbour_buckets.
+        merged_max = np.maximum(max_val[:, :-1], max_val[:, 1:])
+        merged_min = np.minimum(min_val[:, :-1], min_val[:, 1:])
+        merged_err = (merged_max - merged_min) / 2
+        max_err = np.max((max_val - min_val) / 2, axis=1)[:, None]
+        err = np.where(merged_err > max_err, merged_err, max_err)
+        m = np.argmin(err, axis=1)
+        max_val_i = np.where(max_val[rows, m] >= max_val[rows, m+1],
+                             idxs[2, rows, m], idxs[2, rows, m+1])
+        min_val_i = np.where(min_val[rows, m] <= min_val[rows, m+1],
+                             idxs[3, rows, m], idxs[3, rows, m+1])
+        merged = (merged_max[rows, m], merged_min[rows, m],
+                  idxs[1, rows, m+1], max_val_i, min_val_i)
+        # Drop the (m+1)-th bucket by shifting the later ones.
+        src = (cols + (cols > m[:, None]))[None, :, :]
+        vals[:, :, :K] = np.take_along_axis(vals, src, axis=2)
+        idxs[:, :, :K] = np.take_along_axis(idxs, src, axis=2)
+        vals[0, rows, m], vals[1, rows, m] = merged[:2]
+        idxs[1, rows, m], idxs[2, rows, m], idxs[3, rows, m] = merged[2:]
+
+    max_val, min_val = vals[:, :, :K]
+    beg_i, end_i, max_val_i, min_val_i = idxs[:, :, :K]
+    length = (end_i - beg_i).astype(X.dtype)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = np.arctan((max_val - min_val) / length
+                           * np.sign(max_val_i - min_val_i))
+    slopes[beg_i == end_i] = 0
+    return slopes
+
+def get_piecewise_linear_symbol_features(slopes, segs=4):
+    '''get_piecewise_linear_symbol_feature of every row of slopes'''
+    N = slopes.shape[0]
+    bins = np.linspace(-np.pi/2,np.pi/2,segs+1)
+    symbols = np.digitize(slopes, bins)
+    # Count symbols of all the rows at once by offsetting each row.
+    offsets = np.arange(N)[:, None] * (segs+2)
+    counts = np.bincount((symbols + offsets).ravel(), minlength=N*(segs+2))
+    return counts.reshape(N, segs+2)[:, 1:segs+1]
+
 
 '''for Gao'''
 def mode(ndarray,axis=0):
@@ -110,32 +169,77 @@ def mode(ndarray,axis=0):
     return (modals, counts)
 
 
+'''for Gao and Balaji'''
+ENTROPY_CHUNK_SIZE = 2**22 # max # of samples digitized at a time
+
+def digitize_rows(X, edges):
+    '''np.digitize of each row of X with its own increasing edges'''
+    bins = edges.shape[1]
+    mins = edges[:, :1]
+    steps = (edges[:, -1:] - mins) / (bins - 1)
+    # Estimate the bin from the even spacing and correct it with the edges.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        idx = np.floor((X - mins) / steps) + 1
+    idx = np.clip(np.nan_to_num(idx), 0, bins).astype(int)
+    while True:
+        lower = np.take_along_axis(edges, np.maximum(idx - 1, 0), axis=1)
+        upper = np.take_along_axis(edges, np.minimum(idx, bins - 1), axis=1)
+        down = (idx > 0) & (X < lower)
+        up = (idx < bins) & (X >= upper)
+        if not (down.any() or up.any()):
+            return idx
+        idx = idx - down + up
+
+def get_digitized_entropy(X, sorted_X, bins=100, chunk_size=ENTROPY_CHUNK_SIZE):
+    '''
+    entropy of each row of X taken as a distribution. Rows with bins or more
+    distinct values are digitized into bins evenly spaced from their min to
+    their max first. Rows are processed in chunks of chunk_size samples.
+    '''
+    N, D = X.shape
+    distinct_nums = 1 + np.count_nonzero(np.diff(sorted_X, axis=1), axis=1)
+    step = max(1, chunk_size // D)
+    H = np.zeros(N)
+    for i in range(0, N, step):
+        XX = X[i:i+step].astype(float)
+        rows = np.where(distinct_nums[i:i+step] >= bins)[0]
+        if len(rows):
+            # Per-row min/max bins broadcast over the samples.
+            edges = np.linspace(sorted_X[i+rows, 0], sorted_X[i+rows, -1],
+                                num=bins, axis=1)
+            XX[rows] = digitize_rows(X[i+rows], edges)
+        H[i:i+step] = sp.stats.entropy(XX.T)
+    return H
+
+
 '''for Hong'''
 def get_statF_on_window(X):
-    N, D = X.shape
+    '''statistics of the windows along the last axis of X'''
+    shape = X.shape[:-1]
+    D = X.shape[-1]
     dim = 11
-    F = np.zeros([N, dim])
+    F = np.zeros(shape + (dim,))
     # percentiles to be used
     p = [25, 75]
 
-    F[:, 0] = np.min(X, 1)
-    F[:, 1] = np.median(X, 1)
-    F[:, 2] = np.sqrt(np.mean(np.square(X), 1))
-    F[:, 3] = np.max(X, 1)
-    F[:, 4] = np.var(X, 1)
-    F[:, 5] = sp.stats.skew(X, 1)
-    F[:, 6] = sp.stats.kurtosis(X, 1)
-    #F[:, 5] = 0
-    #F[:, 6] = 0
+    F[..., 0] = np.min(X, -1)
+    F[..., 1] = np.median(X, -1)
+    F[..., 2] = np.sqrt(np.mean(np.square(X), -1))
+    F[..., 3] = np.max(X, -1)
+    F[..., 4] = np.var(X, -1)
+    F[..., 5] = sp.stats.skew(X, -1)
+    F[..., 6] = sp.stats.kurtosis(X, -1)
+    #F[..., 5] = 0
+    #F[..., 6] = 0
 
     # calculate slope
     xx = np.linspace(1, D, D)
     tempx = xx - np.mean(xx)
-    F[:, 7] =  tempx.dot( (X-np.mean(X)).T ) / ( tempx.dot(tempx.T) )
+    F[..., 7] = (X - np.mean(X, -1, keepdims=True)).dot(tempx) / ( tempx.dot(tempx.T) )
 
     # quantiles
-    F[:, 8:len(p)+8] = np.vstack([np.percentile(X, i, axis=1) for i in p]).T
-    F[:, 10] = F[:, 9] - F[:, 8]
+    F[..., 8:len(p)+8] = np.stack([np.percentile(X, i, axis=-1) for i in p], -1)
+    F[..., 10] = F[..., 9] - F[..., 8]
 
     # check illegal features nan/inf
     F[np.isnan(F)] = 0
@@ -144,21 +248,66 @@ def get_statF_on_window(X):
     return F
 
 
-def window_feature(X,feature_fun,win_num,overlapping=0):
-    '''function used to extract features by window sections and concatenate them'''
+def get_mean_var_on_window(X):
+    return np.stack([np.mean(X, -1), np.var(X, -1)], -1)
+
+
+def get_windows(X, win_num, overlapping=0):
+    '''
+    windows used by window_feature as (N, # of windows, win_num) arrays.
+    Windows start at i-overlapping for every win_num-overlapping samples i
+    (or at i if i < overlapping). The windows from the first one starting
+    at i-overlapping are a strided view of X without copies.
+    '''
+    N, D = X.shape
+    step = win_num - overlapping
+    V = sliding_window_view(X, win_num, axis=1)
+    offsets = range(0, D-win_num+1, step)
+    head = [i for i in offsets if i < overlapping]
+    tail = [i - overlapping for i in offsets if i >= overlapping]
+    windows = []
+    if head:
+        windows.append(V[:, head])
+    if tail:
+        windows.append(V[:, tail[0]:tail[-1]+1:step])
+    return windows
+
+
+def summarize_windows(F):
+    '''min, max, median and var of F (N, # of windows, dim) over windows'''
+    # Windows along the contiguous last axis, and a sort gives min, max and
+    # median together.
+    F = np.ascontiguousarray(F.transpose(0, 2, 1))
+    S = np.sort(F, 2)
+    W = F.shape[2]
+    median = np.mean(S[:, :, (W-1)//2:W//2+1], 2)
+    return np.hstack([S[:, :, 0], S[:, :, -1], median, np.var(F, 2)])
+
+
+def window_feature(X,feature_fun,win_num,overlapping=0,chunk_size=None):
+    '''
+    function used to extract features by window sections and summarize them
+    with min, max, median and var over the windows.
+    feature_fun maps windows along the last axis of an array to features.
+    With chunk_size, rows are processed in chunks of about chunk_size
+    window features to bound memory for long series.
+    '''
     if win_num < overlapping:
         print("Error! overlapping length should be smaller than window length")
     N,D = X.shape
-    temp = feature_fun(X[:2,:10])
-    _,dimf = temp.shape
-    F = np.zeros( [N,dimf,len(range(0,D-win_num+1,win_num-overlapping))] )
-    cnt = 0
-    for i in range(0,D-win_num+1,win_num-overlapping):
-        start = i if i<overlapping else i-overlapping
-        temp = feature_fun(X[:,start:start+win_num])
-        F[:,:,cnt] = temp
-        cnt = cnt + 1
-    return F
+    if not chunk_size:
+        step = N
+    else:
+        win_cnt = len(range(0,D-win_num+1,win_num-overlapping))
+        dimf = feature_fun(X[:1, :win_num]).shape[-1]
+        step = max(1, chunk_size // max(1, win_cnt * dimf))
+    res = []
+    for i in range(0, N, step):
+        windows = get_windows(X[i:i+step], win_num, overlapping)
+        F = np.concatenate([feature_fun(V).astype(float, copy=False)
+                            for V in windows], 1)
+        res.append(summarize_windows(F))
+    return np.vstack(res)
 
 
 '''for Balaji'''
@@ -186,8 +335,46 @@ def haar_transform(x):
 
 class data_feature_extractor():
 
-    def __init__(self, X):
+    # Statistics shared by the features: name -> statistics it is derived from.
+    # Each of them is computed by _stat_<name> at most once per X.
+    STAT_DEPS = {
+        'sorted': [],
+        'min': ['sorted'],
+        'max': ['sorted'],
+        'median': ['sorted'],
+        'percentiles': ['sorted'],
+        'mode': ['sorted'],
+        'mean': [],
+        'var': [],
+        'std': ['var'],
+        'skew': [],
+        'kurtosis': [],
+        'entropy': ['sorted'],
+        'fft_abs': [],
+        'diff1': [],
+        'diff2': ['diff1'],
+        'haar': [],
+    }
+    PERCENTILES = [2, 9, 25, 75, 91, 98]
+
+    # Statistics each feature set is made of.
+    FEATURE_STATS = {
+        'getF_1994_Li': ['mean', 'var', 'std'],
+        'getF_2012_Calbimonte': [],
+        'getF_2015_Gao': ['min', 'median', 'mean', 'max', 'std', 'skew',
+                          'kurtosis', 'entropy', 'percentiles', 'mode'],
+        'getF_2015_Hong': [],
+        'getF_2015_Bhattacharya': [],
+        'getF_2015_Balaji': ['mean', 'max', 'min', 'percentiles', 'haar',
+                             'fft_abs', 'diff1', 'diff2', 'var', 'entropy'],
+        'getF_2016_Koh': ['mean', 'var', 'fft_abs', 'skew', 'kurtosis'],
+    }
+
+    def __init__(self, X, window_chunk_size=None):
         self.X = np.asarray(X)
+        self.stats = {}
+        # Max # of window features kept at a time. None keeps all of them.
+        self.window_chunk_size = window_chunk_size
         self.functions = [
         'getF_1994_Li',
         'getF_2012_Calbimonte',
@@ -198,6 +385,95 @@ class data_feature_extractor():
         'getF_2016_Koh'
         ]
 
+    def plan_stats(self, functions=None):
+        '''statistics needed by the functions in dependency order'''
+        if functions is None:
+            functions = self.functions
+        plan = []
+        def visit(name):
+            if name in plan:
+                return
+            for dep in self.STAT_DEPS[name]:
+                visit(dep)
+            plan.append(name)
+        for func in functions:
+            for name in self.FEATURE_STATS[func]:
+                visit(name)
+        return plan
+
+    def get_stat(self, name):
+        if name not in self.stats:
+            for dep in self.STAT_DEPS[name]:
+                self.get_stat(dep)
+            self.stats[name] = getattr(self, '_stat_' + name)()
+        return self.stats[name]
+
+    def clear_stats(self):
+        self.stats = {}
+
+    def get_features(self, functions=None):
+        '''compute the shared statistics once and then every feature set'''
+        if functions is None:
+            functions = self.functions
+        for name in self.plan_stats(functions):
+            self.get_stat(name)
+        return [getattr(self, func)() for func in functions]
+
+    def _stat_sorted(self):
+        return np.sort(self.X, 1)
+
+    def _stat_min(self):
+        return self.stats['sorted'][:, 0]
+
+    def _stat_max(self):
+        return self.stats['sorted'][:, -1]
+
+    def _stat_median(self):
+        # Same as np.median, which averages the middle one or two values.
+        D = self.X.shape[1]
+        mid = slice((D-1)//2, D//2+1)
+        return np.mean(self.stats['sorted'][:, mid], 1)
+
+    def _stat_percentiles(self):
+        # One call per q as before. A batched call rounds float32
+        # differently.
+        return {q: np.percentile(self.stats['sorted'], q, axis=1)
+                for q in self.PERCENTILES}
+
+    def _stat_mode(self):
+        return mode(self.stats['sorted'], 1)[0]
+
+    def _stat_mean(self):
+        return np.mean(self.X, 1)
+
+    def _stat_var(self):
+        return np.var(self.X, 1)
+
+    def _stat_std(self):
+        # np.std is the square root of np.var.
+        return np.sqrt(self.stats['var'])
+
+    def _stat_skew(self):
+        return sp.stats.skew(self.X, 1)
+
+    def _stat_kurtosis(self):
+        return sp.stats.kurtosis(self.X, 1)
+
+    def _stat_entropy(self):
+        # digitize the data for the calculation of entropy if it only contains less than 100 discreate values
+        return get_digitized_entropy(self.X, self.stats['sorted'])
+
+    def _stat_fft_abs(self):
+        return abs(np.fft.fft(self.X, axis=1)) / self.X.shape[1]
+
+    def _stat_diff1(self):
+        return np.diff(self.X, n=1, axis=1)
+
+    def _stat_diff2(self):
+        return np.diff(self.stats['diff1'], n=1, axis=1)
+
+    def _stat_haar(self):
+        return haar_transform(self.X)
 
     # Feature
     def getF_1994_Li(self):
@@ -207,9 +483,9 @@ class data_feature_extractor():
         dim = 3
         F = np.zeros([N,dim])
 
-        F[:,0] = np.mean(X,1)
-        F[:,1] = np.var(X,1)
-        F[:,2] =  np.std(X,1) / np.mean(X,1)
+        F[:,0] = self.get_stat('mean')
+        F[:,1] = self.get_stat('var')
+        F[:,2] = self.get_stat('std') / self.get_stat('mean')
 
         names = ['mean','variance','CV']
 
@@ -224,9 +500,9 @@ class data_feature_extractor():
     def getF_2012_Calbimonte(self, B=20, segs=5):
         X = self.X
 
-        SS = get_SS(X, B)
+        slopes = get_bucket_slopes(X, B)
 
-        PLSF = np.array([get_piecewise_linear_symbol_feature(get_ts_slopes(S),segs) for S in SS])
+        PLSF = get_piecewise_linear_symbol_features(slopes, segs)
         PLSF = PLSF.astype(float)
 
         return PLSF
@@ -243,27 +519,19 @@ class data_feature_extractor():
         # percentiles to be used
         p = [2,9,25,75,91,98]
 
-        F[:, 0] = np.min(X, 1)
-        F[:, 1] = np.median(X, 1)
-        F[:, 2] = np.mean(X, 1)
-        F[:, 3] = np.max(X, 1)
-        F[:, 4] = np.std(X, 1)
-        F[:, 5] = sp.stats.skew(X, 1)
-        F[:, 6] = sp.stats.kurtosis(X, 1)
+        F[:, 0] = self.get_stat('min')
+        F[:, 1] = self.get_stat('median')
+        F[:, 2] = self.get_stat('mean')
+        F[:, 3] = self.get_stat('max')
+        F[:, 4] = self.get_stat('std')
+        F[:, 5] = self.get_stat('skew')
+        F[:, 6] = self.get_stat('kurtosis')
+        F[:, 7] = self.get_stat('entropy')
 
-        # digitize the data for the calculation of entropy if it only contains less than 100 discreate values
-        XX = np.zeros(X.shape)
-        bins = 100
-        for i in range(X.shape[0]):
-            if len(np.unique(X[i,:])) < bins:
-                XX[i,:] = X[i,:]
-            else:
-                XX[i,:] = np.digitize(X[i,:], np.linspace(min(X[i,:]), max(X[i,:]), num=bins))
-        F[:, 7] = sp.stats.entropy(XX.T)
+        percentiles = self.get_stat('percentiles')
+        F[:, 8:len(p)+8] = np.vstack([percentiles[i] for i in p]).T
 
-        F[:, 8:len(p)+8] = np.vstack([np.percentile(X,i,axis=1) for i in p]).T
-
-        F[:, 14] = mode(X,1)[0]
+        F[:, 14] = self.get_stat('mode')
 
         names = ['min','median','mean','max','std','skewness','kurtosis',
                  'entropy','p2','p9','p25','p75','p91','p98','mode']
@@ -278,16 +546,15 @@ class data_feature_extractor():
     # Feature
     def getF_2015_Hong(self):
         X = self.X
-        F = window_feature(X, get_statF_on_window, 4, overlapping=2)
-        return np.hstack([np.min(F,2), np.max(F,2), np.median(F,2), np.var(F,2)])
+        return window_feature(X, get_statF_on_window, 4, overlapping=2,
+                              chunk_size=self.window_chunk_size)
 
 
     # Feature
     def getF_2015_Bhattacharya(self):
         X = self.X
-        mean_var_fun = lambda x: np.vstack([np.mean(x,1), np.var(x,1)]).T
-        F = window_feature(X, mean_var_fun, 3, overlapping=0)
-        return np.hstack([np.min(F,2), np.max(F,2), np.median(F,2), np.var(F,2)])
+        return window_feature(X, get_mean_var_on_window, 3, overlapping=0,
+                              chunk_size=self.window_chunk_size)
 
 
     # Feature
@@ -298,42 +565,34 @@ class data_feature_extractor():
         F = np.zeros([N, dim])
 
         # 1)scale based: mean/max/min/quartiles/range;
-        F[:, 0] = np.mean(X, 1)
-        F[:, 1] = np.max(X, 1)
-        F[:, 2] = np.min(X, 1)
-        F[:, 3] = np.percentile(X, 25, axis=1)
-        F[:, 4] = np.percentile(X, 75, axis=1)
+        F[:, 0] = self.get_stat('mean')
+        F[:, 1] = self.get_stat('max')
+        F[:, 2] = self.get_stat('min')
+        F[:, 3] = self.get_stat('percentiles')[25]
+        F[:, 4] = self.get_stat('percentiles')[75]
         F[:, 5] = F[:, 1] - F[:, 2]
 
         # 2)pattern based: 3 Haar wavelets and 3 Fourier coefficients;
-        F[:, 6:9] = haar_transform(X)[:, :3] # this does not seem to be right
-        F[:, 9:12] = abs(np.fft.fft(X,axis=1)[:, 1:4]) / D # 0-th is the average
+        haar = self.get_stat('haar')
+        F[:, 6:9] = haar[:, :3] # this does not seem to be right
+        F[:, 9:12] = self.get_stat('fft_abs')[:, 1:4] # 0-th is the average
 
         # 3)shape based: location and magnitude of top 2 components from piece-wise constant model, error variance;
-        F[:, 12:18] = haar_transform(X)[:, 4:10]
+        F[:, 12:18] = haar[:, 4:10]
 
         # 4)texture based: first and second var of difference between consecutive samples, max var,
         # number of up and down changes, edge entropy measure
-        F[:, 18] = np.var(np.diff(X,n=1,axis=1), 1) # first difference
-        F[:, 19] = np.var(np.diff(X,n=2,axis=1), 1) # second difference
+        diff1 = self.get_stat('diff1')
+        F[:, 18] = np.var(diff1, 1) # first difference
+        F[:, 19] = np.var(self.get_stat('diff2'), 1) # second difference
         # max variation??
-        F[:, 20] = np.var(X, 1)
+        F[:, 20] = self.get_stat('var')
         # number of ups
-        ct = Counter(np.where(np.diff(X,n=1,axis=1)>0)[0])
-        F[:, 21] = [ct[i] for i in range(N)]
+        F[:, 21] = np.count_nonzero(diff1>0, axis=1)
         # number of downs
-        ct = Counter(np.where(np.diff(X,n=1,axis=1)<0)[0])
-        F[:, 22] = [ct[i] for i in range(N)]
+        F[:, 22] = np.count_nonzero(diff1<0, axis=1)
         # edge entropy
-        # digitize the data for the calculation of entropy if it only contains less than 100 discreate values
-        XX = np.zeros(X.shape)
-        bins = 100
-        for i in range(N):
-            if len(np.unique(X[i,:])) < bins:
-                XX[i,:] = X[i,:]
-            else:
-                XX[i,:] = np.digitize(X[i,:], np.linspace(min(X[i,:]),max(X[i,:]),num=bins))
-        F[:, 23] = sp.stats.entropy(XX.T)
+        F[:, 23] = self.get_stat('entropy')
 
 
         # check illegal features nan/inf
@@ -351,15 +610,14 @@ class data_feature_extractor():
         dim = 7
         F = np.zeros([N,dim])
 
-        F[:, 0] = np.mean(X, 1)
-        F[:, 1] = np.var(X, 1)
-        F[:, 2] = np.mean(X, 1)
+        F[:, 0] = self.get_stat('mean')
+        F[:, 1] = self.get_stat('var')
+        F[:, 2] = self.get_stat('mean')
 
-        temp_fft = abs(np.fft.fft(X,axis=1)) / D
-        F[:, 3:5] = np.vstack([temp_fft[i,:].argsort()[-3:-1][::-1] for i in range(N)])
+        F[:, 3:5] = self.get_stat('fft_abs').argsort(1)[:, -3:-1][:, ::-1]
 
-        F[:, 5] = sp.stats.skew(X, 1)
-        F[:, 6] = sp.stats.kurtosis(X, 1)
+        F[:, 5] = self.get_stat('skew')
+        F[:, 6] = self.get_stat('kurtosis')
 
         # check illegal features nan/inf
         F[np.isnan(F)] = 0
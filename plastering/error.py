@@ -5,3 +5,6 @@ class BaseOracleException(Exception):
 class EmptyTrainingSamples(BaseOracleException):
     def __init__(self):
         super(EmptyTrainingSamples, self).__init__('Empty training samples')
+
+class SnapshotVersionError(BaseOracleException):
+    pass
@@ -1,18 +1,97 @@
 from copy import deepcopy
+import threading
 from sklearn.metrics import f1_score
 from sklearn.preprocessing import LabelBinarizer, MultiLabelBinarizer
 from sklearn.preprocessing import LabelEncoder
 import numpy as np
+import scipy.sparse as sp
 import pdb
 
+
+class LabelIndicator(object):
+    """Sparse indicator matrices of labels over a persistent vocabulary.
+
+    A label keeps its column once it is seen, so labels are not refitted
+    on every evaluation. Metrics are derived from per-class TP/FP/FN and
+    per-sample intersection/union counts of the matrices.
+    Encoding is serialized, as inferencers may evaluate in several threads.
+    """
+
+    def __init__(self):
+        self.label_idx = {}
+        self.labels = []
+        self.lock = threading.RLock()
+
+    def add_labels(self, labels):
+        with self.lock:
+            for label in labels:
+                if label not in self.label_idx:
+                    self.label_idx[label] = len(self.labels)
+                    self.labels.append(label)
+
+    def encode(self, label_lists):
+        """CSR matrix with a row per label list. Duplicates count once."""
+        indptr = [0]
+        indices = []
+        with self.lock:
+            for labels in label_lists:
+                self.add_labels(labels)
+                indices.extend(set(self.label_idx[label] for label in labels))
+                indptr.append(len(indices))
+            label_num = len(self.labels)
+        data = np.ones(len(indices), dtype=np.int32)
+        return sp.csr_matrix((data, indices, indptr),
+                             shape=(len(indptr) - 1, label_num))
+
+    def encode_pair(self, true_labels, pred_labels, srcids=None):
+        """Encode true and predicted labels of the same srcids.
+
+        true_labels and pred_labels are {srcid: labels} and rows follow
+        srcids (pred_labels' srcids by default).
+        """
+        if srcids is None:
+            srcids = list(pred_labels.keys())
+        with self.lock:
+            true_mat = self.encode(true_labels[srcid] for srcid in srcids)
+            pred_mat = self.encode(pred_labels[srcid] for srcid in srcids)
+            shape = (len(srcids), len(self.labels))
+        true_mat.resize(shape)
+        pred_mat.resize(shape)
+        return true_mat, pred_mat
+
+    def get_label_mask(self, labels_filter):
+        with self.lock:
+            labels = list(self.labels)
+        return np.array([bool(labels_filter([label]))
+                         for label in labels], dtype=bool)
+
+
+label_indicator = LabelIndicator() # shared by the evaluations of a session
+
+
+def get_class_counts(true_mat, pred_mat):
+    """Per-class TP, FP and FN of indicator matrices."""
+    true_mat = sp.csr_matrix(true_mat)
+    pred_mat = sp.csr_matrix(pred_mat)
+    TP = np.asarray(true_mat.multiply(pred_mat).sum(0)).ravel()
+    FP = np.asarray(pred_mat.sum(0)).ravel() - TP
+    FN = np.asarray(true_mat.sum(0)).ravel() - TP
+    return TP, FP, FN
+
+def get_sample_counts(true_mat, pred_mat):
+    """Per-sample sizes of the intersection, union and true labels."""
+    true_mat = sp.csr_matrix(true_mat)
+    pred_mat = sp.csr_matrix(pred_mat)
+    inter = np.asarray(true_mat.multiply(pred_mat).sum(1)).ravel()
+    true_nums = np.asarray(true_mat.sum(1)).ravel()
+    union = true_nums + np.asarray(pred_mat.sum(1)).ravel() - inter
+    return inter, union, true_nums
+
+def get_f1s(TP, FP, FN):
+    return 2 * TP / (2 * TP + FP + FN)
+
 def binarize_labels(true_labels, pred_labels):
-    srcids = list(pred_labels.keys())
-    tot_labels = [list(labels) for labels in
-               list(pred_labels.values()) + list(true_labels.values())]
-    mlb = MultiLabelBinarizer().fit(tot_labels)
-    pred_mat = mlb.transform(pred_labels.values())
-    true_mat = mlb.transform(true_labels.values())
-    return true_mat, pred_mat
+    return label_indicator.encode_pair(true_labels, pred_labels)
 
 def get_micro_f1(true_labels, pred_labels):
     true_mat, pred_mat = binarize_labels(true_labels, pred_labels)
@@ -24,53 +103,36 @@ def get_macro_f1(true_labels, pred_labels):
 
 def get_macro_f1_mat(true_mat, pred_mat):
     assert true_mat.shape == pred_mat.shape
-    f1s = []
-    for i in range(0, true_mat.shape[1]):
-        if 1 not in true_mat[:,i]:
-            continue
-        f1 = f1_score(true_mat[:,i], pred_mat[:,i])
-        f1s.append(f1)
-    return np.mean(f1s)
+    TP, FP, FN = get_class_counts(true_mat, pred_mat)
+    # Only the classes that appear in the true labels.
+    valid = (TP + FN) > 0
+    return np.mean(get_f1s(TP[valid], FP[valid], FN[valid]))
 
-def get_multiclass_micro_f1(true_labels, pred_labels):
-    le = LabelEncoder()
-    #pred_mat, true_mat = binarize_labels(true_labels, pred_labels)
-    #f1_custom = get_micro_f1_mat(true_mat, pred_mat)
+def encode_multiclass(true_labels, pred_labels):
     srcids = list(true_labels.keys())
-    true_label_list = [true_labels[srcid] for srcid in srcids]
-    pred_label_list = [pred_labels[srcid] for srcid in srcids]
-    le = LabelEncoder()
-    le.fit(true_label_list + pred_label_list)
-    true_encoded = le.transform(true_label_list)
-    pred_encoded = le.transform(pred_label_list)
-    f1_micro = f1_score(true_encoded, pred_encoded, average='micro')
-    #f1_weighted = f1_score(true_encoded, pred_encoded, average='weighted')
-    #pdb.set_trace()
-    return f1_micro
+    return label_indicator.encode_pair(
+        {srcid: [true_labels[srcid]] for srcid in srcids},
+        {srcid: [pred_labels[srcid]] for srcid in srcids},
+        srcids)
+
+def get_multiclass_micro_f1(true_labels, pred_labels):
+    # With a label per sample, micro F1 is the ratio of correct samples.
+    true_mat, pred_mat = encode_multiclass(true_labels, pred_labels)
+    TP, FP, FN = get_class_counts(true_mat, pred_mat)
+    return TP.sum() / true_mat.shape[0]
 
 def get_multiclass_macro_f1(true_labels, pred_labels):
-    le = LabelEncoder()
-    #pred_mat, true_mat = binarize_labels(true_labels, pred_labels)
-    #f1_custom = get_micro_f1_mat(true_mat, pred_mat)
-    srcids = list(true_labels.keys())
-    true_label_list = [true_labels[srcid] for srcid in srcids]
-    pred_label_list = [pred_labels[srcid] for srcid in srcids]
-    le = LabelEncoder()
-    le.fit(true_label_list + pred_label_list)
-    true_encoded = le.transform(true_label_list)
-    pred_encoded = le.transform(pred_label_list)
-    f1_micro = f1_score(true_encoded, pred_encoded, average='macro')
-    #f1_weighted = f1_score(true_encoded, pred_encoded, average='weighted')
-    #pdb.set_trace()
-    return f1_micro
+    true_mat, pred_mat = encode_multiclass(true_labels, pred_labels)
+    TP, FP, FN = get_class_counts(true_mat, pred_mat)
+    # Classes either true or predicted, like sklearn's macro average.
+    valid = (TP + FP + FN) > 0
+    return np.mean(get_f1s(TP[valid], FP[valid], FN[valid]))
 
 
 
 def get_micro_f1_mat(true_mat, pred_mat):
-    TP = np.sum(np.bitwise_and(true_mat==1, pred_mat==1))
-    TN = np.sum(np.bitwise_and(true_mat==0, pred_mat==0))
-    FN = np.sum(np.bitwise_and(true_mat==1, pred_mat==0))
-    FP = np.sum(np.bitwise_and(true_mat==0, pred_mat==1))
+    TP, FP, FN = [counts.sum() for counts
+                  in get_class_counts(true_mat, pred_mat)]
     micro_prec = TP / (TP + FP)
     micro_rec = TP / (TP + FN)
     return 2 * micro_prec * micro_rec / (micro_prec + micro_rec)
@@ -81,13 +143,10 @@ def get_point_accuracy(true_tagsets, pred_tagsets):
                 for srcid in target_srcids]) / len(target_srcids)
 
 def get_accuracy(true_tagsets_sets, pred_tagsets_sets):
-    acc = 0
-    for srcid, pred_tagsets in pred_tagsets_sets.items():
-        pred = set(pred_tagsets)
-        true = set(true_tagsets_sets[srcid])
-        jaccard = len(pred.intersection(true)) / len(pred.union(true))
-        acc += jaccard
-    return acc / len(pred_tagsets_sets)
+    # Average Jaccard similarity over samples.
+    true_mat, pred_mat = binarize_labels(true_tagsets_sets, pred_tagsets_sets)
+    inter, union, _ = get_sample_counts(true_mat, pred_mat)
+    return np.mean(inter / union)
 
 def exclude_common_tagsets(tagsets):
     return [tagset for tagset in tagsets
@@ -96,16 +155,16 @@ def exclude_common_tagsets(tagsets):
             ]
 
 def get_accuracy_conservative(true_tagsets_sets, pred_tagsets_sets):
-    acc = 0
-    for srcid, pred_tagsets in pred_tagsets_sets.items():
-        pred = set(exclude_common_tagsets(pred_tagsets))
-        true = set(exclude_common_tagsets(true_tagsets_sets[srcid]))
-        if len(true) == 0:
-            jaccard = 1
-        else:
-            jaccard = len(pred.intersection(true)) / len(pred.union(true))
-        acc += jaccard
-    return acc / len(pred_tagsets_sets)
+    true_mat, pred_mat = binarize_labels(true_tagsets_sets, pred_tagsets_sets)
+    # Drop the columns of the common tagsets.
+    cols = np.where(label_indicator.get_label_mask(exclude_common_tagsets))[0]
+    true_mat = true_mat[:, cols]
+    pred_mat = pred_mat[:, cols]
+    inter, union, true_nums = get_sample_counts(true_mat, pred_mat)
+    jaccards = np.ones(len(inter))
+    valid = true_nums > 0
+    jaccards[valid] = inter[valid] / union[valid]
+    return np.mean(jaccards)
 
 
 def get_set_accuracy(true_label_sets, pred_tagset_sets):
@@ -5,7 +5,7 @@ import numpy as np
 from .timeseries_interface import *
 from .metadata_interface import *
 from .data_feature_extractor import *
-from .inferencers.building_adapter_interface import *
+from .inferencers.building_adapter import *
 
 from sklearn.feature_extraction.text import CountVectorizer as CV
 from sklearn.preprocessing import LabelEncoder as LE
@@ -31,44 +31,19 @@ def get_name_features(names):
     return fn
 
 
-def get_data_features(building, start_time, end_time):
+def get_data_features(building, start_time, end_time, pgid):
 
-    res = read_from_db(building, start_time, end_time)
+    srcids = [labeled.srcid for labeled
+              in query_labels(pgid=pgid, building=building)]
+    srcids, X = read_matrix(building, srcids, start_time, end_time,
+                            max_samples=3000, min_samples=400)
+    print ('%d points timeseries loaded'%len(srcids))
 
-    X = []
-    srcids = []
-    ctr = 0
-    ctr1 = 0
-    for labeled in query_labels(pgid=pgid, building=building):
-        srcid = labeled.srcid
-        try:
-            data = res[srcid]
-            ctr1 += 1
-        except:
-            print (srcid, 'not found and skipped.')
-            continue
-
-        try:
-            df = data['data'][:3000]
-            if len(df) < 400: #discard short sequences
-                ctr += 1
-                continue
-            else:
-                X.append( df )
-        except:
-            pass
-
-        srcids.append(srcid)
-
-    print (ctr, 'out of', ctr1, 'points timeseries not loaded')
-
-    min_len = min([len(x) for x in X])
-    X = [x[:min_len] for x in X]
-    dfe = data_feature_extractor( np.asarray(X) )
+    dfe = data_feature_extractor(X)
 
     #res = list(map(lambda x: eval('dfe.' + x + '()'), dfe.functions))
-    funcs = [getattr(dfe, func) for func in dfe.functions]
-    fd = [func() for func in funcs]
+    # Shared statistics are computed once for all the feature sets.
+    fd = dfe.get_features()
     #fd = np.concatenate(fd, axis=1)
     #fd = dfe.getF_2015_Hong()
 
@@ -103,9 +78,9 @@ class feature_selector():
             print('%d data streams loaded'%len(ids))
 
             #labels
-            res = = {obj.srcid: obj.point_tagset for obj
-                     in query_labels(pgid=self.pgid, building=building)}
-            print ('%d point names loaded for %s'%(len(res), building))
+            res = {obj.srcid: obj.point_tagset for obj
+                   in query_labels(pgid=self.pgid, building=target_building)}
+            print ('%d point names loaded for %s'%(len(res), target_building))
             label = [res[srcid] for srcid in ids]
             le = LE()
             self.label = le.fit_transform(label)
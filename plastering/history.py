@@ -0,0 +1,231 @@
+import os
+import copy
+import json
+
+import numpy as np
+
+
+# An evaluation entry of Inferencer.history is
+#   {
+#     'metrics': {name: value},
+#     'total_training_srcids': [srcid],
+#     'target_building_training_srcids': [srcid],
+#     'pred': {srcid: label or [label]},
+#   }
+# HistoryRecorder keeps each entry as a delta against the previous one
+# with srcids and labels encoded as integer ids. A record is
+#   {
+#     'iter': index of the entry,
+#     'metrics': {name: value},
+#     'new_srcids': [srcid], # srcids given the next ids in this record.
+#     'new_labels': [label], # labels given the next ids in this record.
+#     'training': [srcid id], # appended training srcids.
+#     'target_training': [srcid id],
+#     'pred': [[srcid id, label id or [label id]]], # changed predictions.
+#     'pred_removed': [srcid id],
+#     'extra': {key: value}, # other keys of the entry, stored as they are.
+#   }
+# When a srcid list is not an extension of the previous one, the record
+# holds the full list under 'training_reset'/'target_training_reset'.
+# Records are also appended to a JSONL file when filename is given.
+SRCID_LISTS = [('total_training_srcids', 'training'),
+               ('target_building_training_srcids', 'target_training')]
+ENTRY_KEYS = ['metrics', 'pred'] + [key for key, _ in SRCID_LISTS]
+
+
+def to_json(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError('{0} is not JSON serializable'.format(type(obj)))
+
+
+class Vocabulary(object):
+
+    def __init__(self):
+        self.items = []
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def encode(self, item, new_items):
+        if item not in self.ids:
+            self.ids[item] = len(self.items)
+            self.items.append(item)
+            new_items.append(item)
+        return self.ids[item]
+
+    def extend(self, items):
+        for item in items:
+            self.ids[item] = len(self.items)
+            self.items.append(item)
+
+
+class HistoryRecorder(object):
+    """Compact list of evaluation entries stored as per-iteration deltas.
+
+    It behaves like the list Inferencer.history used to be (append, len,
+    indexing and iteration), but entries are rebuilt on demand from the
+    deltas, so memory grows with the number of changed predictions
+    instead of iterations x points.
+    """
+
+    def __init__(self, filename=None, checkpoint_interval=50):
+        self.filename = filename
+        # Full states are kept every checkpoint_interval entries
+        # so that an entry is rebuilt from at most that many deltas.
+        self.checkpoint_interval = checkpoint_interval
+        self.srcid_vocab = Vocabulary()
+        self.label_vocab = Vocabulary()
+        self.records = []
+        self.checkpoints = {} # iter: encoded state
+        self.state = self._empty_state()
+        if filename:
+            if os.path.dirname(filename):
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+            open(filename, 'w').close()
+
+    def _empty_state(self):
+        return {
+            'training': [],
+            'target_training': [],
+            'pred': {},
+        }
+
+    def _copy_state(self, state):
+        return {
+            'training': list(state['training']),
+            'target_training': list(state['target_training']),
+            'pred': dict(state['pred']),
+        }
+
+    def _encode_label(self, label, new_labels):
+        if isinstance(label, (list, tuple, set)):
+            return [self.label_vocab.encode(l, new_labels) for l in label]
+        elif label is None:
+            return None
+        else:
+            return self.label_vocab.encode(label, new_labels)
+
+    def _decode_label(self, label_id):
+        if isinstance(label_id, list):
+            return [self.label_vocab.items[i] for i in label_id]
+        elif label_id is None:
+            return None
+        else:
+            return self.label_vocab.items[label_id]
+
+    def append(self, entry):
+        new_srcids = []
+        new_labels = []
+        record = {
+            'iter': len(self.records),
+            'metrics': entry.get('metrics', {}),
+        }
+        for key, name in SRCID_LISTS:
+            prev_ids = self.state[name]
+            ids = [self.srcid_vocab.encode(srcid, new_srcids)
+                   for srcid in entry.get(key, [])]
+            if ids[:len(prev_ids)] == prev_ids:
+                record[name] = ids[len(prev_ids):]
+            else:
+                record[name + '_reset'] = ids
+            self.state[name] = ids
+
+        pred = {}
+        for srcid, label in entry.get('pred', {}).items():
+            pred[self.srcid_vocab.encode(srcid, new_srcids)] = \
+                self._encode_label(label, new_labels)
+        prev_pred = self.state['pred']
+        record['pred'] = [[srcid_id, label_id]
+                          for srcid_id, label_id in pred.items()
+                          if srcid_id not in prev_pred
+                          or prev_pred[srcid_id] != label_id]
+        record['pred_removed'] = [srcid_id for srcid_id in prev_pred
+                                  if srcid_id not in pred]
+        self.state['pred'] = pred
+        record['new_srcids'] = new_srcids
+        record['new_labels'] = new_labels
+        extra = {key: value for key, value in entry.items()
+                 if key not in ENTRY_KEYS}
+        if extra:
+            record['extra'] = extra
+
+        self.records.append(record)
+        if record['iter'] % self.checkpoint_interval == 0:
+            self.checkpoints[record['iter']] = self._copy_state(self.state)
+        if self.filename:
+            with open(self.filename, 'a') as fp:
+                fp.write(json.dumps(record, default=to_json) + '\n')
+
+    def _apply(self, state, record):
+        for _, name in SRCID_LISTS:
+            if name + '_reset' in record:
+                state[name] = list(record[name + '_reset'])
+            else:
+                state[name].extend(record[name])
+        for srcid_id in record['pred_removed']:
+            del state['pred'][srcid_id]
+        for srcid_id, label_id in record['pred']:
+            state['pred'][srcid_id] = label_id
+
+    def _decode(self, state, record):
+        srcids = self.srcid_vocab.items
+        entry = {
+            'metrics': dict(record['metrics']),
+            'total_training_srcids': [srcids[i] for i in state['training']],
+            'target_building_training_srcids':
+                [srcids[i] for i in state['target_training']],
+            'pred': {srcids[srcid_id]: self._decode_label(label_id)
+                     for srcid_id, label_id in state['pred'].items()},
+        }
+        entry.update(copy.deepcopy(record.get('extra', {})))
+        return entry
+
+    def get(self, i):
+        """Rebuild the full entry of the i-th evaluation."""
+        if i < 0:
+            i += len(self.records)
+        if not 0 <= i < len(self.records):
+            raise IndexError('history index out of range')
+        if i == len(self.records) - 1:
+            return self._decode(self.state, self.records[i])
+        base = i - i % self.checkpoint_interval
+        state = self._copy_state(self.checkpoints[base])
+        for record in self.records[base + 1:i + 1]:
+            self._apply(state, record)
+        return self._decode(state, self.records[i])
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.get(j) for j in range(*i.indices(len(self)))]
+        return self.get(i)
+
+    def __iter__(self):
+        state = self._empty_state()
+        for record in self.records:
+            self._apply(state, record)
+            yield self._decode(state, record)
+
+    @classmethod
+    def load(cls, filename, checkpoint_interval=50):
+        """Read a history written by a recorder with filename."""
+        history = cls(checkpoint_interval=checkpoint_interval)
+        with open(filename, 'r') as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                history.srcid_vocab.extend(record['new_srcids'])
+                history.label_vocab.extend(record['new_labels'])
+                history._apply(history.state, record)
+                history.records.append(record)
+                if record['iter'] % checkpoint_interval == 0:
+                    history.checkpoints[record['iter']] = \
+                        history._copy_state(history.state)
+        return history
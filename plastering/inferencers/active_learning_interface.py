@@ -39,14 +39,17 @@ class ActiveLearningInterface(Inferencer):
             pgid=pgid,
         )
 
-        srcids = [point['srcid'] for point in query_labels(pgid=pgid, building=target_building)]
-        pt_type = [query_labels(pgid=pgid, srcid=srcid).firat().point_tagset for srcid in srcids]
+        label_docs = load_labels(pgid=pgid, fields=[POINT_TAGSET],
+                                 building=target_building)
+        srcids = list(label_docs.keys())
+        raw_metadata = load_raw_metadata(srcids)
+        pt_type = [label_docs[srcid][POINT_TAGSET] for srcid in srcids]
         if use_all_metadata:
             pt_name = []
             for srcid in srcids:
-                raw_metadata = RawMetadata.objects(srcid=srcid).first().metadata
+                metadata = raw_metadata[srcid]
                 sentence = []
-                sentence = '\n'.join([raw_metadata.get(metadata_type, '')
+                sentence = '\n'.join([metadata.get(metadata_type, '')
                                       for metadata_type
                                       in ['VendorGivenName',
                                           'BACnetName',
@@ -54,8 +57,8 @@ class ActiveLearningInterface(Inferencer):
                                       ])
                 pt_name.append(sentence)
         else:
-            pt_name = [RawMetadata.objects(srcid=srcid).first()
-                       .metadata['VendorGivenName'] for srcid in srcids]
+            pt_name = [raw_metadata[srcid]['VendorGivenName']
+                       for srcid in srcids]
 
         fn = get_name_features(pt_name)
 
@@ -69,12 +72,14 @@ class ActiveLearningInterface(Inferencer):
         transfer_label = []
 
         if source_building:
-            srcids = [point['srcid'] for point
-                      in query_labels(pgid=pgid, building=source_building)]
-            source_type = [query_labels(pgid=pgid, srcid=srcid).first().point_tagset
-                       for srcid in srcids]
-            source_name = [RawMetadata.objects(srcid=srcid).first()\
-                       .metadata['VendorGivenName'] for srcid in srcids]
+            source_label_docs = load_labels(pgid=pgid, fields=[POINT_TAGSET],
+                                            building=source_building)
+            srcids = list(source_label_docs.keys())
+            source_raw_metadata = load_raw_metadata(srcids)
+            source_type = [source_label_docs[srcid][POINT_TAGSET]
+                           for srcid in srcids]
+            source_name = [source_raw_metadata[srcid]['VendorGivenName']
+                           for srcid in srcids]
 
             fn_all = get_name_features( pt_name + source_name )
             fn = fn_all[:len(pt_name), :]
@@ -31,40 +31,17 @@ def get_name_features(names):
 
 def get_data_features(building, start_time, end_time, pgid):
 
-    res = read_from_db(building, start_time, end_time)
-
-    X = []
-    srcids = []
-    ctr = 0
-    ctr1 = 0
-    for labeled in query_labels(pgid=pgid, building=building):
-        srcid = labeled.srcid
-        ctr1 += 1
-        try:
-            data = res[srcid]
-        except:
-            print (srcid, 'not found and skipped.')
-            continue
-
-        #TODO: better handle the dimension, it's really ugly now
-        #computing features on long sequence is really slow now, so only loading a small port of the readings
-        try:
-            df = data['data'][:3000]
-            if len(df) < 400: #discard short sequences
-                ctr += 1
-                continue
-            else:
-                X.append( df )
-        except:
-            pdb.set_trace()
-
-        srcids.append(srcid)
-
-    print (ctr,'out of',ctr1,'points timeseries not loaded')
-
-    min_len = min([len(x) for x in X])
-    X = [x[:min_len] for x in X]
-    dfe = data_feature_extractor( np.asarray(X) )
+    srcids = [labeled.srcid for labeled
+              in query_labels(pgid=pgid, building=building)]
+    #computing features on long sequence is really slow now, so only loading a small port of the readings
+    loaded_srcids, X = read_matrix(building, srcids, start_time, end_time,
+                                   max_samples=3000,
+                                   min_samples=400) #discard short sequences
+    print (len(srcids) - len(loaded_srcids),'out of',len(srcids),
+           'points timeseries not loaded')
+    srcids = loaded_srcids
+
+    dfe = data_feature_extractor(X)
     fd = dfe.getF_2015_Hong()
 
     assert (len(srcids)==fd.shape[0])
@@ -74,10 +51,12 @@ def get_data_features(building, start_time, end_time, pgid):
 
 def get_namefeatures_labels(building, pgid):
 
-    srcids = [point['srcid'] for point in query_labels(pgid=pgid, building=building)]
+    label_docs = load_labels(pgid=pgid, fields=[POINT_TAGSET], building=building)
+    srcids = list(label_docs.keys())
+    raw_metadata = load_raw_metadata(srcids)
 
-    pt_type = [query_labels(pgid=pgid, srcid=srcid).first().point_tagset.lower() for srcid in srcids]
-    pt_name = [RawMetadata.objects(srcid=srcid).first().metadata['VendorGivenName'] for srcid in srcids]
+    pt_type = [label_docs[srcid][POINT_TAGSET].lower() for srcid in srcids]
+    pt_name = [raw_metadata[srcid]['VendorGivenName'] for srcid in srcids]
 
     fn = get_name_features(pt_name)
     print ('%d point names loaded for %s'%(len(pt_name), building))
@@ -91,7 +70,7 @@ class BuildingAdapterInterface(Inferencer):
                  target_building,
                  target_srcids,
                  source_buildings,
-                 pgid=pgid,
+                 pgid=None,
                  config={},
                  load_from_file=1
                  ):
@@ -14,6 +14,10 @@ from ..error import *
 from ..rdf_wrapper import *
 from ..evaluator import *
 from ..uis import *
+from ..snapshot import has_state, save_snapshot, load_snapshot, \
+    get_fingerprint
+from ..history import HistoryRecorder
+from ..tracer import tracer, traced, PRED_TRIPLES
 
 PUBLIC_METHODS = ['learn_auto',
                   'predict_proba',
@@ -22,6 +26,11 @@ PUBLIC_METHODS = ['learn_auto',
                   'update_model'
                   ]
 
+# Config keys that do not change what is learned. They are left out of
+# the config fingerprint of snapshots.
+STATE_CONFIG_EXCLUDED = ['state_dir', 'save_state_interval', 'resume_state',
+                         'save_history', 'profile_phases', 'profile_dir']
+
 class Inferencer(object):
     """
     # input parameters
@@ -66,6 +75,28 @@ class Inferencer(object):
             self.hotstart = config['hotstart']
         else:
             self.hotstart = False
+        # Save a snapshot every this many learning iterations and at the
+        # end of learn_auto. 0 saves only at the end and None never saves.
+        if 'save_state_interval' in config:
+            self.save_state_interval = config['save_state_interval']
+        else:
+            self.save_state_interval = 0
+        # Restore the snapshot in state_dir, if any, instead of building
+        # the features and models from the database.
+        if 'resume_state' in config:
+            self.resume_state = config['resume_state']
+        else:
+            self.resume_state = False
+        # Write the evaluation history to result_filename.
+        if 'save_history' in config:
+            self.save_history = config['save_history']
+        else:
+            self.save_history = True
+        # Phases to run under cProfile and tracemalloc.
+        if 'profile_phases' in config:
+            tracer.profile_phases.update(config['profile_phases'])
+        if 'profile_dir' in config:
+            tracer.profile_dir = config['profile_dir']
         self.pgid = pgid
         self.config = config
         self.training_srcids = [] # already known srcids
@@ -80,7 +111,8 @@ class Inferencer(object):
         self.pred_probs = {}
         self.target_building = target_building
         self.target_srcids = target_srcids
-        self.history = [] # logging and visualization purpose
+        self.framework_name = framework_name
+        self.target_srcids_fingerprint = get_fingerprint(list(target_srcids))
         self.required_label_types = required_label_types
         if ui:
             self.ui = ui
@@ -88,10 +120,18 @@ class Inferencer(object):
             schema_g = self.new_graph(empty=False)
             self.ui = ReplUi(schema_g, self.pgid)
         self.__name__ = framework_name + '-' + str(self.exp_id)
-        self.result_filename = './result/{0}_history.json'\
+        # Formerly {name}_history.json. The file is JSON Lines with one
+        # delta record per evaluation (see plastering/history.py), so read
+        # it with HistoryRecorder.load instead of json.load.
+        self.result_filename = './result/{0}_history.jsonl'\
             .format(self.__name__)
+        # logging and visualization purpose
+        self.history = HistoryRecorder(
+            self.result_filename if self.save_history else None)
         self.pred_g = self.new_graph(empty=True)
         self.pred_confidences = {}
+        # Ground truth used by evaluate, loaded once per srcid.
+        self.truth_cache = GroundTruthCache(self.pgid)
 
     def query_labels(self, **query):
         return query_labels(self.pgid, **query)
@@ -194,10 +234,12 @@ class Inferencer(object):
             labeled = self.query_labels(srcid=srcid).first()
             if not labeled:
                 self.ask_example(srcid)
+                self.truth_cache.invalidate([srcid])
             else:
                 for label_type in self.required_label_types:
                     if not labeled[label_type]:
                         self.ask_example(srcid, [label_type])
+                        self.truth_cache.invalidate([srcid])
 
     # ESSENTIAL
     def select_informative_samples(self, sample_num):
@@ -253,15 +295,9 @@ class Inferencer(object):
           - target_srcids
           - label_type: one of POINT_TAGSET, FULL_PARSING defined in common.py
         """
-        truths = {}
-        for srcid in srcids:
-            objs = self.query_labels(srcid=srcid)
-            if not objs:
-                raise Exception('No {0} labels found for {1}'
-                                .format(label_type, srcid))
-            truths[srcid] = objs.first()[label_type]
-        return truths
+        return self.truth_cache.get_labels(srcids, label_type)
 
+    @traced()
     def evaluate(self, target_srcids):
         """
         Input:
@@ -288,11 +324,9 @@ class Inferencer(object):
             metrics['accuracy'] = get_accuracy(truth, pred)
             curr_pred = pred
 
-        target_building_training_srcids = \
-            [srcid for srcid in self.training_srcids
-             if RawMetadata.objects(srcid=srcid,
-                                    building=self.target_building).count()]
-        total_training_srcids = deepcopy(self.training_srcids)
+        target_building_training_srcids = self.truth_cache.filter_building(
+            self.training_srcids, self.target_building)
+        total_training_srcids = list(self.training_srcids)
         curr_eval = {
             'metrics': metrics,
             'total_training_srcids': total_training_srcids,
@@ -302,6 +336,121 @@ class Inferencer(object):
         self.history.append(curr_eval)
         return curr_eval
 
+    def save_trace(self, filename=None, output_format='json'):
+        """Write the timers and counters collected so far.
+
+        output_format 'chrome' can be loaded in chrome://tracing.
+        """
+        if not filename:
+            filename = './result/{0}_trace.json'.format(self.__name__)
+        tracer.save(filename, output_format)
+        return filename
+
+    def get_state(self):
+        """Return (arrays, objects) that a snapshot consists of.
+
+        Frameworks extend both dicts with their features and models.
+        Arrays are stored as .npy files and objects are pickled.
+        """
+        arrays = {}
+        objects = {
+            'target_srcids': self.target_srcids,
+            'training_srcids': self.training_srcids,
+            'pred': self.pred,
+            'pred_instances': self.pred_g.get_instance_tuples(),
+            'pred_confidences': self.pred_confidences,
+        }
+        return arrays, objects
+
+    def set_state(self, arrays, objects):
+        self.target_srcids = objects['target_srcids']
+        self.training_srcids = objects['training_srcids']
+        self.pred = objects['pred']
+        self.pred_g = self.new_graph(empty=True)
+        self.pred_g.add_pred_point_results(
+            objects['pred_instances'].items())
+        self.pred_confidences = objects['pred_confidences']
+
+    def get_config_fingerprint(self):
+        """Return a digest of the config that the learned state depends on.
+
+        Frameworks fill in their config defaults after Inferencer.__init__,
+        so it is computed when a snapshot is saved or loaded.
+        """
+        return get_fingerprint({key: value
+                                for key, value in self.config.items()
+                                if key not in STATE_CONFIG_EXCLUDED})
+
+    @property
+    def state_dir(self):
+        """config['state_dir'], or a directory named after the framework,
+        the building and the fingerprints of the config and target srcids.
+        """
+        if 'state_dir' in self.config:
+            return self.config['state_dir']
+        fingerprint = get_fingerprint([self.get_config_fingerprint(),
+                                       self.target_srcids_fingerprint])
+        return './temp/{0}_{1}_{2}_state'.format(
+            self.framework_name, self.target_building, fingerprint[:12])
+
+    def save_state(self, state_dir=None):
+        """Snapshot the current state so that a session can hot start.
+
+        Args:
+            state_dir (str): target directory. self.state_dir by default.
+        """
+        if not state_dir:
+            state_dir = self.state_dir
+        arrays, objects = self.get_state()
+        info = {
+            'framework': self.__class__.__name__,
+            'target_building': self.target_building,
+            'target_srcids_fingerprint': self.target_srcids_fingerprint,
+            'config_fingerprint': self.get_config_fingerprint(),
+            'brick_version': self.brick_version,
+            'pgid': self.pgid,
+        }
+        save_snapshot(state_dir, arrays, objects, info)
+        print('INFO: state saved at {0}'.format(state_dir))
+
+    def checkpoint(self, iter_num=None):
+        """Save the state after iter_num-th iteration if it is due.
+
+        learn_auto calls it after every iteration and with iter_num=None
+        at the end.
+        """
+        if self.save_state_interval is None:
+            return
+        if iter_num is None:
+            self.save_state()
+        elif self.save_state_interval and \
+                (iter_num + 1) % self.save_state_interval == 0:
+            self.save_state()
+
+    def load_state(self, state_dir=None, mmap_mode='r'):
+        """Restore a snapshot written by save_state.
+
+        Arrays are memory-mapped read-only unless mmap_mode is None.
+        """
+        if not state_dir:
+            state_dir = self.state_dir
+        state, arrays, objects = load_snapshot(state_dir, mmap_mode)
+        if state['framework'] != self.__class__.__name__ or \
+                state['target_building'] != self.target_building:
+            raise Exception('The snapshot at {0} is for {1} at {2}'
+                            .format(state_dir, state['framework'],
+                                    state['target_building']))
+        if state.get('target_srcids_fingerprint') != \
+                self.target_srcids_fingerprint:
+            raise Exception('The snapshot at {0} has different target srcids'
+                            .format(state_dir))
+        if state.get('config_fingerprint') != self.get_config_fingerprint():
+            raise Exception('The snapshot at {0} was learned with a '
+                            'different config'.format(state_dir))
+        self.set_state(arrays, objects)
+        print('INFO: state loaded from {0} (saved at {1})'
+              .format(state_dir, state['created']))
+
     def filter_prior(self, min_prob):
         for triple, prob in self.prior_confidences.items():
             if prob < min_prob:
@@ -320,4 +469,11 @@ class Inferencer(object):
         triple = pred_g.add_pred_point_result(srcid, pred_point)
         pred_confidences[triple] = pred_prob
 
+    def add_preds(self, pred_g, pred_confidences,
+                  srcids, pred_points, pred_probs):
+        # Bulk version of add_pred.
+        tracer.count(PRED_TRIPLES, len(srcids))
+        triples = pred_g.add_pred_point_results(zip(srcids, pred_points))
+        pred_confidences.update(zip(triples, pred_probs))
+
 
@@ -3,7 +3,7 @@ from uuid import uuid4 as gen_uuid
 
 from .. import Inferencer
 from ...rdf_wrapper import *
-from rdflib import URIRef
+from rdflib import URIRef, Literal
 from jasonhelper import bidict
 
 class DummyQuiver(Inferencer):
@@ -124,22 +124,24 @@ class DummyQuiver(Inferencer):
             if self.target_building == 'ebu3b':
                 srcid = occ.split('#')[-1]
                 qstr = """
-                select ?point where {{
-                  ?occ bf:srcid "{0}" .
+                select ?point where {
+                  ?occ bf:srcid ?srcid .
                   ?occ bf:isPointOf ?something .
                   ?point bf:isPointOf ?something .
                   ?point a/rdfs:subClassOf* brick:point .
-                }}
-                """.format(srcid)
+                }
+                """
+                bindings = {'srcid': Literal(srcid)}
             else:
                 qstr = """
-                select ?point where {{
-                  {0} bf:isPointOf ?something .
+                select ?point where {
+                  ?occ bf:isPointOf ?something .
                   ?point bf:isPointOf ?something .
                   ?point a/rdfs:subClassOf* brick:point .
-                }}
-                """.format(occ.n3())
-            res = query_sparql(self.true_g, qstr)
+                }
+                """
+                bindings = {'occ': occ}
+            res = query_sparql(self.true_g, qstr, bindings)
             points = [row['point'] for row in res]
             random_obj = create_uri(str(gen_uuid())) # This would be a VAV.
             for point in points:
@@ -205,12 +207,12 @@ class DummyPritoni(Inferencer):
             ahu = row['ahu']
             datsp = row['datsp']
             qstr = """
-            select ?vav where {{
-              {0} bf:feeds+ ?vav.
+            select ?vav where {
+              ?ahu bf:feeds+ ?vav.
               ?vav a/rdfs:subClassOf* brick:VAV.
-            }}
-            """.format(ahu.n3())
-            res = query_sparql(self.true_g, qstr)
+            }
+            """
+            res = query_sparql(self.true_g, qstr, {'ahu': ahu})
             true_vavs = [row['vav'] for row in res]
             pred_vavs = [vav for vav in true_vavs if vav in found_vavs]
             for vav in pred_vavs:
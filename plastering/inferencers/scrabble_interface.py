@@ -55,14 +55,18 @@ class ScrabbleInterface(Inferencer):
         self.building_label_dict = dict()
         self.building_tagsets_dict = dict()
         for building in self.source_buildings:
+            raw_metadata, label_docs = load_metadata_cache(
+                pgid=self.pgid,
+                label_fields=[ALL_TAGSETS, FULL_PARSING],
+                building=building,
+            )
             true_tagsets = {}
             label_dict = {}
-            for labeled in self.query_labels(building=building):
-                srcid = labeled.srcid
-                true_tagsets[srcid] = labeled.tagsets
+            for srcid, labeled in label_docs.items():
+                true_tagsets[srcid] = labeled[ALL_TAGSETS]
                 fullparsing = None
                 for clm in column_names:
-                    one_fullparsing = [i[1] for i in labeled.fullparsing[clm]]
+                    one_fullparsing = [i[1] for i in labeled[FULL_PARSING][clm]]
                     if not fullparsing:
                         fullparsing = one_fullparsing
                     else:
@@ -74,10 +78,8 @@ class ScrabbleInterface(Inferencer):
             self.building_tagsets_dict[building] = true_tagsets
             self.building_label_dict[building] = label_dict
             sentence_dict = dict()
-            for raw_point in RawMetadata.objects(building=building):
-                srcid = raw_point.srcid
+            for srcid, metadata in raw_metadata.items():
                 if srcid in true_tagsets:
-                    metadata = raw_point['metadata']
                     sentence = None
                     for clm in column_names:
                         if not sentence:
@@ -9,6 +9,8 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)) + '/scrabble')
 from ..metadata_interface import *
 from ..rdf_wrapper import *
 from ..common import *
+from ..snapshot import has_state
+from ..tracer import tracer, traced, MODEL_FITS, ROWS_PREDICTED
 
 POINT_POSTFIXES = ['sensor', 'setpoint', 'alarm', 'command', 'meter']
 
@@ -80,6 +82,10 @@ class ScrabbleInterface(Inferencer):
         else:
             self.apply_validating_samples = config['apply_validating_samples']
 
+        if self.resume_state and has_state(self.state_dir):
+            self.load_state()
+            return
+
         # TODO: This should be migrated into Plastering
         building_sentence_dict, target_srcids, building_label_dict,\
             building_tagsets_dict, known_tags_dict = load_data(target_building,
@@ -103,35 +109,54 @@ class ScrabbleInterface(Inferencer):
         self.zodiac_good_preds = {}
 
 
+    def get_state(self):
+        arrays, objects = super(ScrabbleInterface, self).get_state()
+        objects['scrabble'] = self.scrabble
+        return arrays, objects
+
+    def set_state(self, arrays, objects):
+        super(ScrabbleInterface, self).set_state(arrays, objects)
+        self.scrabble = objects['scrabble']
+        self.zodiac_good_preds = {}
+
     def learn_auto(self, iter_num=25, inc_num=10):
         for i in range(0, iter_num):
             print('--------------------------')
             print('{0}th iteration'.format(i))
-            new_srcids = self.select_informative_samples(inc_num)
-            self.update_model(new_srcids)
-            self.evaluate(self.target_srcids)
+            with tracer.span('iteration', framework=self.__name__, iter=i):
+                new_srcids = self.select_informative_samples(inc_num)
+                self.update_model(new_srcids)
+                self.evaluate(self.target_srcids)
             print('curr new srcids: {0}'.format(len(new_srcids)))
             print('training srcids: {0}'.format(len(self.training_srcids)))
             print('f1: {0}'.format(self.history[-1]['metrics']['f1']))
             print('macrof1: {0}'.format(self.history[-1]['metrics']['macrof1']))
+            self.checkpoint(i)
+        self.checkpoint()
 
+    @traced()
     def update_model(self, new_srcids):
         super(ScrabbleInterface, self).update_model(new_srcids)
         self.scrabble.update_model(new_srcids)
+        tracer.count(MODEL_FITS)
 
     def postprocessing_pred(self, pred):
         # Currently only ingest point tagsets.
         pred_g = self.new_graph(empty=True)
-        for srcid, tagsets in pred.items():
-            point_tagset = sel_point_tagset(tagsets, srcid)
-            point_prob = 1 # temporary
-            pred_g.add_pred_point_result(pred_g, srcid,
-                                         point_tagset, point_prob)
+        srcids = list(pred.keys())
+        point_tagsets = [sel_point_tagset(pred[srcid], srcid)
+                         for srcid in srcids]
+        point_probs = [1] * len(srcids) # temporary
+        self.pred_confidences = {}
+        self.add_preds(pred_g, self.pred_confidences,
+                       srcids, point_tagsets, point_probs)
         return pred_g
 
+    @traced()
     def predict(self, target_srcids=None, all_tagsets=False):
         if not target_srcids:
             target_srcids = self.target_srcids
+        tracer.count(ROWS_PREDICTED, len(target_srcids))
         pred = self.scrabble.predict(target_srcids)
         if self.apply_filter_flag:
             pred = self.apply_filter_by_zodiac(pred)
@@ -212,6 +237,7 @@ class ScrabbleInterface(Inferencer):
         print('TOTAL_FIXED_POINTS: {0}'.format(fixed_cnt))
         return pred
 
+    @traced()
     def select_informative_samples(self, sample_num=10):
         # Use prior (e.g., from Zodiac.)
         new_srcids = []
@@ -12,6 +12,8 @@ from collections import defaultdict
 import arrow
 
 import scipy
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
 from scipy.cluster.vq import *
 from scipy.cluster.hierarchy import linkage, dendrogram
 import scipy.cluster.hierarchy as hier
@@ -26,18 +28,28 @@ from sklearn.neighbors import KNeighborsClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import AdaBoostClassifier
 from sklearn.naive_bayes import MultinomialNB
+from sklearn.metrics.pairwise import manhattan_distances
+from sklearn.neighbors import radius_neighbors_graph
 
 from . import Inferencer
 sys.path.append(os.path.dirname(os.path.realpath(__file__)) + '/zodiac')
 from ..metadata_interface import *
 from ..common import *
 from ..rdf_wrapper import *
+from ..snapshot import has_state
+from ..tracer import tracer, traced, MODEL_FITS, ROWS_PREDICTED
 from jasonhelper import bidict
 
 POINT_POSTFIXES = ['sensor', 'setpoint', 'alarm', 'command', 'meter']
 
 DEBUG = False
 
+# Attributes saved in snapshots besides the BoW matrices.
+STATE_ATTRS = ['total_srcids', 'ground_truths', 'true_labels',
+               'available_srcids', 'training_labels', 'trained_cids',
+               'cluster_map', 'thresholds', 'th_ptr', 'model',
+               'model_version', 'fitted_sample_num']
+
 def tokenizer(s):
     return re.findall('[a-z]+', s.lower())
 
@@ -53,6 +65,135 @@ def is_nonempty_item_included(l):
     else:
         return False
 
+def get_bow_nbytes(bow):
+    if sp.issparse(bow):
+        return bow.data.nbytes + bow.indices.nbytes + bow.indptr.nbytes
+    else:
+        return bow.nbytes
+
+def sparse_cityblock_pdist(bow, block_size=1024):
+    """Condensed cityblock distances of a sparse matrix.
+
+    It is equivalent to ``pdist(bow.toarray(), 'cityblock')`` but never
+    densifies the BoW. Rows are compared block by block against the rows
+    following them to bound the temporary memory.
+    """
+    n = bow.shape[0]
+    bow = sp.csr_matrix(bow, dtype=np.float64) # unsigned counts underflow.
+    dists = np.empty(n * (n - 1) // 2)
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        block = manhattan_distances(bow[start:end], bow[start:])
+        for i in range(start, end):
+            offset = n * i - i * (i + 1) // 2
+            dists[offset:offset + n - i - 1] = block[i - start,
+                                                     i - start + 1:]
+    return dists
+
+def unique_rows(bow):
+    """Deduplicate identical rows of a dense or CSR BoW.
+
+    Returns:
+        unique_bow: unique rows in the order of their first appearance.
+        inverse (np.ndarray): row index in unique_bow of each row in bow.
+        counts (np.ndarray): the number of rows in bow per unique row.
+    """
+    if sp.issparse(bow):
+        bow = sp.csr_matrix(bow, copy=True)
+        bow.sum_duplicates()
+        bow.eliminate_zeros()
+        rows = (bow.indices[bow.indptr[i]:bow.indptr[i + 1]].tobytes() +
+                b'|' + bow.data[bow.indptr[i]:bow.indptr[i + 1]].tobytes()
+                for i in range(bow.shape[0]))
+    else:
+        bow = np.ascontiguousarray(bow)
+        rows = (row.tobytes() for row in bow)
+    row_ids = {}
+    inverse = np.fromiter((row_ids.setdefault(row, len(row_ids))
+                           for row in rows),
+                          dtype=np.int64, count=bow.shape[0])
+    _, first_rows, counts = np.unique(inverse, return_index=True,
+                                      return_counts=True)
+    return bow[first_rows], inverse, counts
+
+def cityblock_complete_linkage(bow):
+    if sp.issparse(bow):
+        return linkage(sparse_cityblock_pdist(bow), method='complete')
+    else:
+        return linkage(bow, metric='cityblock', method='complete')
+
+def cluster_exact(bow):
+    """Complete linkage over all the rows (O(N^2) memory)."""
+    z = cityblock_complete_linkage(bow)
+    dists = list(set(z[:,2]))
+    thresh = (dists[1] + dists[2]) /2
+    #thresh = (dists[2] + dists[3]) /2
+    print("Threshold: ", thresh)
+    return hier.fcluster(z,thresh, criterion='distance')
+
+def cluster_approx(bow, eps=4):
+    """Complete linkage restricted to cityblock eps-neighborhoods.
+
+    Identical rows are merged first. Then rows are split into the
+    connected components of the graph connecting rows closer than eps,
+    and complete linkage runs per component. Every merge of the full
+    linkage below eps happens inside a component, so the threshold
+    heuristic of cluster_exact is applied to the distinct merge
+    distances below eps, and eps is doubled until there are enough of
+    them. The memory is bounded by the largest component instead of
+    the number of points.
+    """
+    unique_bow, inverse, _ = unique_rows(bow)
+    n = unique_bow.shape[0]
+    while True:
+        graph = radius_neighbors_graph(unique_bow, eps, metric='manhattan',
+                                       mode='connectivity')
+        comp_num, comp_labels = connected_components(graph, directed=False)
+        comp_order = np.argsort(comp_labels, kind='stable')
+        comp_bounds = np.cumsum(np.bincount(comp_labels,
+                                            minlength=comp_num))[:-1]
+        comps = np.split(comp_order, comp_bounds)
+        # Identical rows are merged at distance 0 in the full linkage.
+        dists = {0.0} if n < bow.shape[0] else set()
+        comp_trees = []
+        for comp in comps:
+            if len(comp) > 1:
+                z = cityblock_complete_linkage(unique_bow[comp])
+                dists.update(z[:,2][z[:,2] <= eps])
+            else:
+                z = None
+            comp_trees.append((comp, z))
+        dists = sorted(dists)
+        if len(dists) > 2:
+            break
+        if comp_num == 1:
+            # The component is the full linkage, so use all of its merge
+            # distances as cluster_exact does.
+            dists = {0.0} if n < bow.shape[0] else set()
+            for _, z in comp_trees:
+                if z is not None:
+                    dists.update(z[:,2])
+            dists = sorted(dists)
+            break
+        eps *= 2
+    thresh = (dists[1] + dists[2]) /2
+    print("Threshold: ", thresh)
+    unique_b = np.zeros(n, dtype=np.int64)
+    cid_offset = 0
+    for comp, z in comp_trees:
+        if z is None:
+            comp_b = np.ones(1, dtype=np.int64)
+        else:
+            comp_b = hier.fcluster(z, thresh, criterion='distance')
+        unique_b[comp] = comp_b + cid_offset
+        cid_offset += comp_b.max()
+    return unique_b[inverse]
+
+CLUSTER_BACKENDS = {
+    'exact': cluster_exact,
+    'approx': cluster_approx,
+}
+
 class ZodiacInterface(Inferencer):
 
     def __init__(self,
@@ -82,6 +223,39 @@ class ZodiacInterface(Inferencer):
             self.config['n_estimators'] = 400
         if 'random_state' not in config:
             self.config['random_state'] = 0
+        if 'sparse_bow' not in config:
+            self.config['sparse_bow'] = True
+        if 'bow_dtype' not in config:
+            self.config['bow_dtype'] = np.uint16
+        if 'cluster_backend' not in config:
+            self.config['cluster_backend'] = 'exact'
+        if 'cluster_params' not in config:
+            self.config['cluster_params'] = {}
+        # Fit on distinct BoW rows weighted by their counts. It changes
+        # the bootstrap samples of the forest, so the learned model and
+        # predictions differ from fitting on all the rows.
+        if 'dedup_bow' not in config:
+            self.config['dedup_bow'] = False
+        if 'n_jobs' not in config:
+            self.config['n_jobs'] = 1
+        if 'model_update' not in config:
+            self.config['model_update'] = 'refit' # or 'warm_start'
+        if 'warm_start_estimators' not in config:
+            self.config['warm_start_estimators'] = \
+                max(1, self.config['n_estimators'] // 10)
+        if 'max_estimators' not in config:
+            self.config['max_estimators'] = 2 * self.config['n_estimators']
+        # Generator of the sample selection. The random module is used by
+        # default, so random.seed() keeps controlling serial runs.
+        if 'random_seed' in config:
+            self.rng = random.Random(config['random_seed'])
+        else:
+            self.rng = random
+
+        if self.resume_state and has_state(self.state_dir):
+            self.load_state()
+            return
+
         if 'sample_num_list' in config:
             sample_num_list = config['sample_num_list']
         else:
@@ -96,7 +270,7 @@ class ZodiacInterface(Inferencer):
                                                sample_num_list):
             objects = self.query_labels(building=source_building)
             try:
-                source_srcids = random.sample(
+                source_srcids = self.rng.sample(
                     [obj.srcid for obj in objects], sample_num)
             except:
                 pdb.set_trace()
@@ -116,12 +290,13 @@ class ZodiacInterface(Inferencer):
         types = {}
         jci_names = {}
         units = {}
-        #for raw_point in RawMetadata.objects(building=self.target_building):
+        raw_metadata, label_docs = load_metadata_cache(
+            pgid=self.pgid,
+            srcids=self.total_srcids,
+            label_fields=[POINT_TAGSET],
+        )
         for srcid in self.total_srcids:
-            #srcid = raw_point['srcid']
-            #if srcid in self.target_srcids:
-            raw_point = RawMetadata.objects(srcid=srcid).first()
-            metadata = raw_point['metadata']
+            metadata = raw_metadata.get(srcid)
             if not metadata:
                 raise Exception('Metadata for {0} does not exist'
                                 .format(srcid))
@@ -157,9 +332,8 @@ class ZodiacInterface(Inferencer):
             else:
                 bacnet_unit = {}
             units[srcid] = bacnet_unit
-            label_doc = self.query_labels(srcid=srcid).first()
-            if label_doc:
-                self.ground_truths[srcid] = label_doc.point_tagset
+            if srcid in label_docs:
+                self.ground_truths[srcid] = label_docs[srcid][POINT_TAGSET]
         self.total_bow = self.init_bow(self.total_srcids,
                                        names,
                                        descs,
@@ -167,9 +341,13 @@ class ZodiacInterface(Inferencer):
                                        type_strs,
                                        types,
                                        jci_names)
+        self.srcid_rows = {}
+        self.index_srcids(self.total_srcids)
+        self.init_unique_bow()
         target_bow = self.get_sub_bow(self.target_srcids)
         self.cluster_map = self.create_cluster_map(target_bow,
                                                    self.target_srcids)
+        self.index_clusters()
         #self.cluster_map = self.create_cluster_map(self.total_bow,
         #                                           self.total_srcids)
 
@@ -193,18 +371,46 @@ class ZodiacInterface(Inferencer):
         self.th_ptr= 0
         self.th_min, self.th_max = self.thresholds[self.th_ptr]
 
+        self.model_version = 0 # increased whenever the model is fit.
+        self.fitted_sample_num = None
+        self.cluster_scores = {}
+        self.cluster_scores_version = None
         self.init_model()
         self.available_srcids += source_buildings_srcids
-        self.training_labels += [self.query_labels(srcid=srcid).first().point_tagset
+        self.training_labels += [self.ground_truths[srcid]
                                  for srcid in source_buildings_srcids]
         self.update_model(seed_srcids)
         self.learn_model()
 
+    def get_state(self):
+        arrays, objects = super(ZodiacInterface, self).get_state()
+        arrays['total_bow'] = self.total_bow
+        arrays['bow_inverse'] = self.bow_inverse
+        arrays['unique_bow'] = self.unique_bow
+        for attr in STATE_ATTRS:
+            objects[attr] = getattr(self, attr)
+        return arrays, objects
+
+    def set_state(self, arrays, objects):
+        super(ZodiacInterface, self).set_state(arrays, objects)
+        for attr in STATE_ATTRS:
+            setattr(self, attr, objects[attr])
+        self.total_bow = arrays['total_bow']
+        self.bow_inverse = arrays['bow_inverse']
+        self.unique_bow = arrays.get('unique_bow', self.total_bow)
+        self.srcid_rows = {}
+        self.index_srcids(self.total_srcids)
+        self.index_clusters()
+        self.th_min, self.th_max = self.thresholds[self.th_ptr]
+        self.cluster_scores = {}
+        self.cluster_scores_version = None
+
     def init_model(self):
         self.model = RandomForestClassifier(
             n_estimators=self.config['n_estimators'],
             random_state=self.config['random_state'],
-            #n_jobs=conf['n_jobs']
+            n_jobs=self.config['n_jobs'],
+            warm_start=self.config['model_update'] == 'warm_start',
         )
 
     def update_thresholds(self):
@@ -213,16 +419,20 @@ class ZodiacInterface(Inferencer):
 
     def get_random_learning_srcids(self, sample_num):
         srcids = []
-        random_cids = random.sample(self.cluster_map.keys(), sample_num)
+        random_cids = self.rng.sample(list(self.cluster_map.keys()),
+                                      sample_num)
         for c_id in random_cids:
-            srcid = random.choice(self.cluster_map[c_id])
+            srcid = self.rng.choice(self.cluster_map[c_id])
             srcids.append(srcid)
         return srcids
 
     def vectorize(self, d, srcids, vectorizer):
         data = [d[srcid] for srcid in srcids]
         if is_nonempty_item_included(data):
-            vect = vectorizer.fit_transform(data).toarray()
+            vect = vectorizer.fit_transform(data)\
+                .astype(self.config['bow_dtype'])
+            if not self.config['sparse_bow']:
+                vect = vect.toarray()
             return vect
         else:
             return None
@@ -239,18 +449,24 @@ class ZodiacInterface(Inferencer):
             self.vectorize(units, srcids, deepcopy(dict_vectorizer)),
             self.vectorize(type_strs, srcids, deepcopy(dict_vectorizer)),
         ]
-        bow = np.hstack([vect for vect in vectors
-                         if isinstance(vect, np.ndarray)])
+        vectors = [vect for vect in vectors if vect is not None]
+        if self.config['sparse_bow']:
+            bow = sp.hstack(vectors, format='csr')
+        else:
+            bow = np.hstack(vectors)
+        print('BoW: {0} {1} ({2:.2f} MB, {3})'.format(
+            bow.shape,
+            'sparse' if sp.issparse(bow) else 'dense',
+            get_bow_nbytes(bow) / 2 ** 20,
+            bow.dtype))
         return bow
 
     def create_cluster_map(self, bow, srcids):
         cluster_map = {}
-        z = linkage(bow, metric='cityblock', method='complete')
-        dists = list(set(z[:,2]))
-        thresh = (dists[1] + dists[2]) /2
-        #thresh = (dists[2] + dists[3]) /2
-        print("Threshold: ", thresh)
-        b = hier.fcluster(z,thresh, criterion='distance')
+        cluster_backend = self.config['cluster_backend']
+        if not callable(cluster_backend):
+            cluster_backend = CLUSTER_BACKENDS[cluster_backend]
+        b = cluster_backend(bow, **self.config['cluster_params'])
         assert bow.shape[0] == len(b)
         assert len(b) == len(srcids)
         for cid, srcid in zip(b, srcids):
@@ -262,18 +478,53 @@ class ZodiacInterface(Inferencer):
         return cluster_map
 
 
+    def index_srcids(self, srcids):
+        """Assign rows of total_bow to srcids not indexed yet.
+
+        Rows follow the order srcids are added, so any srcid appended to
+        total_srcids (and total_bow) should be registered here too.
+        """
+        for srcid in srcids:
+            if srcid not in self.srcid_rows:
+                self.srcid_rows[srcid] = len(self.srcid_rows)
+
+    def init_unique_bow(self):
+        """Map every row of total_bow to its row in unique_bow.
+
+        Points sharing the same metadata tokens share a row in unique_bow,
+        so the model is evaluated once per distinct vector, which gives
+        the same predictions. With config['dedup_bow'], the model is also
+        fit once per distinct vector and label.
+        """
+        self.unique_bow, self.bow_inverse, _ = unique_rows(self.total_bow)
+        print('Unique BoW rows: {0}/{1}'.format(self.unique_bow.shape[0],
+                                                self.total_bow.shape[0]))
+
+    def index_clusters(self):
+        """Cache row indices and cluster ids per cluster in cluster_map."""
+        self.cluster_rows = {}
+        self.srcid_cids = {}
+        for cid, cluster_srcids in self.cluster_map.items():
+            self.cluster_rows[cid] = self.get_rows(cluster_srcids)
+            for srcid in cluster_srcids:
+                self.srcid_cids[srcid] = cid
+
     def find_cluster_id(self, srcid):
-        for cid, srcids in self.cluster_map.items():
-            if srcid in srcids:
-                return cid
-        raise Exception('Srcid not found in the cluster map: {0}'
-                        .format(srcid))
+        try:
+            return self.srcid_cids[srcid]
+        except KeyError:
+            raise Exception('Srcid not found in the cluster map: {0}'
+                            .format(srcid))
 
+    def get_rows(self, srcids):
+        return np.fromiter((self.srcid_rows[srcid] for srcid in srcids),
+                           dtype=np.int64, count=len(srcids))
 
     def get_sub_bow(self, srcids):
-        return self.total_bow[
-            [self.total_srcids.index(srcid) for srcid in srcids]
-        ]
+        return self.total_bow[self.get_rows(srcids)]
+
+    def get_cluster_bow(self, cid):
+        return self.total_bow[self.cluster_rows[cid]]
 
 
     def add_cluster_label(self, cid, label):
@@ -303,7 +554,7 @@ class ZodiacInterface(Inferencer):
             cnt += 1
             srcid = triple[0].split('#')[-1]
             tagset = triple[2].split('#')[-1]
-            true_tagset = self.query_labels(srcid=srcid).first().point_tagset
+            true_tagset = self.ground_truths.get(srcid)
             if tagset == true_tagset:
                 acc += 1
         acc = 0 if not cnt else acc / cnt
@@ -322,6 +573,7 @@ class ZodiacInterface(Inferencer):
         return prior_preds
 
 
+    @traced()
     def update_model(self, new_srcids):
         super(ZodiacInterface, self).update_model(new_srcids)
 
@@ -357,19 +609,16 @@ class ZodiacInterface(Inferencer):
     def select_srcid_per_cluster(self, srcids):
         cids = []
         for srcid in srcids:
-            srcid_handled = False
-            for cid, cluster in self.cluster_map.items():
-                if srcid in cluster:
-                    if cid not in self.trained_cids:
-                        cids.append(cid)
-                    srcid_handled = True
-                    break
-            assert srcid_handled, "{0}'s cluster is not found".format(srcid)
+            assert srcid in self.srcid_cids, \
+                "{0}'s cluster is not found".format(srcid)
+            cid = self.srcid_cids[srcid]
+            if cid not in self.trained_cids:
+                cids.append(cid)
         new_srcids = []
         cids = list(set(cids))
         cluster_sizes = [len(self.cluster_map[cid]) for cid in cids]
         for cid in cids:
-            new_srcids.append(random.choice(self.cluster_map[cid]))
+            new_srcids.append(self.rng.choice(self.cluster_map[cid]))
         new_srcids = [row[1] for row in sorted(zip(cluster_sizes, new_srcids),
                                                reverse=True)]
         return new_srcids
@@ -381,14 +630,15 @@ class ZodiacInterface(Inferencer):
         # If points in a vav are identified same,
         # remove it from identified list.
         vavs = self.prior_g.get_vavs()
+        target_idxs = {srcid: i for i, srcid in enumerate(target_srcids)}
         cand_srcids = []
         for vav in vavs:
             points = self.prior_g.get_vav_points(vav)
             point_types = defaultdict(list)
             for point in points:
                 srcid = point.split('#')[-1]
-                if srcid in target_srcids:
-                    point_idx = target_srcids.index(srcid)
+                if srcid in target_idxs:
+                    point_idx = target_idxs[srcid]
                     pred_type = pred[point_idx]
                     point_types[pred_type].append(point)
             for point_type, points in point_types.items():
@@ -397,14 +647,16 @@ class ZodiacInterface(Inferencer):
         new_srcids = self.select_srcid_per_cluster(cand_srcids)
         return new_srcids
 
+    @traced()
     def select_informative_samples(self, sample_num=1):
         new_srcids = []
-        tot_srcids = reduce(adder, self.cluster_map.values())
-        base_sample_bow = self.get_sub_bow(tot_srcids)
-        base_confidence = self.model.predict_proba(base_sample_bow)
-        base_pred_labels = self.model.predict(base_sample_bow)
-        new_srcids = self.apply_prior_quiver(base_pred_labels, tot_srcids)
-        new_srcids = new_srcids[0:sample_num]
+        if self.prior_g:
+            tot_srcids = [srcid for cluster_srcids in self.cluster_map.values()
+                          for srcid in cluster_srcids]
+            base_pred_labels, base_confidence = self.predict_rows(
+                self.get_rows(tot_srcids))
+            new_srcids = self.apply_prior_quiver(base_pred_labels, tot_srcids)
+            new_srcids = new_srcids[0:sample_num]
 
         #th_update_flag and \
         test_flag = 0
@@ -417,14 +669,11 @@ class ZodiacInterface(Inferencer):
             prev_available_srcids = deepcopy(self.available_srcids)
             print('curr availble srcids: {0}'
                   .format(len(prev_available_srcids)))
+            cluster_scores = self.get_cluster_scores()
             for cid, cluster_srcids in self.cluster_map.items():
-                if cid in self.trained_cids:
+                if cid not in cluster_scores or cid in self.trained_cids:
                     continue
-                sample_bow = self.get_sub_bow(cluster_srcids)
-                confidence = self.model.predict_proba(sample_bow)
-                pred_labels = self.model.predict(sample_bow)
-                max_confidence = 0
-                max_confidence = max(map(max, confidence))
+                max_confidence, pred_labels = cluster_scores[cid]
 
                 if max_confidence >= self.th_min and \
                         max_confidence < self.th_max: # Gray zone
@@ -453,7 +702,7 @@ class ZodiacInterface(Inferencer):
                     if looping_flag:
                         pdb.set_trace()
                     test_flag = 2
-                    new_srcids.append(random.choice(cluster_srcids))
+                    new_srcids.append(self.rng.choice(cluster_srcids))
                     th_update_flag = False
                     if len(new_srcids) ==  sample_num:
                         break
@@ -479,6 +728,34 @@ class ZodiacInterface(Inferencer):
                   .format(self.th_ptr, len(self.thresholds)))
         return new_srcids
 
+    def get_cluster_scores(self):
+        """Return {cid: (max confidence, predicted labels)} of untrained clusters.
+
+        All the untrained rows are predicted in one batch and the
+        table is reused until the model is fit again.
+        """
+        if self.cluster_scores_version == self.model_version:
+            return self.cluster_scores
+        trained_cids = set(self.trained_cids)
+        cids = [cid for cid in self.cluster_map.keys()
+                if cid not in trained_cids]
+        self.cluster_scores = {}
+        self.cluster_scores_version = self.model_version
+        if not cids:
+            return self.cluster_scores
+        cluster_rows = [self.cluster_rows[cid] for cid in cids]
+        offsets = np.cumsum([0] + [len(rows) for rows in cluster_rows])
+        pred_labels, confidences = self.predict_rows(
+            np.concatenate(cluster_rows))
+        max_confidences = np.maximum.reduceat(confidences.max(axis=1),
+                                              offsets[:-1])
+        for i, cid in enumerate(cids):
+            self.cluster_scores[cid] = (
+                max_confidences[i],
+                pred_labels[offsets[i]:offsets[i + 1]],
+            )
+        return self.cluster_scores
+
     def get_num_sensors_in_gray(self):
         # TODO: This line should consider source building srcids"
         return len(self.target_srcids) - len(self.available_srcids)
@@ -489,12 +766,14 @@ class ZodiacInterface(Inferencer):
         while (iter_num == -1 and gray_num > 0) or cnt < iter_num:
             print('--------------------------')
             print('{0}th iteration'.format(cnt))
-            self.learn_model()
-            new_srcids = self.select_informative_samples(1)
-            self.update_model(new_srcids)
-            gray_num = self.get_num_sensors_in_gray()
+            with tracer.span('iteration', framework=self.__name__, iter=cnt):
+                self.learn_model()
+                new_srcids = self.select_informative_samples(1)
+                self.update_model(new_srcids)
+                gray_num = self.get_num_sensors_in_gray()
+                if evaluate_flag:
+                    self.evaluate(self.target_srcids)
             if evaluate_flag:
-                self.evaluate(self.target_srcids)
                 print('f1: {0}'.format(self.history[-1]['metrics']['f1']))
                 print('macrof1: {0}'.format(self.history[-1]['metrics']['macrof1']))
             print('curr new srcids: {0}'.format(len(new_srcids)))
@@ -504,15 +783,85 @@ class ZodiacInterface(Inferencer):
                           new_srcids[0])])))
             print('gray: {0}/{1}'.format(gray_num, len(self.target_srcids)))
             print('training srcids: {0}'.format(len(self.training_srcids)))
+            self.checkpoint(cnt)
             cnt += 1
         self.learn_model()
+        self.checkpoint()
+
+    def get_training_set(self):
+        """Return (X, y, sample_weight) of the current training samples.
+
+        Samples with the same BoW row and the same label are collapsed
+        into one weighted sample.
+        """
+        rows = self.get_rows(self.available_srcids)
+        if not self.config['dedup_bow']:
+            return self.total_bow[rows], self.training_labels, None
+        sample_weights = {}
+        for unique_row, label in zip(self.bow_inverse[rows],
+                                     self.training_labels):
+            key = (unique_row, label)
+            sample_weights[key] = sample_weights.get(key, 0) + 1
+        unique_idxs = np.array([key[0] for key in sample_weights.keys()],
+                               dtype=np.int64)
+        labels = [key[1] for key in sample_weights.keys()]
+        weights = np.array(list(sample_weights.values()), dtype=np.float64)
+        return self.unique_bow[unique_idxs], labels, weights
+
+    def can_warm_start(self, labels):
+        if self.config['model_update'] != 'warm_start' or \
+                not self.model_version:
+            return False
+        # Trees trained with a different set of classes cannot be mixed.
+        if set(labels) != set(self.model.classes_):
+            return False
+        return self.model.n_estimators + self.config['warm_start_estimators']\
+            <= self.config['max_estimators']
 
     def learn_model(self):
-        self.training_bow = self.get_sub_bow(self.available_srcids)
-        self.model.fit(self.training_bow, self.training_labels)
-
+        """Fit the model if the training samples changed since the last fit.
+
+        Training samples are only appended, so their numbers identify
+        the training set. With config['model_update'] == 'warm_start',
+        warm_start_estimators trees are grown on the current samples on
+        top of the existing ones. The model is refit from scratch when
+        classes change or the forest would exceed max_estimators.
+        """
+        sample_num = (len(self.available_srcids), len(self.training_labels))
+        if sample_num == self.fitted_sample_num:
+            return
+        with tracer.span('learn_model', 'inferencer', framework=self.__name__):
+            self.training_bow, labels, weights = self.get_training_set()
+            if self.can_warm_start(labels):
+                self.model.n_estimators += \
+                    self.config['warm_start_estimators']
+            elif self.config['model_update'] == 'warm_start':
+                self.init_model()
+            self.model.fit(self.training_bow, labels, sample_weight=weights)
+            tracer.count(MODEL_FITS)
+        self.fitted_sample_num = sample_num
+        self.model_version += 1
+
+    def predict_rows(self, rows):
+        """Predict labels and probabilities of total_bow's rows.
+
+        The model runs once per distinct vector and the results are
+        fanned out to the given rows.
+
+        Returns:
+            pred_labels (np.ndarray): predicted label per row.
+            confidences (np.ndarray): class probabilities per row.
+        """
+        tracer.count(ROWS_PREDICTED, len(rows))
+        unique_idxs, inverse = np.unique(self.bow_inverse[rows],
+                                         return_inverse=True)
+        confidences = self.model.predict_proba(self.unique_bow[unique_idxs])
+        # Same as RandomForestClassifier.predict without another pass.
+        pred_labels = self.model.classes_.take(np.argmax(confidences, axis=1))
+        return pred_labels[inverse], confidences[inverse]
+
+    @traced()
     def predict(self, target_srcids=None, output_format='ttl'):
-        t0 = arrow.get()
         if not target_srcids:
             target_srcids = self.target_srcids
         super(ZodiacInterface, self).predict(target_srcids)
@@ -521,20 +870,12 @@ class ZodiacInterface(Inferencer):
         pred_confidences = {}
         pred_g = self.new_graph()
         assert pred_g, 'pred_g is not initialized somehow'
-        sample_bow = self.get_sub_bow(target_srcids)
-
-        pred_points = self.model.predict(sample_bow)
-        confidences = self.model.predict_proba(sample_bow)
-        for srcid, pred_point, prob in zip(target_srcids,
-                                           pred_points,
-                                           confidences):
-            prob = max(prob)
-            self.add_pred(pred_g, pred_confidences,
-                          srcid, pred_point, prob)
+        pred_points, confidences = self.predict_rows(
+            self.get_rows(target_srcids))
+        self.add_preds(pred_g, pred_confidences, target_srcids,
+                       pred_points, confidences.max(axis=1))
         self.pred_g = pred_g
         self.pred_confidences = pred_confidences
-        t1 = arrow.get()
-        print('REALLY it takes this: {0}'.format(t1 - t0))
         if output_format == 'ttl':
             return pred_g
         elif output_format == 'json':
@@ -8,6 +8,7 @@ pd.options.display.max_colwidth = 200
 pp = pprint.PrettyPrinter(indent=2)
 
 from .common import *
+from .tracer import tracer, DB_QUERIES
 
 connect('plastering-withpg')
 
@@ -32,11 +33,131 @@ class LabeledMetadata(Document):
 # Helper functions
 
 def query_labels(pgid=None, **query):
+    tracer.count(DB_QUERIES)
     if pgid:
         return LabeledMetadata.objects(pgid=pgid, **query)
     else:
         return LabeledMetadata.objects(**query)
 
+def _bulk_query(doc_class, srcids=None, fields=None, **query):
+    """Fetch documents with one projected query and key them by srcid.
+
+    Args:
+        doc_class (Document): RawMetadata or LabeledMetadata.
+        srcids (iterable(str)): restrict the result to these srcids.
+        fields (list(str)): fields to project in addition to srcid.
+                            All the fields are loaded if not given.
+        query: any other mongoengine filter such as building.
+
+    Returns:
+        {srcid: {field: value}}. Only the first document is kept
+        when an srcid appears multiple times, as ``.first()`` does.
+    """
+    if srcids is not None:
+        query['srcid__in'] = list(srcids)
+    tracer.count(DB_QUERIES)
+    objs = doc_class.objects(**query)
+    if fields:
+        objs = objs.only('srcid', *fields)
+    res = {}
+    for doc in objs.as_pymongo():
+        srcid = doc['srcid']
+        if srcid not in res:
+            res[srcid] = doc
+    return res
+
+def load_raw_metadata(srcids=None, **query):
+    """Return {srcid: metadata dict} with a single RawMetadata query."""
+    docs = _bulk_query(RawMetadata, srcids, ['metadata'], **query)
+    return {srcid: doc.get('metadata', {}) for srcid, doc in docs.items()}
+
+def load_labels(pgid=None, srcids=None, fields=None, **query):
+    """Return {srcid: {label_type: label}} with a single LabeledMetadata query.
+
+    Missing label types are filled with None so that callers can index
+    the result the same way as a LabeledMetadata object.
+    """
+    if pgid:
+        query['pgid'] = pgid
+    if not fields:
+        fields = ['building', POINT_TAGSET, ALL_TAGSETS, FULL_PARSING]
+    docs = _bulk_query(LabeledMetadata, srcids, fields, **query)
+    return {srcid: {field: doc.get(field) for field in ['srcid'] + fields}
+            for srcid, doc in docs.items()}
+
+def load_metadata_cache(pgid=None, srcids=None, label_fields=None, **query):
+    """Bulk-load raw metadata and labels for a building and/or srcids.
+
+    It replaces per-srcid ``RawMetadata.objects(srcid=srcid).first()``
+    and ``query_labels(srcid=srcid).first()`` lookups with one query
+    per collection.
+
+    Returns:
+        (raw_metadata, labels): {srcid: metadata}, {srcid: labels}
+    """
+    raw_metadata = load_raw_metadata(srcids, **query)
+    labels = load_labels(pgid, srcids, label_fields, **query)
+    return raw_metadata, labels
+
+class GroundTruthCache(object):
+    """Labels and buildings of srcids loaded in bulk and reused.
+
+    Evaluation asks for the same srcids every iteration, so each srcid is
+    fetched once with a single query per collection. Call invalidate when
+    the labels of srcids change (e.g., a user labels an example).
+    """
+
+    def __init__(self, pgid=None, label_types=None):
+        self.pgid = pgid
+        self.label_types = label_types
+        self.labels = {} # srcid: {label_type: label}
+        self.buildings = {} # srcid: set of buildings in RawMetadata
+
+    def _load_labels(self, srcids):
+        new_srcids = [srcid for srcid in srcids if srcid not in self.labels]
+        if new_srcids:
+            self.labels.update(load_labels(self.pgid, new_srcids,
+                                           self.label_types))
+
+    def _load_buildings(self, srcids):
+        new_srcids = [srcid for srcid in srcids
+                      if srcid not in self.buildings]
+        if not new_srcids:
+            return
+        for srcid in new_srcids:
+            self.buildings[srcid] = set()
+        tracer.count(DB_QUERIES)
+        objs = RawMetadata.objects(srcid__in=new_srcids)\
+            .only('srcid', 'building')
+        for doc in objs.as_pymongo():
+            self.buildings[doc['srcid']].add(doc.get('building'))
+
+    def get_labels(self, srcids, label_type):
+        self._load_labels(srcids)
+        truths = {}
+        for srcid in srcids:
+            if srcid not in self.labels:
+                raise Exception('No {0} labels found for {1}'
+                                .format(label_type, srcid))
+            truths[srcid] = self.labels[srcid][label_type]
+        return truths
+
+    def filter_building(self, srcids, building):
+        """srcids that have raw metadata in the building, in order."""
+        self._load_buildings(srcids)
+        return [srcid for srcid in srcids if building in self.buildings[srcid]]
+
+    def invalidate(self, srcids=None):
+        """Forget srcids (everything by default) to reload them later."""
+        if srcids is None:
+            self.labels = {}
+            self.buildings = {}
+            return
+        for srcid in srcids:
+            self.labels.pop(srcid, None)
+            self.buildings.pop(srcid, None)
+
+
 def print_rawmetadata(srcid, building):
     objs = RawMetadata.objects(srcid=srcid, building=building)
     metadata = objs[0].metadata
@@ -4,11 +4,14 @@ import time
 from rdflib import RDF, RDFS, OWL, URIRef, Namespace
 from . import rdflib_wrapper
 from . import virtuoso_wrapper
+from .brick_hierarchy import get_brick_hierarchy
 
 
 TRIPLE_STORE_TYPE = os.environ.get('TRIPLE_STORE_TYPE', 'rdflib')
 RDFLIB = 'rdflib'
 VIRTUOSO = 'virtuoso'
+DEFAULT_BRICK_FILE = 'brick/Brick_1_0_2.ttl'
+DEFAULT_BRICKFRAME_FILE = 'brick/BrickFrame_1_0_2.ttl'
 
 if TRIPLE_STORE_TYPE == RDFLIB:
     from .rdflib_wrapper import *
@@ -19,34 +22,27 @@ else:
                     .format(TRIPLE_STORE_TYPE))
 
 
+def get_default_hierarchy():
+    """Class hierarchy of the schema loaded by the graphs or the default one."""
+    schema = rdflib_wrapper.schema_g
+    if schema is None:
+        schema = rdflib_wrapper.load_schema(DEFAULT_BRICK_FILE,
+                                            DEFAULT_BRICKFRAME_FILE)
+    return get_brick_hierarchy(schema)
+
 def get_top_class(point_tagset):
-    if isinstance(point_tagset, URIRef):
-        base_class = point_tagset.split('#')[-1].split('_')[-1]
-    elif isinstance(point_tagset, str):
-        base_class = point_tagset.split('_')[-1]
-        point_tagset = BRICK[point_tagset]
-    else:
-        raise Exception('Behavior not defined for {0}'.format(point_tagset))
-    base_tagset = BRICK[base_class]
-    if base_class in ['sensor', 'meter']:
-        qstr = """
-        select ?superclass where {{
-        ?superclass rdfs:subClassOf {0}.
-        {1} rdfs:subClassOf* ?superclass.
-        }}
-        """.format(base_tagset.n3(), point_tagset.n3())
-        res = query_sparql(schema_g, qstr)
-        assert res, 'No super class found for {0}'.format(point_tagset)
-        base_class = res[0]['superclass'].split('#')[-1]
-    return base_class
+    return get_default_hierarchy().get_top_class(point_tagset)
+
+def is_subclass(child, parent):
+    return get_default_hierarchy().is_subclass(child, parent)
 
 def get_point_type(g, point):
     qstr = """
-    select ?t where {{
-    {0} a ?t .
-    }}
-    """.format(point.n3())
-    res = query_sparql(g, qstr)
+    select ?t where {
+    ?point a ?t .
+    }
+    """
+    res = query_sparql(g, qstr, {'point': point})
     t = res[0]['t']
     return t.split('#')[-1]
     #return t
@@ -61,7 +57,11 @@ class BrickGraph(object):
                  triplestore_type=RDFLIB
                  ):
         self.triplestore_type = triplestore_type
+        self._empty = empty
         self._brick_version = version
+        self._brick_file = brick_file
+        self._brickframe_file = brickframe_file
+        self._hierarchy = None
         if self.triplestore_type == RDFLIB:
             self.base_package = rdflib_wrapper
         elif self.triplestore_type == VIRTUOSO:
@@ -82,34 +82,76 @@ class BrickGraph(object):
         prefix owl: <{5}>
         """.format(str(self.BRICK), RDF, RDFS, self.BASE, str(self.BF), OWL)
 
+    @property
+    def hierarchy(self):
+        if not self._hierarchy:
+            schema = rdflib_wrapper.load_schema(self._brick_file,
+                                                self._brickframe_file)
+            self._hierarchy = get_brick_hierarchy(schema)
+        return self._hierarchy
+
+    def __getstate__(self):
+        # Only the instance triples are sent to other processes (e.g.,
+        # Workflow nodes), which load the schema from their own cache.
+        if self.triplestore_type != RDFLIB:
+            raise Exception('Graphs of {0} cannot be pickled'
+                            .format(self.triplestore_type))
+        return {
+            'empty': self._empty,
+            'version': self._brick_version,
+            'brick_file': self._brick_file,
+            'brickframe_file': self._brickframe_file,
+            'triples': list(self._get_instance_graph()),
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state['empty'], state['version'], state['brick_file'],
+                      state['brickframe_file'], RDFLIB)
+        self.base_package.insert_triples(self.g, state['triples'])
+
+    def _get_instance_graph(self):
+        if isinstance(self.g, rdflib_wrapper.OverlayGraph):
+            return self.g.overlay
+        return self.g
+
     def insert_point(self, name, tagset):
         return self.base_package.insert_point(self.g, name, tagset)
 
     def insert_triple(self, triple):
         return self.base_package.insert_triple(self.g, triple)
 
-    def query_sparql(self, qstr):
+    def query_sparql(self, qstr, init_bindings=None):
         qstr = self.sparql_prefix + qstr
-        return self.base_package.query_sparql(self.g, qstr)
+        return self.base_package.query_sparql(self.g, qstr, init_bindings)
 
     def _try_add_pred_point_result(self, srcid, pred_point):
         triple = self._make_instance_tuple(srcid, pred_point)
         self.g.add(triple)
         return triple
 
-    def try_multiple_times(self, f, params):
+    def _try_add_triples(self, triples):
+        self.base_package.insert_triples(self.g, triples)
+        return triples
+
+    def try_multiple_times(self, f, params, trial_num=10, interval=3,
+                           backoff=1):
+        """Call f(**params) until it succeeds up to trial_num times.
+
+        The waiting time starts from interval seconds and is multiplied
+        by backoff after every failure.
+        """
         success = False
-        for i in range(0, 10):
+        for i in range(0, trial_num):
             try:
                 res = f(**params)
                 success = True
             except Exception as e:
                 print(e)
-                pdb.set_trace()
                 print('WARNING: {0} temporarily failed'.format(str(f)))
             if success:
                 break
-            time.sleep(3)
+            time.sleep(interval)
+            interval *= backoff
         assert success, 'ERROR: {0} finally failed'.format(str(f))
         return res
 
@@ -117,12 +159,35 @@ class BrickGraph(object):
                               srcid,
                               pred_point,
                               ):
-        self.try_multiple_times(self._try_add_pred_point_result, {
+        return self.try_multiple_times(self._try_add_pred_point_result, {
             'srcid': srcid,
             'pred_point': pred_point,
         })
 
+    def add_pred_point_results(self, pred_points, batch_size=1000):
+        """Add (srcid, pred_point) pairs batch by batch.
+
+        Each batch is one rdflib addN or one INSERT DATA query for Virtuoso
+        and is retried as a whole when it fails.
+
+        Returns:
+            triples (list): inserted triples in the order of pred_points.
+        """
+        triples = [self._make_instance_tuple(srcid, pred_point)
+                   for srcid, pred_point in pred_points]
+        for i in range(0, len(triples), batch_size):
+            self.try_multiple_times(self._try_add_triples, {
+                'triples': triples[i:i + batch_size],
+            }, trial_num=5, backoff=2)
+        return triples
+
     def get_vavs(self):
+        if self.triplestore_type == RDFLIB:
+            vav_classes = set(self.hierarchy.get_descendants(
+                self.BRICK['vav']))
+            return [vav for vav, vav_class
+                    in self._get_instance_graph().subject_objects(RDF.type)
+                    if vav_class in vav_classes]
         qstr = """
         select ?vav where {{
           ?vav a/rdfs:subClassOf* brick:vav .
@@ -134,11 +199,11 @@ class BrickGraph(object):
 
     def get_vav_points(self, vav):
         qstr = """
-        select ?point where {{
-        ?point bf:isPointOf {0}.
-        }}
-        """.format(vav.n3())
-        res = self.query_sparql(qstr)
+        select ?point where {
+        ?point bf:isPointOf ?vav.
+        }
+        """
+        res = self.query_sparql(qstr, {'vav': vav})
         points = [row['point'] for row in res]
         return points
 
@@ -167,6 +232,8 @@ class BrickGraph(object):
         """
 
     def get_all_tagsets(self):
+        if self.triplestore_type == RDFLIB:
+            return self.hierarchy.get_all_tagsets()
         qstr = """
         select ?tagset where {
             ?tagset rdfs:subClassOf+ bf:TagSet.
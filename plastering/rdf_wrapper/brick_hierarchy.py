@@ -0,0 +1,156 @@
+from rdflib import RDFS, URIRef, Namespace
+
+from .common import *
+
+
+hierarchies = {} # id(schema graph): BrickHierarchy
+
+
+class BrickHierarchy(object):
+    """Transitive rdfs:subClassOf closure of a schema graph.
+
+    Every class gets an integer id and its ancestors/descendants are kept
+    as bitsets (Python ints) over the ids, so subclass checks are bit
+    tests instead of SPARQL property-path queries. Both closures are
+    reflexive like rdfs:subClassOf*.
+    """
+
+    def __init__(self, schema_g):
+        self.classes = []
+        self.class_ids = {}
+        parents = []
+        children = []
+        for child, parent in schema_g.subject_objects(RDFS.subClassOf):
+            if not isinstance(child, URIRef) or \
+                    not isinstance(parent, URIRef):
+                continue
+            child_id = self._add_class(child, parents, children)
+            parent_id = self._add_class(parent, parents, children)
+            if child_id != parent_id:
+                parents[child_id].append(parent_id)
+                children[parent_id].append(child_id)
+        self.children = children
+        # Namespaces of the loaded schema version, e.g., 1.0.3.
+        self.BRICK = self._find_namespace('/Brick#', BRICK)
+        self.BF = self._find_namespace('/BrickFrame#', BF)
+        self.ancestors = self._close(parents)
+        self.descendants = self._close(children)
+        self._top_classes = {}
+
+    def _add_class(self, cls, parents, children):
+        if cls not in self.class_ids:
+            self.class_ids[cls] = len(self.classes)
+            self.classes.append(cls)
+            parents.append([])
+            children.append([])
+        return self.class_ids[cls]
+
+    def _close(self, edges):
+        """Reflexive transitive closure of edges as one bitset per class."""
+        closure = [1 << i for i in range(len(self.classes))]
+        # Propagate until nothing changes. It also settles cycles,
+        # e.g., classes declared as subclasses of each other.
+        changed = True
+        while changed:
+            changed = False
+            for i, nexts in enumerate(edges):
+                bits = closure[i]
+                for j in nexts:
+                    bits |= closure[j]
+                if bits != closure[i]:
+                    closure[i] = bits
+                    changed = True
+        return closure
+
+    def _find_namespace(self, suffix, default):
+        for cls in self.classes:
+            ns = cls.split('#')[0] + '#'
+            if ns.endswith(suffix):
+                return Namespace(ns)
+        return default
+
+    def _bits_to_classes(self, bits):
+        classes = []
+        i = 0
+        while bits:
+            if bits & 1:
+                classes.append(self.classes[i])
+            bits >>= 1
+            i += 1
+        return classes
+
+    def to_uri(self, cls):
+        if isinstance(cls, URIRef):
+            return cls
+        return self.BRICK[cls]
+
+    def is_subclass(self, child, parent):
+        """True if child rdfs:subClassOf* parent."""
+        child = self.to_uri(child)
+        parent = self.to_uri(parent)
+        if child == parent:
+            return True
+        child_id = self.class_ids.get(child)
+        parent_id = self.class_ids.get(parent)
+        if child_id is None or parent_id is None:
+            return False
+        return bool((self.ancestors[child_id] >> parent_id) & 1)
+
+    def get_ancestors(self, cls, include_self=True):
+        cls = self.to_uri(cls)
+        if cls not in self.class_ids:
+            return [cls] if include_self else []
+        cls_id = self.class_ids[cls]
+        bits = self.ancestors[cls_id]
+        if not include_self:
+            bits &= ~(1 << cls_id)
+        return self._bits_to_classes(bits)
+
+    def get_descendants(self, cls, include_self=True):
+        cls = self.to_uri(cls)
+        if cls not in self.class_ids:
+            return [cls] if include_self else []
+        cls_id = self.class_ids[cls]
+        bits = self.descendants[cls_id]
+        if not include_self:
+            bits &= ~(1 << cls_id)
+        return self._bits_to_classes(bits)
+
+    def get_all_tagsets(self):
+        """Classes under bf:TagSet, same as `?tagset rdfs:subClassOf+ bf:TagSet`."""
+        return self.get_descendants(self.BF['TagSet'], include_self=False)
+
+    def get_top_class(self, point_tagset):
+        """Map a point TagSet to its base class, e.g., sensor -> temperature_sensor.
+
+        For sensors and meters, the base class is the child of brick:sensor
+        (or brick:meter) that point_tagset belongs to.
+        """
+        if point_tagset in self._top_classes:
+            return self._top_classes[point_tagset]
+        if isinstance(point_tagset, URIRef):
+            base_class = point_tagset.split('#')[-1].split('_')[-1]
+        elif isinstance(point_tagset, str):
+            base_class = point_tagset.split('_')[-1]
+        else:
+            raise Exception('Behavior not defined for {0}'.format(point_tagset))
+        top_class = base_class
+        if base_class in ['sensor', 'meter']:
+            point_id = self.class_ids.get(self.to_uri(point_tagset))
+            base_id = self.class_ids.get(self.BRICK[base_class])
+            superclasses = [] if point_id is None or base_id is None else \
+                [self.classes[i] for i in self.children[base_id]
+                 if (self.ancestors[point_id] >> i) & 1]
+            assert superclasses, 'No super class found for {0}'\
+                .format(point_tagset)
+            top_class = superclasses[0].split('#')[-1]
+        self._top_classes[point_tagset] = top_class
+        return top_class
+
+
+def get_brick_hierarchy(schema_g):
+    """Return the hierarchy index of schema_g, building it at first use."""
+    key = id(schema_g)
+    if key not in hierarchies:
+        hierarchies[key] = (schema_g, BrickHierarchy(schema_g))
+    return hierarchies[key][1]
@@ -1,5 +1,12 @@
 from rdflib import RDF, RDFS, OWL, URIRef, Namespace
 
+BRICK_VERSION = '1.0.2'
+BRICK = Namespace('https://brickschema.org/schema/{0}/Brick#'
+                  .format(BRICK_VERSION))
+BF = Namespace('https://brickschema.org/schema/{0}/BrickFrame#'
+               .format(BRICK_VERSION))
+BASE = Namespace('http://example.com#')
+
 def parse_srcid(point):
     return point.split('#')[-1]
 
@@ -1,36 +1,161 @@
 import pdb
+import functools
 
 import rdflib
 from rdflib import Graph, RDF, RDFS, OWL, URIRef, Namespace
-from copy import deepcopy
+from rdflib.graph import ReadOnlyGraphAggregate
+from rdflib.paths import Path
+from rdflib.plugins.sparql import prepareQuery
 
 from .common import *
+from ..tracer import tracer, SPARQL_QUERIES
 
 
-preloaded_g = None
 schema_g = None
-empty_g = Graph()
+schema_graphs = {} # (brick_file, brickframe_file): parsed schema graph
+# Number of prepared queries kept. Pass changing terms as init_bindings
+# of query_sparql instead of formatting them into the query text.
+PREPARED_QUERY_CACHE_SIZE = 256
 
 def adder(x, y):
     return x + y
 
+
+class OverlayGraph(ReadOnlyGraphAggregate):
+    """Union view of a private instance graph over a shared schema graph.
+
+    Reads (triples, SPARQL queries, len, iteration) see both graphs while
+    every modification goes to the instance graph, so the schema is
+    parsed once and shared by all the graphs instead of being copied.
+    Triples of the schema are not added to the instance graph, so the
+    union has no duplicates. A graph of the caller passed as overlay with
+    owns_overlay=False may hold schema triples, which are then skipped
+    when reading.
+    """
+    def __init__(self, schema, overlay=None, owns_overlay=True):
+        if overlay is None:
+            overlay = Graph()
+        self.overlay = overlay
+        self.schema = schema
+        self.owns_overlay = owns_overlay
+        self._init_ns = None
+        super(OverlayGraph, self).__init__([self.overlay, self.schema])
+
+    def get_init_ns(self):
+        """Prefixes Graph.query would bind by default.
+
+        They are built once and rebuilt after bind or parse.
+        """
+        if self._init_ns is None:
+            init_ns = dict(self.schema.namespaces())
+            init_ns.update(self.overlay.namespaces())
+            self._init_ns = (init_ns, frozenset(init_ns.items()))
+        return self._init_ns
+
+    def _overlay_triples(self, triple):
+        if self.owns_overlay:
+            return self.overlay.triples(triple)
+        return (t for t in self.overlay.triples(triple)
+                if t not in self.schema)
+
+    def triples(self, triple):
+        # Same set semantics as a graph holding both. The aggregate would
+        # evaluate a property path once per member graph and yield
+        # duplicates.
+        s, p, o = triple
+        if isinstance(p, Path):
+            for s, o in p.eval(self, s, o):
+                yield s, p, o
+            return
+        for t in self._overlay_triples(triple):
+            yield t
+        for t in self.schema.triples(triple):
+            yield t
+
+    def __len__(self):
+        return sum(1 for _ in self._overlay_triples((None, None, None))) \
+            + len(self.schema)
+
+    def add(self, triple):
+        if triple not in self.schema:
+            self.overlay.add(triple)
+        return self
+
+    def addN(self, quads):
+        self.overlay.addN((s, p, o, self.overlay) for s, p, o, _ in quads
+                          if (s, p, o) not in self.schema)
+        return self
+
+    def remove(self, triple):
+        self.overlay.remove(triple)
+        return self
+
+    def bind(self, prefix, namespace, override=True):
+        self.overlay.bind(prefix, namespace, override=override)
+        self._init_ns = None
+
+    def parse(self, *args, **kwargs):
+        g = Graph()
+        g.parse(*args, **kwargs)
+        for prefix, namespace in g.namespaces():
+            self.overlay.bind(prefix, namespace)
+        self.addN((s, p, o, g) for s, p, o in g)
+        self._init_ns = None
+        return self
+
+    def serialize(self, *args, include_schema=True, **kwargs):
+        """Serialize the union like a graph holding both.
+
+        With include_schema=False, only the instance triples are written.
+        """
+        if not include_schema:
+            return self.overlay.serialize(*args, **kwargs)
+        g = Graph()
+        for prefix, namespace in self.get_init_ns()[0].items():
+            g.bind(prefix, namespace)
+        for triple in self.schema:
+            g.add(triple)
+        for triple in self._overlay_triples((None, None, None)):
+            g.add(triple)
+        return g.serialize(*args, **kwargs)
+
+    def __add__(self, other):
+        g = Graph()
+        if isinstance(other, OverlayGraph):
+            other = other.overlay
+        for triple in self._overlay_triples((None, None, None)):
+            g.add(triple)
+        for triple in other:
+            if triple not in self.schema:
+                g.add(triple)
+        return OverlayGraph(self.schema, g)
+
+    def __deepcopy__(self, memo):
+        overlay = Graph()
+        for triple in self._overlay_triples((None, None, None)):
+            overlay.add(triple)
+        return OverlayGraph(self.schema, overlay)
+
+
+def load_schema(brick_file, brickframe_file):
+    key = (brick_file, brickframe_file)
+    if key not in schema_graphs:
+        g = Graph()
+        g.parse(brick_file, format='turtle')
+        g.parse(brickframe_file, format='turtle')
+        schema_graphs[key] = g
+    return schema_graphs[key]
+
 def init_graph(empty=False, brick_file=None, brickframe_file=None):
     global schema_g
-    global preloaded_g
+    schema = load_schema(brick_file, brickframe_file)
     if schema_g == None:
-        schema_g = Graph()
-        schema_g.parse(brick_file, format='turtle')
-        schema_g.parse(brickframe_file, format='turtle')
+        schema_g = schema
 
     if empty:
-        return deepcopy(empty_g)
+        return Graph()
     else:
-        if preloaded_g == None:
-            preloaded_g = Graph()
-            preloaded_g.parse(brick_file, format='turtle')
-            preloaded_g.parse(brickframe_file, format='turtle')
-        return deepcopy(preloaded_g)
-    return g
+        return OverlayGraph(schema)
 
 def insert_point(g, name, tagset):
     triple = (URIRef(name), RDF.type, BRICK[tasget])
@@ -39,7 +164,39 @@ def insert_point(g, name, tagset):
 def insert_triple(g, triple):
     g.add(triple)
 
-def query_sparql(g, qstr):
-    res = (g + schema_g).query(qstr).bindings
-    return res
+def insert_triples(g, triples):
+    g.addN((s, p, o, g) for s, p, o in triples)
 
+@functools.lru_cache(maxsize=PREPARED_QUERY_CACHE_SIZE)
+def _prepare_query(qstr, init_ns_key):
+    return prepareQuery(qstr, initNs=dict(init_ns_key))
+
+def get_prepared_query(qstr, init_ns, init_ns_key=None):
+    """Parse and translate a query once per query text and namespaces."""
+    if init_ns_key is None:
+        init_ns_key = frozenset(init_ns.items())
+    return _prepare_query(qstr, init_ns_key)
+
+def get_query_graph(g):
+    """Return the union view of g and the current schema.
+
+    Views of plain graphs are cheap to build, so they are made per query
+    and always see the current schema and prefixes of g.
+    """
+    if isinstance(g, OverlayGraph):
+        return g
+    return OverlayGraph(schema_g, g, owns_overlay=False)
+
+def query_sparql(g, qstr, init_bindings=None):
+    """Run qstr over the union of g and the schema.
+
+    init_bindings ({variable name: term}) binds variables of the query,
+    so one prepared query serves every value.
+    """
+    tracer.count(SPARQL_QUERIES)
+    # Query the union of g and the schema without materializing it.
+    g = get_query_graph(g)
+    init_ns, init_ns_key = g.get_init_ns()
+    res = g.query(get_prepared_query(qstr, init_ns, init_ns_key),
+                  initBindings=init_bindings).bindings
+    return res
@@ -1,48 +1,99 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
-import pdb
+import os
+import threading
 from uuid import uuid4 as gen_uuid
 
 import rdflib
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPDigestAuth
 from rdflib import RDFS, RDF, OWL, Namespace
 from rdflib.namespace import FOAF
-from SPARQLWrapper import SPARQLWrapper
-from SPARQLWrapper import JSON, SELECT, INSERT, DIGEST, GET, POST
 from rdflib import URIRef, Literal
 
 from .common import *
+from ..tracer import tracer, SPARQL_QUERIES
 from jasonhelper import chunks
 
 
-def init_graph(empty=False):
+SPARQL_JSON = 'application/sparql-results+json'
+
+
+def init_graph(empty=False, brick_file=None, brickframe_file=None):
     be = BrickEndpoint('http://localhost:8890/sparql',
                        BRICK_VERSION,
                        #load_schema=True #TODO: temporarily force to enable
                        load_schema=empty,
+                       brick_file=brick_file,
+                       brickframe_file=brickframe_file,
                        )
 
     return be
 
 
 
-def query_sparql(g, qstr):
+def insert_triples(g, triples):
+    # The endpoint splits them into INSERT DATA queries of bounded size.
+    g._add_triples(triples)
+
+def query_sparql(g, qstr, init_bindings=None):
+    if init_bindings:
+        # Same as the init_bindings of rdflib, as a trailing VALUES block.
+        names = list(init_bindings.keys())
+        qstr += '\nVALUES ({0}) {{ ({1}) }}'.format(
+            ' '.join('?' + name for name in names),
+            ' '.join(init_bindings[name].n3() for name in names))
     res = g.raw_query(qstr)
     return res
 
 
 class BrickEndpoint(object):
-
-    def __init__(self, sparql_url, brick_version, base_ns='', load_schema=True):
+    """Client of a Virtuoso SPARQL endpoint.
+
+    HTTP connections are pooled and kept alive in a requests session per
+    thread (Session is not thread-safe), so queries do not pay connection
+    setup and digest authentication every time. At most max_concurrency read queries run at the same time
+    (query_many and the async variants run them in a thread pool), and
+    inserts are split into INSERT DATA queries of insert_chunk_size triples.
+    """
+
+    def __init__(self,
+                 sparql_url,
+                 brick_version,
+                 base_ns='',
+                 load_schema=True,
+                 username='dba',
+                 password='dba',
+                 pool_size=10,
+                 max_concurrency=4,
+                 insert_chunk_size=300,
+                 timeout=60,
+                 brick_file=None,
+                 brickframe_file=None,
+                 ):
         BRICK_VERSION = brick_version
         self.sparql_url = sparql_url
-        self.sparql = SPARQLWrapper(endpoint=self.sparql_url,
-                                    updateEndpoint=self.sparql_url + '-auth')
-        self.sparql.queryType= SELECT
-        self.sparql.setCredentials('dba', 'dba')
-        self.sparql.setHTTPAuth(DIGEST)
+        self.update_url = self.sparql_url + '-auth'
+        self.timeout = timeout
+        self.insert_chunk_size = insert_chunk_size
+        self.max_concurrency = max_concurrency
+        # Same schema files as the rdflib graphs unless given.
+        from . import DEFAULT_BRICK_FILE, DEFAULT_BRICKFRAME_FILE
+        self.brick_file = brick_file or DEFAULT_BRICK_FILE
+        self.brickframe_file = brickframe_file or DEFAULT_BRICKFRAME_FILE
+        self.pool_size = pool_size
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+        # Digest challenges are answered once and reused afterwards.
+        self.auth = HTTPDigestAuth(username, password)
+        self._read_slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = None
         if not base_ns:
             base_ns = 'http://example.com/'
         self.base_graph = 'urn:' + str(gen_uuid())
-        self.sparql.addDefaultGraph(self.base_graph)
         self.namespaces = {
             '': BASE,
             'brick':BRICK,
@@ -52,7 +103,7 @@ class BrickEndpoint(object):
             'owl': OWL,
             'foaf': FOAF
         }
-        sparql_prefix = ''
+        self.sparql_prefix = ''
         #for prefix, ns in self.namespaces.items():
         #    ns_n3 = ns.uri.n3()
         #    sparql_prefix += 'prefix {0}: {1}\n'.format(prefix, ns_n3)
@@ -65,9 +116,35 @@ class BrickEndpoint(object):
     def _init_brick_constants(self):
         self.HAS_LOC = URIRef(BF + 'hasLocation')
 
-    def _get_sparql(self):
-        # If need to optimize accessing sparql object.
-        return self.sparql
+    def _get_executor(self):
+        if not self._executor:
+            self._executor = ThreadPoolExecutor(self.max_concurrency)
+        return self._executor
+
+    @property
+    def session(self):
+        """requests session of the calling thread."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2,
+                                  pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+        with self._sessions_lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+        self._local = threading.local()
 
     def update(self, qstr):
         return self.query(qstr, is_update=True)
@@ -90,26 +167,54 @@ class BrickEndpoint(object):
     def raw_query(self, qstr):
         return self.query(qstr)
 
+    def _parse_response(self, resp):
+        resp.raise_for_status()
+        if 'json' not in resp.headers.get('Content-Type', ''):
+            return resp.text # TODO: Error handling here
+        raw_res = resp.json()
+        if 'results' in raw_res:
+            return self._format_select_res(raw_res)
+        else:
+            return raw_res
+
     def query(self, qstr, is_update=False):
-        sparql = self._get_sparql()
+        tracer.count(SPARQL_QUERIES)
+        qstr = self.sparql_prefix + qstr
+        headers = {'Accept': SPARQL_JSON}
         if is_update:
-            sparql.setMethod(POST)
+            resp = self.session.post(self.update_url,
+                                     data={'update': qstr},
+                                     headers=headers,
+                                     auth=self.auth,
+                                     timeout=self.timeout)
         else:
-            sparql.setMethod(GET)
-        sparql.setReturnFormat(JSON)
-        qstr = sparql_prefix + qstr
-        sparql.setHTTPAuth
-        sparql.setQuery(qstr)
-        raw_res = sparql.query().convert()
-        if sparql.queryType == SELECT:
-            res = self._format_select_res(raw_res)
-        elif sparql.queryType == INSERT:
-            res = raw_res # TODO: Error handling here
-        elif sparql.queryType == 'LOAD':
-            res = raw_res # TODO: Error handling here
-        else:
-            res = raw_res
-        return res
+            with self._read_slots:
+                resp = self.session.get(self.sparql_url,
+                                        params={
+                                            'query': qstr,
+                                            'default-graph-uri': self.base_graph,
+                                        },
+                                        headers=headers,
+                                        timeout=self.timeout)
+        return self._parse_response(resp)
+
+    def query_many(self, qstrs):
+        """Run read queries concurrently and return results in order."""
+        return list(self._get_executor().map(self.query, qstrs))
+
+    async def aquery(self, qstr, is_update=False):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(),
+                                          self.query, qstr, is_update)
+
+    async def aupdate(self, qstr):
+        return await self.aquery(qstr, is_update=True)
+
+    async def aadd_triples(self, pseudo_triples):
+        triples = [self.make_triple(*pseudo_triple)
+                   for pseudo_triple in pseudo_triples]
+        for chunk in chunks(triples, self.insert_chunk_size):
+            await self.aupdate(self._create_insert_query(chunk))
 
     def _create_insert_query(self, triples):
         q = """
@@ -189,8 +294,9 @@ class BrickEndpoint(object):
         self._add_triples(triples)
 
     def _add_triples(self, triples):
-        q = self._create_insert_query(triples)
-        res = self.update(q)
+        for chunk in chunks(triples, self.insert_chunk_size):
+            q = self._create_insert_query(chunk)
+            res = self.update(q)
 
     def add_brick_instance(self, entity_name, tagset):
         entity = URIRef(BASE + entity_name)
@@ -200,14 +306,17 @@ class BrickEndpoint(object):
         return str(entity)
 
     def load_ttlfile(self, filepath):
+        if not filepath or not os.path.isfile(filepath):
+            raise Exception('TTL file to load not found: {0}'.format(filepath))
+        # Virtuoso resolves the path itself, so it has to be absolute.
         q = """
         load <file://{0}> into <{1}>
-        """.format(filepath, self.base_graph)
+        """.format(os.path.abspath(filepath), self.base_graph)
         res = self.update(q)
 
     def load_schema(self):
-        self.load_ttlfile(BRICK_FILE)
-        self.load_ttlfile(BF_FILE)
+        self.load_ttlfile(self.brick_file)
+        self.load_ttlfile(self.brickframe_file)
 
     def parse(self, filepath, format=None):
         self.load_ttlfile(filepath)
@@ -232,9 +341,7 @@ class BrickEndpoint(object):
         """ % (BASE)
         res = other.raw_query(qstr)
         triples = [(URIRef(row['s']), URIRef(row['p']), URIRef(row['o'])) for row in res]
-        triple_chunks = chunks(triples, 300)
-        for chunk in triple_chunks:
-            self._add_triples(chunk)
+        self._add_triples(triples)
         return self
 
 
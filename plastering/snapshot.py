@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+import pickle
+import shutil
+
+import arrow
+import numpy as np
+import scipy.sparse as sp
+
+from .error import SnapshotVersionError
+
+# Increase whenever the layout below changes.
+# state_dir/
+#   state.json: format version, framework info and array specs.
+#   arrays/<name>.npy: dense arrays, memory-mapped when loaded.
+#   arrays/<name>.{data,indices,indptr}.npy: CSR matrices.
+#   objects.pkl: everything else (models, srcid lists, clusters, ...)
+STATE_FORMAT_VERSION = 1
+STATE_FILE = 'state.json'
+ARRAY_DIR = 'arrays'
+OBJECT_FILE = 'objects.pkl'
+
+
+def get_fingerprint(obj):
+    """Return a digest of a JSON-like object such as a config."""
+    dumped = json.dumps(obj, sort_keys=True, default=str)
+    return hashlib.sha1(dumped.encode('utf-8')).hexdigest()
+
+def has_state(state_dir):
+    return bool(state_dir) and \
+        os.path.isfile(os.path.join(state_dir, STATE_FILE))
+
+def _array_path(state_dir, name, part=None):
+    filename = name + ('.' + part if part else '') + '.npy'
+    return os.path.join(state_dir, ARRAY_DIR, filename)
+
+def save_arrays(state_dir, arrays):
+    specs = {}
+    for name, arr in arrays.items():
+        if sp.issparse(arr):
+            arr = sp.csr_matrix(arr)
+            for part in ['data', 'indices', 'indptr']:
+                np.save(_array_path(state_dir, name, part), getattr(arr, part))
+            specs[name] = {'type': 'csr', 'shape': list(arr.shape)}
+        else:
+            np.save(_array_path(state_dir, name), np.asarray(arr))
+            specs[name] = {'type': 'dense'}
+    return specs
+
+def load_arrays(state_dir, specs, mmap_mode='r'):
+    arrays = {}
+    for name, spec in specs.items():
+        if spec['type'] == 'csr':
+            parts = [np.load(_array_path(state_dir, name, part),
+                             mmap_mode=mmap_mode)
+                     for part in ['data', 'indices', 'indptr']]
+            arrays[name] = sp.csr_matrix(tuple(parts),
+                                         shape=tuple(spec['shape']),
+                                         copy=False)
+        elif spec['type'] == 'dense':
+            arrays[name] = np.load(_array_path(state_dir, name),
+                                   mmap_mode=mmap_mode)
+        else:
+            raise Exception('Unknown array type {0} for {1}'
+                            .format(spec['type'], name))
+    return arrays
+
+def save_snapshot(state_dir, arrays, objects, info={}):
+    """Write arrays and objects into state_dir, replacing an old snapshot.
+
+    The snapshot is written next to state_dir first and moved into place
+    at the end, so an interrupted save does not corrupt the previous one.
+    """
+    tmp_dir = state_dir.rstrip('/') + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(os.path.join(tmp_dir, ARRAY_DIR))
+    array_specs = save_arrays(tmp_dir, arrays)
+    with open(os.path.join(tmp_dir, OBJECT_FILE), 'wb') as fp:
+        pickle.dump(objects, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    state = {
+        'format_version': STATE_FORMAT_VERSION,
+        'created': str(arrow.get()),
+        'arrays': array_specs,
+    }
+    state.update(info)
+    with open(os.path.join(tmp_dir, STATE_FILE), 'w') as fp:
+        json.dump(state, fp, indent=2)
+    if os.path.exists(state_dir):
+        shutil.rmtree(state_dir)
+    os.rename(tmp_dir, state_dir)
+
+def load_snapshot(state_dir, mmap_mode='r'):
+    """Return (state info, arrays, objects) saved by save_snapshot."""
+    with open(os.path.join(state_dir, STATE_FILE), 'r') as fp:
+        state = json.load(fp)
+    if state.get('format_version') != STATE_FORMAT_VERSION:
+        raise SnapshotVersionError(
+            'Snapshot format {0} at {1} is not supported (expected {2})'
+            .format(state.get('format_version'), state_dir,
+                    STATE_FORMAT_VERSION))
+    arrays = load_arrays(state_dir, state['arrays'], mmap_mode)
+    with open(os.path.join(state_dir, OBJECT_FILE), 'rb') as fp:
+        objects = pickle.load(fp)
+    return state, arrays, objects
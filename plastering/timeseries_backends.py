@@ -0,0 +1,279 @@
+import os
+import json
+import threading
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+
+ARCTIC = 'arctic'
+LOCAL = 'local'
+TIMESERIES_BACKEND = os.environ.get('TIMESERIES_BACKEND', ARCTIC)
+TIMESERIES_DIR = os.environ.get('TIMESERIES_DIR', 'timeseries')
+
+_stores = {}
+
+
+def to_frame(dates, values):
+    df = pd.DataFrame({'data': values},
+                      index=pd.DatetimeIndex(dates, name='date'))
+    return df
+
+
+class ArcticLibrary(object):
+    """Timeseries of a building in an Arctic CHUNK_STORE library."""
+
+    def __init__(self, lib):
+        self.lib = lib
+
+    def list_symbols(self):
+        return self.lib.list_symbols()
+
+    def write(self, symbol, df):
+        self.lib.write(symbol, df)
+
+    def append(self, symbol, df):
+        self.lib.append(symbol, df)
+
+    def read(self, symbol, start_time=None, end_time=None, max_samples=None):
+        from arctic.date import DateRange
+        if start_time or end_time:
+            date_range = DateRange(start=start_time, end=end_time)
+        else:
+            date_range = None
+        if not max_samples:
+            return self.lib.read(symbol, chunk_range=date_range)
+        # Stop reading chunks once max_samples rows are loaded.
+        dfs = []
+        sample_num = 0
+        for df in self.lib.iterator(symbol, chunk_range=date_range):
+            dfs.append(df)
+            sample_num += len(df)
+            if sample_num >= max_samples:
+                break
+        if not dfs:
+            return to_frame([], [])
+        return pd.concat(dfs)[:max_samples]
+
+    def read_range(self, symbol, start_time=None, end_time=None,
+                   max_samples=None):
+        df = self.read(symbol, start_time, end_time, max_samples)
+        return df.index.values, df['data'].values
+
+
+class ArcticStore(object):
+
+    def __init__(self, host='localhost'):
+        from arctic import Arctic
+        self.conn = Arctic(host)
+
+    def list_libraries(self):
+        return self.conn.list_libraries()
+
+    def get_library(self, target_building, create=False):
+        from arctic import CHUNK_STORE
+        if target_building not in self.conn.list_libraries():
+            if not create:
+                raise ValueError('%s not found in the DB!'%target_building)
+            #create a lib for the tgt_bldg, a lib is akin to a collection
+            self.conn.initialize_library(target_building,
+                                         lib_type=CHUNK_STORE)
+            print ('library for %s created'%target_building)
+        return ArcticLibrary(self.conn[target_building])
+
+
+class LocalLibrary(object):
+    """Timeseries of a building as columnar files, a directory per point.
+
+    <root>/<building>/<point>/date.<gen>.bin: int64 timestamps (ns), sorted.
+    <root>/<building>/<point>/data.<gen>.bin: float64 readings.
+    <root>/<building>/<point>/meta.json: {'gen': gen, 'rows': # of rows}.
+    Appends write at the end of the files and reads memory-map them, so
+    a time range is located by binary search and returned without copies.
+    Only the rows committed in meta.json, which is replaced atomically
+    after the columns are written, are read. An interrupted append is
+    dropped, and a rewrite goes into files of the next generation, so the
+    two columns stay in sync.
+    """
+    DATE_DTYPE = np.dtype('int64')
+    DATA_DTYPE = np.dtype('float64')
+    META_FILE = 'meta.json'
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._symbol_locks = {}
+
+    def _get_lock(self, symbol):
+        with self._lock:
+            if symbol not in self._symbol_locks:
+                self._symbol_locks[symbol] = threading.Lock()
+            return self._symbol_locks[symbol]
+
+    def _symbol_dir(self, symbol):
+        return os.path.join(self.path, quote(symbol, safe=''))
+
+    def _column_path(self, symbol_dir, name, gen):
+        return os.path.join(symbol_dir, '{0}.{1}.bin'.format(name, gen))
+
+    def _read_meta(self, symbol_dir):
+        path = os.path.join(symbol_dir, self.META_FILE)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'r') as fp:
+            return json.load(fp)
+
+    def _commit_meta(self, symbol_dir, meta):
+        path = os.path.join(symbol_dir, self.META_FILE)
+        with open(path + '.tmp', 'w') as fp:
+            json.dump(meta, fp)
+        os.replace(path + '.tmp', path)
+
+    def list_symbols(self):
+        return [unquote(name) for name in sorted(os.listdir(self.path))
+                if os.path.isfile(os.path.join(self.path, name,
+                                               self.META_FILE))]
+
+    def _to_columns(self, df):
+        dates = pd.DatetimeIndex(df.index).values.astype('datetime64[ns]')
+        dates = dates.astype(self.DATE_DTYPE)
+        values = np.asarray(df['data'].values, dtype=self.DATA_DTYPE)
+        order = np.argsort(dates, kind='stable')
+        return dates[order], values[order]
+
+    def _write_columns(self, symbol, dates, values, append=False):
+        symbol_dir = self._symbol_dir(symbol)
+        os.makedirs(symbol_dir, exist_ok=True)
+        meta = self._read_meta(symbol_dir)
+        columns = [('date', dates), ('data', values)]
+        if append and meta:
+            gen = meta['gen']
+            for name, column in columns:
+                path = self._column_path(symbol_dir, name, gen)
+                with open(path, 'r+b' if os.path.isfile(path) else 'wb') \
+                        as fp:
+                    # Drop the rest of an interrupted append.
+                    fp.truncate(meta['rows'] * column.itemsize)
+                    fp.seek(0, os.SEEK_END)
+                    fp.write(column.tobytes())
+            self._commit_meta(symbol_dir, {'gen': gen,
+                                           'rows': meta['rows'] + len(dates)})
+        else:
+            gen = meta['gen'] + 1 if meta else 0
+            for name, column in columns:
+                with open(self._column_path(symbol_dir, name, gen), 'wb') \
+                        as fp:
+                    fp.write(column.tobytes())
+            self._commit_meta(symbol_dir, {'gen': gen, 'rows': len(dates)})
+            if meta:
+                # Readers may still map them, which is fine on POSIX.
+                for name, _ in columns:
+                    path = self._column_path(symbol_dir, name, meta['gen'])
+                    if os.path.isfile(path):
+                        os.remove(path)
+
+    def write(self, symbol, df):
+        dates, values = self._to_columns(df)
+        with self._get_lock(symbol):
+            self._write_columns(symbol, dates, values)
+
+    def append(self, symbol, df):
+        dates, values = self._to_columns(df)
+        with self._get_lock(symbol):
+            old_dates, old_values = self._load_columns(symbol)
+            if len(old_dates) and len(dates) and dates[0] < old_dates[-1]:
+                # Out of order, so merge and rewrite the point.
+                dates = np.concatenate([old_dates, dates])
+                values = np.concatenate([old_values, values])
+                order = np.argsort(dates, kind='stable')
+                dates, values = dates[order], values[order]
+                self._write_columns(symbol, dates, values)
+            else:
+                self._write_columns(symbol, dates, values, append=True)
+
+    def _load_columns(self, symbol):
+        symbol_dir = self._symbol_dir(symbol)
+        meta = self._read_meta(symbol_dir)
+        columns = []
+        for name, dtype in [('date', self.DATE_DTYPE),
+                            ('data', self.DATA_DTYPE)]:
+            if not meta or not meta['rows']: # np.memmap fails on empty files.
+                columns.append(np.empty(0, dtype=dtype))
+            else:
+                columns.append(np.memmap(
+                    self._column_path(symbol_dir, name, meta['gen']),
+                    dtype=dtype, mode='r', shape=(meta['rows'],)))
+        return columns
+
+    def read_range(self, symbol, start_time=None, end_time=None,
+                   max_samples=None):
+        """Return memory-mapped (timestamps, readings) within the range."""
+        if not os.path.isdir(self._symbol_dir(symbol)):
+            raise KeyError('No data found for {0}'.format(symbol))
+        dates, values = self._load_columns(symbol)
+        begin = 0
+        end = len(dates)
+        if start_time:
+            begin = np.searchsorted(dates, self._to_ns(start_time), 'left')
+        if end_time:
+            end = np.searchsorted(dates, self._to_ns(end_time), 'right')
+        if max_samples:
+            end = min(end, begin + max_samples)
+        return dates[begin:end].view('datetime64[ns]'), values[begin:end]
+
+    def _to_ns(self, t):
+        t = pd.Timestamp(t)
+        if t.tzinfo:
+            t = t.tz_convert('UTC').tz_localize(None)
+        return t.value
+
+    def read(self, symbol, start_time=None, end_time=None, max_samples=None):
+        dates, values = self.read_range(symbol, start_time, end_time,
+                                        max_samples)
+        return to_frame(dates, values)
+
+
+class LocalStore(object):
+
+    def __init__(self, root=TIMESERIES_DIR):
+        self.root = root
+        self.libraries = {}
+
+    def list_libraries(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(os.listdir(self.root))
+
+    def get_library(self, target_building, create=False):
+        if target_building not in self.libraries:
+            path = os.path.join(self.root, target_building)
+            if not os.path.isdir(path):
+                if not create:
+                    raise ValueError('%s not found in the DB!'
+                                     %target_building)
+                os.makedirs(path)
+                print ('library for %s created'%target_building)
+            self.libraries[target_building] = LocalLibrary(path)
+        return self.libraries[target_building]
+
+
+STORE_CLASSES = {
+    ARCTIC: ArcticStore,
+    LOCAL: LocalStore,
+}
+
+def get_store(backend=None, **kwargs):
+    """Return the store shared by all the readers and writers of a backend.
+
+    The backend is TIMESERIES_BACKEND ('arctic' or 'local') by default.
+    Passing kwargs (e.g., root of the local store) replaces the store.
+    """
+    if not backend:
+        backend = TIMESERIES_BACKEND
+    if backend not in STORE_CLASSES:
+        raise Exception('Timeseries backend not defined for: {0}'
+                        .format(backend))
+    if kwargs or backend not in _stores:
+        _stores[backend] = STORE_CLASSES[backend](**kwargs)
+    return _stores[backend]
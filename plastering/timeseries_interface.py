@@ -1,93 +1,245 @@
+import numpy as np
 import pandas as pd
 import os
 import re
 import pdb
+import time
 
-from glob import glob
-from arctic import CHUNK_STORE, Arctic
-from arctic.date import DateRange
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from glob import glob, iglob
 from datetime import datetime as dt
 from datetime import date
 import arrow
 
+from .timeseries_backends import get_store
 
 DEFAULT_START_TIME = arrow.get(2017,1,20)
 DEFAULT_END_TIME = arrow.get(2017,2,6)
+DEFAULT_CHUNK_ROWS = 100000 # rows read from a csv file at a time
 
-def write_wrapper(target_building, path_to_directory, schema=1):
+
+def get_point_name(target_building, filename):
+    filename = os.path.basename(filename)
+    if target_building == 'sdh':
+        tmp = filename[:-4] #point name, special case for sdh
+        tmp = tmp.split('+')[-3:]
+        tmp = [re.sub('[^A-Z0-9]', '_', s) for s in tmp]
+        tmp = '_'.join(tmp)
+        #print (f, 'converted to', tmp)
+    elif target_building == 'uva_cse':
+        tmp = filename[:-4]
+        tmp = re.sub('[^a-zA-Z0-9]', '_', tmp)
+    else:
+        tmp = filename[:-4] #point name, should generalize
+    return tmp
+
+def iter_csv_files(path_to_directory):
+    return iglob(os.path.join(path_to_directory, '*.csv'))
+
+def iter_csv_chunks(filename, schema=1, chunk_rows=DEFAULT_CHUNK_ROWS,
+                    data_dtype=None):
+    '''
+    yield (timestamps, data) of every chunk_rows rows in a csv file.
+    Only the first (timestamp) and the last (data) columns are parsed.
+    Data values that are not numbers (e.g. status strings) are dropped
+    with a warning and empty ones become NaN. With data_dtype, the data
+    column is parsed strictly as that dtype instead.
+    '''
+    columns = pd.read_csv(filename, nrows=0).columns
+    ts_col = columns[0]
+    data_col = columns[-1]
+    dtype = {}
+    if data_dtype:
+        dtype[data_col] = data_dtype
+    if schema == 3:
+        usecols = [data_col]
+        start = dt.now()
+    elif schema == 2:
+        usecols = [ts_col, data_col]
+        dtype[ts_col] = 'float64'
+    else:
+        usecols = [ts_col, data_col]
+        dtype[ts_col] = 'str'
+    row_num = 0
+    for df in pd.read_csv(filename, usecols=usecols, dtype=dtype,
+                          chunksize=chunk_rows):
+        #generate dateindex from timestamp
+        if schema == 3:
+            ts = pd.date_range(start=start + pd.Timedelta(seconds=row_num),
+                               periods=len(df), freq=pd.Timedelta(seconds=1))
+        elif schema == 2:
+            ts = pd.to_datetime(df[ts_col].values, unit='s')
+        else:
+            ts = pd.to_datetime(df[ts_col].values)
+        row_num += len(df)
+        data = df[data_col].values
+        if not data_dtype:
+            data = pd.to_numeric(df[data_col], errors='coerce').values\
+                .astype(np.float64)
+            invalid = np.isnan(data) & df[data_col].notna().values
+            if invalid.any():
+                print('WARNING: {0} non-numeric values dropped from {1}'
+                      .format(invalid.sum(), filename))
+                ts = ts[~invalid]
+                data = data[~invalid]
+        yield ts, data
+
+def get_library(target_building, backend=None, create=True):
+    '''
+    the library of a building in the timeseries backend, which is
+    TIMESERIES_BACKEND ('arctic' or 'local') by default
+    '''
+    return get_store(backend).get_library(target_building, create)
+
+def write_chunks(lib, sensor, chunks):
+    '''write (timestamps, data) chunks of a sensor and return # of rows'''
+    row_num = 0
+    for timestamps, data in chunks:
+        df = pd.DataFrame({'date': timestamps, 'data': data})
+        df.set_index('date', inplace=True)
+        if row_num == 0:
+            lib.write(sensor, df)
+        else:
+            lib.append(sensor, df)
+        row_num += len(df)
+    return row_num
+
+def write_wrapper(target_building, path_to_directory, schema=1,
+                  chunk_rows=DEFAULT_CHUNK_ROWS, n_workers=4, backend=None):
     '''
     para:
     target_building: the building name and used as library name
     path_to_directory: the path to the directory containing data files
-i   schema: schema used in the csv file
+    schema: schema used in the csv file
+    chunk_rows: # of rows read and written at a time
+    n_workers: # of files ingested concurrently
+    backend: timeseries backend, TIMESERIES_BACKEND by default
     ***only supports csv for now with three different schemas:
     1 - | timestamp(string) | data
     2 - | timestamp(epoch)  | data
     3 - | data column only  |
 
-    return a wrapped iterator for write_to_db
+    Files are streamed chunk by chunk, so at most n_workers * chunk_rows
+    rows are in memory regardless of the size of the building.
+
+    return the total number of rows written
     '''
+    lib = get_library(target_building, backend)
 
-    os.chdir(path_to_directory)
-    files = glob('*.csv')
-    points = []
-    timestamps = []
-    data = []
-    for f in files:
+    def ingest(f):
+        point = get_point_name(target_building, f)
         try:
-            df = pd.read_csv(f)
-        except pd.io.common.EmptyDataError:
+            return write_chunks(lib, point,
+                                iter_csv_chunks(f, schema, chunk_rows))
+        except pd.errors.EmptyDataError:
             print (f, " is empty and has been skipped.")
-            continue
+            return 0
 
-        if target_building == 'sdh':
-            tmp = f[:-4] #point name, special case for sdh
-            tmp = tmp.split('+')[-3:]
-            tmp = [re.sub('[^A-Z0-9]', '_', s) for s in tmp]
-            tmp = '_'.join(tmp)
-            #print (f, 'converted to', tmp)
-        elif target_building == 'uva_cse':
-            tmp = f[:-4]
-            tmp = re.sub('[^a-zA-Z0-9]', '_', tmp)
-        else:
-            tmp = f.split('/')[-1][:-4] #point name, should generalize
-        points.append(tmp)
+    t0 = time.time()
+    total_rows = 0
+    file_num = 0
+    with ThreadPoolExecutor(n_workers) as executor:
+        for row_num in executor.map(ingest, iter_csv_files(path_to_directory)):
+            total_rows += row_num
+            file_num += 1
+    elapsed = time.time() - t0
+    print ('%d rows from %d files written in %.1f s (%.0f rows/sec)'
+           %(total_rows, file_num, elapsed, total_rows / max(elapsed, 1e-9)))
+    return total_rows
 
-        #generate dateindex from timestamp
-        if schema == 3:
-            ts = pd.date_range(start=dt.now(), periods=len(df), freq='S')
-        elif schema == 2:
-            timestamps.append( pd.to_datetime(list(df.iloc[:, 0].astype(float)), unit='s') )
-        else:
-            timestamps.append( pd.to_datetime(list(df.iloc[:, 0])) )
 
-        #store data
-        data.append( df.iloc[:, -1] )
+def write_to_db(target_building, iterator, backend=None):
+    '''write the data from a building'''
 
-    write_to_db( target_building, zip(points, timestamps, data))
+    lib = get_library(target_building, backend)
 
+    for sensor, timestamps, data in iterator:
+        write_chunks(lib, sensor, [(timestamps, data)])
+        #print ('writing %s is done'%sensor)
 
-def write_to_db(target_building, iterator):
-    '''write the data from a building'''
 
-    conn = Arctic('localhost')
+def to_datetime(t):
+    if isinstance(t, arrow.Arrow):
+        return t.datetime
+    elif isinstance(t, (dt, date)):
+        return t
+    elif t == None:
+        return None
+    else:
+        raise ValueError('the type of time value is unknown: {0}'
+                         .format(type(t)))
 
-    #create a lib for the tgt_bldg, a lib is akin to a collection
-    if target_building not in conn.list_libraries():
-        conn.initialize_library(target_building, lib_type=CHUNK_STORE)
-        print ('library for %s created'%target_building)
+def _iter_reads(target_building, srcids, read, n_workers, backend):
+    lib = get_library(target_building, backend, create=False)
+    symbols = lib.list_symbols()
+    if srcids is None:
+        srcids = symbols
+    else:
+        symbols = set(symbols)
+        for srcid in srcids:
+            if srcid not in symbols:
+                print (srcid, 'not found and skipped.')
+        srcids = [srcid for srcid in srcids if srcid in symbols]
 
-    #connect to the lib for writing
-    lib = conn[target_building]
+    # Keep at most 2 * n_workers points read ahead of the consumer.
+    with ThreadPoolExecutor(n_workers) as executor:
+        futures = deque()
+        srcid_iter = iter(srcids)
+        for srcid in islice(srcid_iter, 2 * n_workers):
+            futures.append((srcid, executor.submit(read, lib, srcid)))
+        while futures:
+            srcid, future = futures.popleft()
+            for next_srcid in islice(srcid_iter, 1):
+                futures.append((next_srcid,
+                                executor.submit(read, lib, next_srcid)))
+            yield srcid, future.result()
 
-    for sensor, timestamps, data in iterator:
-        df = pd.DataFrame({'date': timestamps, 'data': data})
-        df.set_index('date', inplace=True)
-        lib.write(sensor, df)
-        #print ('writing %s is done'%sensor)
+def iter_from_db(target_building, srcids=None, start_time=None,
+                 end_time=None, max_samples=None, n_workers=8, backend=None):
+    '''
+    yield (point name, data) of the points in srcids (all the points by
+    default) in order. Points are read concurrently by n_workers threads
+    sharing a connection. Only the chunks within [start_time, end_time]
+    are read and at most max_samples rows are loaded per point.
+    data is in pandas.DataFrame format with two columns ['date', 'data']
+    '''
+    start_time = to_datetime(start_time)
+    end_time = to_datetime(end_time)
+
+    def read(lib, srcid):
+        return lib.read(srcid, start_time, end_time, max_samples)
 
+    for srcid, data in _iter_reads(target_building, srcids, read,
+                                   n_workers, backend):
+        if len(data) == 0:
+            print('WARNING: {0} has empty data.'.format(srcid))
+            continue
+        yield srcid, data
 
-def read_from_db(target_building, start_time=None, end_time=None):
+def iter_ranges_from_db(target_building, srcids=None, start_time=None,
+                        end_time=None, max_samples=None, n_workers=8,
+                        backend=None):
+    '''
+    same as iter_from_db but yield (point name, timestamps, readings) as
+    np.ndarrays. They are memory-mapped without copies in the local backend.
+    '''
+    start_time = to_datetime(start_time)
+    end_time = to_datetime(end_time)
+
+    def read(lib, srcid):
+        return lib.read_range(srcid, start_time, end_time, max_samples)
+
+    for srcid, (timestamps, values) in _iter_reads(target_building, srcids,
+                                                   read, n_workers, backend):
+        if len(values) == 0:
+            print('WARNING: {0} has empty data.'.format(srcid))
+            continue
+        yield srcid, timestamps, values
+
+def read_from_db(target_building, start_time=None, end_time=None,
+                 srcids=None, max_samples=None, n_workers=8, backend=None):
     '''
     load the data from for tgt_bldg
     return:
@@ -96,49 +248,39 @@ def read_from_db(target_building, start_time=None, end_time=None):
     }
     data is in pandas.DataFrame format with two columns ['date', 'data']
     '''
-    if isinstance(start_time, arrow.Arrow):
-        start_time = start_time.datetime
-    elif isinstance(start_time, (dt, date)):
-        pass
-    elif start_time == None:
-        pass
-    else:
-        raise ValueError('the type of time value is unknown: {0}'
-                         .format(type(start_time)))
-    if isinstance(end_time, arrow.Arrow):
-        end_time = end_time.datetime
-    elif isinstance(end_time, (dt, date)):
-        pass
-    elif end_time == None:
-        pass
-    else:
-        raise ValueError('the type of time value is unknown: {0}'
-                         .format(type(end_time)))
-    if start_time and end_time:
-        date_range = DateRange(start=start_time, end=end_time)
-    else:
-        date_range = None
-
     print ('loading timeseries data from db for %s...'%target_building)
+    res = dict(iter_from_db(target_building, srcids, start_time, end_time,
+                            max_samples, n_workers, backend))
+    print('correctly done')
+    return res
 
-    conn = Arctic('localhost')
-    if target_building not in conn.list_libraries():
-        raise ValueError('%s not found in the DB!'%target_building)
-    else:
-        lib = conn[target_building]
-        srcids = lib.list_symbols()
-        res = {}
-        for srcid in srcids:
-            data = lib.read(srcid, chunk_range=date_range)
-            if len(data) == 0:
-                print('WARNING: {0} has empty data.'.format(srcid))
-                #pdb.set_trace()
-                continue
-
-            res[srcid] = data
-        print('correctly done')
-
-        return res
+def read_matrix(target_building, srcids=None, start_time=None, end_time=None,
+                max_samples=None, min_samples=0, n_workers=8,
+                dtype=np.float64, backend=None):
+    '''
+    load the data of points as one matrix, a row per point.
+    Points with fewer than min_samples rows are skipped and the others are
+    truncated to the shortest one, so the readings are aligned by index.
+    return:
+    loaded point names, np.ndarray of (# of points, # of samples)
+    '''
+    loaded_srcids = []
+    rows = []
+    for srcid, _, values in iter_ranges_from_db(target_building, srcids,
+                                                start_time, end_time,
+                                                max_samples, n_workers,
+                                                backend):
+        if len(values) < min_samples: #discard short sequences
+            continue
+        loaded_srcids.append(srcid)
+        rows.append(values) # Copied into X only once below.
+    if not rows:
+        return loaded_srcids, np.empty((0, 0), dtype=dtype)
+    min_len = min([len(row) for row in rows])
+    X = np.empty((len(rows), min_len), dtype=dtype)
+    for i, row in enumerate(rows):
+        X[i] = row[:min_len]
+    return loaded_srcids, X
 
 
 if __name__ == "__main__":
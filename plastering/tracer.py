@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import functools
+import threading
+from collections import deque
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+from tabulate import tabulate
+
+
+# Counter names used across the package.
+DB_QUERIES = 'db_queries'
+SPARQL_QUERIES = 'sparql_queries'
+MODEL_FITS = 'model_fits'
+ROWS_PREDICTED = 'rows_predicted'
+PRED_TRIPLES = 'pred_triples'
+
+
+class Tracer(object):
+    """Timers and counters of the phases of Inferencers and Workflows.
+
+    span() times a phase and count() adds to a counter (DB queries, SPARQL
+    queries, model fits, ...). A count is added to the total and to every
+    span open in the counting thread, so each span reports what its phase
+    did. Phases in profile_phases also run under cProfile and tracemalloc,
+    and the reports are written into profile_dir. Both profilers are
+    process-wide, so profiled phases run one at a time: a thread entering
+    one waits until the profiled phase of another thread is done, and a
+    profiled phase nested in another one is covered by the outer profile.
+    """
+
+    def __init__(self, profile_dir='./result/profile', max_spans=100000):
+        self.lock = threading.Lock()
+        # Only the latest max_spans spans are kept. Counters are totals.
+        self.max_spans = max_spans
+        self.profile_lock = threading.Lock()
+        self.local = threading.local()
+        self.profile_phases = set()
+        self.profile_dir = profile_dir
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.spans = deque(maxlen=self.max_spans)
+            self.counters = {}
+            self.profile_num = 0
+            self.t0 = time.perf_counter()
+
+    def _get_stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        for span in self._get_stack():
+            span['counters'][name] = span['counters'].get(name, 0) + n
+
+    @contextmanager
+    def span(self, name, cat='phase', **args):
+        """Time the enclosed block as a phase.
+
+        The yielded dict gets 'dur' (seconds) when the block exits.
+        """
+        # Started first so that waiting for the profilers is not timed.
+        profile = self._start_profile() if name in self.profile_phases \
+            and not getattr(self.local, 'profiling', False) else None
+        span = {
+            'name': name,
+            'cat': cat,
+            'args': args,
+            'counters': {},
+            'tid': threading.get_ident(),
+            'start': time.perf_counter() - self.t0,
+        }
+        stack = self._get_stack()
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            span['dur'] = time.perf_counter() - self.t0 - span['start']
+            stack.pop()
+            if profile:
+                self._stop_profile(profile, span)
+            with self.lock:
+                self.spans.append(span)
+
+    def _start_profile(self):
+        self.profile_lock.acquire()
+        self.local.profiling = True
+        try:
+            started_tracemalloc = not tracemalloc.is_tracing()
+            if started_tracemalloc:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            profiler = cProfile.Profile()
+            profiler.enable()
+        except Exception:
+            self.local.profiling = False
+            self.profile_lock.release()
+            raise
+        return profiler, started_tracemalloc
+
+    def _stop_profile(self, profile, span):
+        profiler, started_tracemalloc = profile
+        try:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            span['args']['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            if started_tracemalloc:
+                tracemalloc.stop()
+        finally:
+            self.local.profiling = False
+            self.profile_lock.release()
+        with self.lock:
+            self.profile_num += 1
+            prefix = os.path.join(self.profile_dir, '{0}_{1}'
+                                  .format(span['name'], self.profile_num))
+        os.makedirs(self.profile_dir, exist_ok=True)
+        # Read with pstats or snakeviz.
+        profiler.dump_stats(prefix + '.prof')
+        span['args']['profile'] = prefix + '.prof'
+        with open(prefix + '_memory.txt', 'w') as fp:
+            for stat in snapshot.statistics('lineno')[:50]:
+                fp.write(str(stat) + '\n')
+        span['args']['memory_profile'] = prefix + '_memory.txt'
+
+    def get_trace(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'spans': sorted(self.spans, key=lambda span: span['start']),
+            }
+
+    def get_summary(self):
+        """Return {(cat, name): {num, total, mean, max, counters}}."""
+        summary = {}
+        for span in self.get_trace()['spans']:
+            key = (span['cat'], span['name'])
+            if key not in summary:
+                summary[key] = {'num': 0, 'total': 0, 'max': 0,
+                                'counters': {}}
+            row = summary[key]
+            row['num'] += 1
+            row['total'] += span['dur']
+            row['max'] = max(row['max'], span['dur'])
+            for name, n in span['counters'].items():
+                row['counters'][name] = row['counters'].get(name, 0) + n
+        for row in summary.values():
+            row['mean'] = row['total'] / row['num']
+        return summary
+
+    def print_summary(self):
+        summary = self.get_summary()
+        rows = [[cat, name, row['num'], row['total'], row['mean'], row['max'],
+                 ', '.join('{0}: {1}'.format(*item)
+                           for item in sorted(row['counters'].items()))]
+                for (cat, name), row in sorted(summary.items(),
+                                               key=lambda x: -x[1]['total'])]
+        print(tabulate(rows, headers=['cat', 'phase', 'num', 'total (s)',
+                                      'mean (s)', 'max (s)', 'counters'],
+                       floatfmt='.3f'))
+        print('counters: {0}'.format(self.get_trace()['counters']))
+
+    def to_chrome_trace(self):
+        """Return the trace in the Trace Event Format of chrome://tracing."""
+        pid = os.getpid()
+        events = []
+        for span in self.get_trace()['spans']:
+            args = dict(span['args'])
+            args.update(span['counters'])
+            events.append({
+                'name': span['name'],
+                'cat': span['cat'],
+                'ph': 'X',
+                'ts': span['start'] * 1e6,
+                'dur': span['dur'] * 1e6,
+                'pid': pid,
+                'tid': span['tid'],
+                'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, filename, output_format='json'):
+        """Write the trace as 'json' or 'chrome' (Trace Event Format)."""
+        if output_format == 'json':
+            trace = self.get_trace()
+        elif output_format == 'chrome':
+            trace = self.to_chrome_trace()
+        else:
+            raise Exception('Trace format not defined for: {0}'
+                            .format(output_format))
+        if os.path.dirname(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w') as fp:
+            json.dump(trace, fp, indent=2, default=str)
+
+
+tracer = Tracer()
+
+
+def traced(name=None, cat='inferencer'):
+    """Decorate an Inferencer method to run it in a span of its name."""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(self, *args, **kwargs):
+            with tracer.span(name or f.__name__, cat,
+                             framework=self.__name__):
+                return f(self, *args, **kwargs)
+        return wrapper
+    return decorator
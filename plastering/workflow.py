@@ -1,12 +1,17 @@
+import os
 import pdb
 import random
+import multiprocessing
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import arrow
+import numpy as np
 
 from .inferencers import *
 from .error import *
 from .evaluator import *
+from .tracer import tracer
 
 # Note:
 #   - f stands for framework.
@@ -44,6 +49,74 @@ class Node():
             for method_name in PUBLIC_METHODS:
                 assert method_name in attrs
 
+def _node_worker(f, conn, seed):
+    """Serve the method calls of a NodeProcess with its framework."""
+    # Frameworks and the libraries they use draw from the global
+    # generators, which are private to this process.
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    sent_preds = None
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        func_name, args, kwargs = msg
+        try:
+            res = ('ok', getattr(f, func_name)(*args, **kwargs))
+        except Exception as e:
+            res = ('error', e)
+        # Send the predictions back only when they changed.
+        preds = (id(f.pred_g), id(f.pred_confidences),
+                 len(f.pred_confidences))
+        if preds != sent_preds:
+            res += (f.pred_g, f.pred_confidences)
+            sent_preds = preds
+        conn.send(res)
+    conn.close()
+
+
+class NodeProcess(object):
+    """Framework of a node running in its own process.
+
+    The process is forked with the framework, which stays there; method
+    calls and their results go through a pipe. pred_g and
+    pred_confidences are mirrored here for the next nodes. Graphs are
+    sent as their instance triples only.
+    """
+
+    def __init__(self, f, seed):
+        self.__name__ = f.__name__
+        self.pred_g = f.pred_g
+        self.pred_confidences = f.pred_confidences
+        ctx = multiprocessing.get_context('fork')
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_node_worker,
+                                   args=(f, child_conn, seed),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def call(self, func_name, *args, **kwargs):
+        self.conn.send((func_name, args, kwargs))
+        res = self.conn.recv()
+        if len(res) > 2:
+            self.pred_g, self.pred_confidences = res[2:]
+        if res[0] == 'error':
+            raise res[1]
+        return res[1]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    def close(self):
+        if self.process.is_alive():
+            self.conn.send(None)
+            self.process.join()
+        self.conn.close()
+
+
 #class Workflow(object):
 class Workflow(Inferencer):
     """
@@ -77,7 +150,26 @@ class Workflow(Inferencer):
             self.debug = config['debug']
         else:
             self.debug = True
-        super(Workflow, self).__init__(target_building, target_srcids)
+        # Number of nodes run at the same time. Frameworks use n_jobs
+        # in their own configs for their models.
+        if 'max_concurrent_nodes' in config:
+            self.max_concurrent_nodes = config['max_concurrent_nodes']
+        else:
+            self.max_concurrent_nodes = 1
+        if self.max_concurrent_nodes <= 0:
+            self.max_concurrent_nodes = os.cpu_count()
+        # Concurrent nodes run in their own processes ('process') or in
+        # threads of this process ('thread'). Threads share the GIL and
+        # need frameworks with their own generator (rng).
+        if 'node_executor' in config:
+            self.node_executor = config['node_executor']
+        else:
+            self.node_executor = 'process'
+        if self.node_executor not in ['process', 'thread']:
+            raise Exception('Node executor not defined for: {0}'
+                            .format(self.node_executor))
+        super(Workflow, self).__init__(target_building, target_srcids,
+                                       config=config)
         self.target_srcids = target_srcids
         self.f_class_dict = f_class_dict
 
@@ -91,18 +183,63 @@ class Workflow(Inferencer):
         for f_name, f_graph_config in f_graph_configs.items():
             f_nexts.append(self.init_node(f_name, self.f_head, f_graph_config))
         self.f_head.nexts = f_nexts
+        if self.max_concurrent_nodes > 1:
+            for next_node in self.f_head.nexts:
+                self._seed_frameworks(next_node)
+
+    def _seed_frameworks(self, node):
+        """Give every framework its own random generator.
 
-    def init_node(self, f_name, prev, f_graph_configs):
+        Concurrent nodes would interleave their draws from the shared
+        generator in a different order every run. Seeds are drawn from
+        the random module in graph order, so runs stay reproducible with
+        random.seed(). With the process executor, each framework moves
+        into a process of its own, whose global generators are seeded.
+        In threads, only frameworks with an rng attribute can have one.
+        """
+        seed = random.getrandbits(64)
+        if self.node_executor == 'process':
+            node.f = NodeProcess(node.f, seed)
+        elif hasattr(node.f, 'rng'):
+            if node.f.rng is random:
+                node.f.rng = random.Random(seed)
+        else:
+            raise Exception('{0} draws from the shared random module and '
+                            'cannot run in threads. Use the process '
+                            'node_executor or max_concurrent_nodes=1'
+                            .format(node.f.__name__))
+        for next_node in node.nexts:
+            self._seed_frameworks(next_node)
+
+    def close(self):
+        """Stop the processes of the nodes, if any."""
+        stack = list(self.f_head.nexts)
+        while stack:
+            node = stack.pop()
+            if isinstance(node.f, NodeProcess):
+                node.f.close()
+            stack.extend(node.nexts)
+
+    def init_node(self, f_name, prev, f_graph_configs, path=None):
         """
         Instantiate node and its children in a recursive manner.
         """
-        f_config = f_graph_configs[0]
+        # Nodes of the same framework would share the default state_dir,
+        # so each node saves its snapshots under its path in the graph.
+        path = path + '-' + f_name if path else f_name
+        f_config = dict(f_graph_configs[0])
+        config = dict(f_config.get('config', {}))
+        if 'state_dir' not in config:
+            config['state_dir'] = './temp/workflow_{0}_{1}_state'\
+                .format(self.target_building, path)
+        f_config['config'] = config
         f = self.f_class_dict[f_name](**f_config)
         curr_node = Node(f, prev)
         next_f_configs = f_graph_configs[1]
         nexts = []
         for next_f_name, next_f_config in next_f_configs.items():
-            nexts.append(self.init_node(next_f_name, curr_node, next_f_config))
+            nexts.append(self.init_node(next_f_name, curr_node, next_f_config,
+                                        path))
         curr_node.nexts = nexts
         return curr_node
 
@@ -141,6 +278,31 @@ class Workflow(Inferencer):
         self.pred_g = pred_g
         return pred_g
 
+    def _run_node(self, node, func_names, params, prev_attrs):
+        """Run func_names at a node and return its outputs."""
+        res_dict = OrderedDict()
+        for func_name, param, prev_attr in zip(func_names, params, prev_attrs):
+            param = dict(param) # Nodes may run concurrently.
+            for attr in prev_attr:
+                if node.prev:
+                    param[attr] = getattr(node.prev.f, attr)
+                else:
+                    param[attr] = None
+            func = getattr(node.f, func_name)
+            with tracer.span(func_name, 'workflow',
+                             node=node.f.__name__) as span:
+                try:
+                    res_dict[(str(node), func_name)] = func(**param)
+                except EmptyTrainingSamples as e:
+                    print(e.msg)
+            if self.debug:
+                print('INFO: {0} at {1} took: {2:.3f}s'.format(
+                    func_name,
+                    node.f,
+                    span['dur']
+                ))
+        return res_dict
+
     def _traverse_wrapper(self, node, func_names, params, prev_attrs=[[]]):
         """
         Traversing the graph with the given jobs.
@@ -150,6 +312,12 @@ class Workflow(Inferencer):
         See update_model for an example.
         Outputs are flattened into a dictionary
 
+        A node only depends on its parent, so with
+        self.max_concurrent_nodes > 1 the branches of the graph run
+        concurrently, in the processes of the nodes or in threads (see
+        node_executor). The outputs are ordered depth-first as if nodes
+        ran serially.
+
         # Inputs:
         - node (Node): Current node to apply functions
                        and then its children recursively.
@@ -159,32 +327,37 @@ class Workflow(Inferencer):
         """
         assert isinstance(func_names, list)
         assert isinstance(params, list)
-        res_dict = OrderedDict()
-
-        for func_name, param, prev_attr in zip(func_names, params, prev_attrs):
-            t0 = arrow.get()
-            for attr in prev_attr:
-                if node.prev:
-                    param[attr] = getattr(node.prev.f, attr)
-                else:
-                    param[attr] = None
-            func = getattr(node.f, func_name)
-            try:
-                res_dict[(str(node), func_name)] = func(**param)
-            except EmptyTrainingSamples as e:
-                print(e.msg)
-            t1 = arrow.get()
-            if self.debug:
-                print('INFO: {0} at {1} took: {2}'.format(
-                    func_name,
-                    node.f,
-                    t1 - t0
-                ))
 
+        run_node = lambda curr_node: self._run_node(
+            curr_node, func_names, params, prev_attrs)
+        node_results = {}
+        if self.max_concurrent_nodes == 1:
+            stack = [node]
+            while stack:
+                curr_node = stack.pop()
+                node_results[curr_node] = run_node(curr_node)
+                stack.extend(reversed(curr_node.nexts))
+        else:
+            # A child is submitted as soon as its parent is done. With the
+            # process executor, the threads only wait for the nodes.
+            with ThreadPoolExecutor(
+                    max_workers=self.max_concurrent_nodes) as pool:
+                futures = {pool.submit(run_node, node): node}
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        curr_node = futures.pop(future)
+                        node_results[curr_node] = future.result()
+                        for next_node in curr_node.nexts:
+                            futures[pool.submit(run_node, next_node)] = \
+                                next_node
 
-        for next_node in node.nexts:
-            res_dict.update(self._traverse_wrapper(next_node, func_names,
-                                                   params, prev_attrs))
+        res_dict = OrderedDict()
+        stack = [node]
+        while stack:
+            curr_node = stack.pop()
+            res_dict.update(node_results[curr_node])
+            stack.extend(reversed(curr_node.nexts))
         return res_dict
 
     def update_model(self, new_srcids):
@@ -216,21 +389,39 @@ class Workflow(Inferencer):
         self._traverse_wrapper(self.f_head, ['update_model'], [params])
 
     def learn_auto(self, inc_num=1, iter_num=250):
+        tracer.reset() # The trace covers this run only.
         for i in range(0, iter_num):
             print('--------------------------')
-            t0 = arrow.get()
             print('{0}th iteration'.format(i))
-            new_srcids = self.select_informative_samples(inc_num)
-            t1 = arrow.get()
-            print('{0}th TOTAL "select_samples" took: {1}'.format(i, t1-t0))
-            self.update_model(new_srcids)
-            t2 = arrow.get()
-            print('{0}th TOTAL "update_model" took: {1}'.format(i, t2-t1))
-            self.evaluate(self.target_srcids)
+            with tracer.span('iteration', 'workflow', node=self.__name__,
+                             iter=i) as iter_span:
+                with tracer.span('select_informative_samples', 'workflow',
+                                 node=self.__name__) as select_span:
+                    new_srcids = self.select_informative_samples(inc_num)
+                print('{0}th TOTAL "select_samples" took: {1:.3f}s'
+                      .format(i, select_span['dur']))
+                with tracer.span('update_model', 'workflow',
+                                 node=self.__name__) as update_span:
+                    self.update_model(new_srcids)
+                print('{0}th TOTAL "update_model" took: {1:.3f}s'
+                      .format(i, update_span['dur']))
+                with tracer.span('evaluate', 'workflow',
+                                 node=self.__name__) as evaluate_span:
+                    self.evaluate(self.target_srcids)
             print('curr new srcids: {0}'.format(len(new_srcids)))
             print('training srcids: {0}'.format(len(self.training_srcids)))
             print('f1: {0}'.format(self.history[-1]['metrics']['f1']))
             print('macrof1: {0}'.format(self.history[-1]['metrics']['macrof1']))
-            t3 = arrow.get()
-            print('{0}th TOTAL "evaluate" took: {1}'.format(i, t3-t2))
-            print('{0}th took: {1}'.format(i, t3-t0))
+            print('{0}th TOTAL "evaluate" took: {1:.3f}s'
+                  .format(i, evaluate_span['dur']))
+            print('{0}th took: {1:.3f}s'.format(i, iter_span['dur']))
+            self.checkpoint_frameworks(i)
+        self.checkpoint_frameworks()
+
+    def checkpoint_frameworks(self, iter_num=None):
+        """Save the state of the frameworks of the graph if it is due."""
+        stack = list(self.f_head.nexts)
+        while stack:
+            node = stack.pop()
+            node.f.checkpoint(iter_num)
+            stack.extend(node.nexts)
@@ -0,0 +1,51 @@
+import sys, os
+import time
+import json
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, dir_path + '/..')
+
+import numpy as np
+
+from plastering.data_feature_extractor import *
+
+# Seconds of getF_2012_Calbimonte against the previous implementation
+# (get_SS over a process pool) on random walks.
+# Usage: python scripts/bench_calbimonte.py [[[100,3000],[1000,3000]]]
+
+try:
+    shapes = json.loads(sys.argv[1])
+except:
+    shapes = [[100, 1000], [100, 3000], [1000, 3000]]
+B = 20
+SEGS = 5
+
+
+def pool_calbimonte(X, B, segs):
+    SS = get_SS(X, B)
+    PLSF = np.array([get_piecewise_linear_symbol_feature(get_ts_slopes(S),segs)
+                     for S in SS])
+    return PLSF.astype(float)
+
+
+if __name__ == '__main__':
+    results = []
+    for N, D in shapes:
+        X = np.cumsum(np.random.randn(N, D), axis=1)
+        t0 = time.time()
+        F_pool = pool_calbimonte(X, B, SEGS)
+        t1 = time.time()
+        F = data_feature_extractor(X).getF_2012_Calbimonte(B, SEGS)
+        t2 = time.time()
+        assert (F == F_pool).all()
+
+        res = {
+            'shape': [N, D],
+            'pool_sec': t1 - t0,
+            'vectorized_sec': t2 - t1,
+        }
+        print('{shape}: pool {pool_sec:.2f}s, vectorized {vectorized_sec:.2f}s'
+              .format(**res))
+        results.append(res)
+
+    with open('result/bench_calbimonte.json', 'w') as fp:
+        json.dump(results, fp, indent=2)
@@ -0,0 +1,64 @@
+import sys, os
+import time
+import json
+os.environ['TRIPLE_STORE_TYPE'] = "rdflib"
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, dir_path + '/..')
+
+from plastering.inferencers.zodiac import ZodiacInterface
+from plastering.metadata_interface import *
+
+# Usage: python scripts/bench_metadata_init.py ap_m [100,500,1000]
+
+target_building = sys.argv[1]
+try:
+    point_nums = json.loads(sys.argv[2])
+except:
+    point_nums = [100, 500, 1000, 2000, 5000]
+
+labeled_list = LabeledMetadata.objects(building=target_building)
+all_srcids = [labeled['srcid'] for labeled in labeled_list]
+
+
+def load_per_srcid(srcids):
+    raw_metadata = {}
+    labels = {}
+    for srcid in srcids:
+        raw_metadata[srcid] = RawMetadata.objects(srcid=srcid).first().metadata
+        label_doc = query_labels(srcid=srcid).first()
+        if label_doc:
+            labels[srcid] = label_doc.point_tagset
+    return raw_metadata, labels
+
+
+results = []
+for point_num in point_nums:
+    if point_num > len(all_srcids):
+        break
+    target_srcids = all_srcids[:point_num]
+
+    t0 = time.time()
+    load_per_srcid(target_srcids)
+    t1 = time.time()
+    load_metadata_cache(srcids=target_srcids, label_fields=[POINT_TAGSET])
+    t2 = time.time()
+    ZodiacInterface(target_building=target_building,
+                    target_srcids=target_srcids,
+                    config={'seed_num': 5},
+                    )
+    t3 = time.time()
+
+    res = {
+        'point_num': point_num,
+        'per_srcid_load': t1 - t0,
+        'bulk_load': t2 - t1,
+        'zodiac_init': t3 - t2,
+    }
+    print('{point_num} points: per-srcid {per_srcid_load:.2f}s, '
+          'bulk {bulk_load:.2f}s, zodiac init {zodiac_init:.2f}s'
+          .format(**res))
+    results.append(res)
+
+with open('result/bench_metadata_init_{0}.json'.format(target_building),
+          'w') as fp:
+    json.dump(results, fp, indent=2)
@@ -0,0 +1,46 @@
+import sys, os
+import time
+import json
+os.environ['TRIPLE_STORE_TYPE'] = "rdflib"
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, dir_path + '/..')
+
+from plastering.rdf_wrapper import *
+
+# Time to write point predictions into a BrickGraph one by one
+# and in batches.
+# Usage: python scripts/bench_pred_insert.py [[1000,10000]]
+
+try:
+    pred_nums = json.loads(sys.argv[1])
+except:
+    pred_nums = [1000, 10000]
+POINT_TAGSETS = ['zone_temperature_sensor', 'supply_air_flow_sensor',
+                 'zone_temperature_setpoint', 'occupied_command']
+
+results = []
+for pred_num in pred_nums:
+    preds = [('point_{0}'.format(i), POINT_TAGSETS[i % len(POINT_TAGSETS)])
+             for i in range(pred_num)]
+
+    single_g = BrickGraph(empty=True)
+    t0 = time.time()
+    for srcid, pred_point in preds:
+        single_g.add_pred_point_result(srcid, pred_point)
+    t1 = time.time()
+    batch_g = BrickGraph(empty=True)
+    batch_g.add_pred_point_results(preds)
+    t2 = time.time()
+    assert single_g.get_instance_tuples() == batch_g.get_instance_tuples()
+
+    res = {
+        'pred_num': pred_num,
+        'single_ms': (t1 - t0) * 1000,
+        'batch_ms': (t2 - t1) * 1000,
+    }
+    print('{pred_num} predictions: single {single_ms:.1f} ms, '
+          'batch {batch_ms:.1f} ms'.format(**res))
+    results.append(res)
+
+with open('result/bench_pred_insert.json', 'w') as fp:
+    json.dump(results, fp, indent=2)
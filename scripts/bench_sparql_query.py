@@ -0,0 +1,61 @@
+import sys, os
+import time
+import json
+os.environ['TRIPLE_STORE_TYPE'] = "rdflib"
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, dir_path + '/..')
+
+from plastering.rdf_wrapper import *
+from plastering.rdf_wrapper import rdflib_wrapper
+
+# Query latency of BrickGraph.get_instance_tuples against the number of
+# instance triples, with the previous copy-the-union path as a baseline.
+# Usage: python scripts/bench_sparql_query.py [[100,1000,10000]]
+
+try:
+    instance_nums = json.loads(sys.argv[1])
+except:
+    instance_nums = [100, 1000, 5000, 10000]
+REPEAT = 5
+POINT_TAGSETS = ['zone_temperature_sensor', 'supply_air_flow_sensor',
+                 'zone_temperature_setpoint', 'occupied_command']
+
+
+def union_query(g, qstr):
+    return (g + rdflib_wrapper.schema_g).query(qstr).bindings
+
+
+results = []
+for instance_num in instance_nums:
+    pred_g = BrickGraph(empty=True)
+    for i in range(instance_num):
+        pred_g.add_pred_point_result('point_{0}'.format(i),
+                                     POINT_TAGSETS[i % len(POINT_TAGSETS)])
+    qstr = pred_g.sparql_prefix + """
+    select ?s ?o where {
+        ?s a ?o.
+        FILTER(STRSTARTS(STR(?s), "%s"))
+    }
+    """ % (pred_g.BASE)
+
+    pred_g.get_instance_tuples() # warm up the prepared query cache.
+    t0 = time.time()
+    for _ in range(REPEAT):
+        res = pred_g.get_instance_tuples()
+    t1 = time.time()
+    for _ in range(REPEAT):
+        union_res = union_query(pred_g.g, qstr)
+    t2 = time.time()
+    assert len(res) == len(union_res) == instance_num
+
+    res = {
+        'instance_num': instance_num,
+        'union_view_ms': (t1 - t0) / REPEAT * 1000,
+        'copied_union_ms': (t2 - t1) / REPEAT * 1000,
+    }
+    print('{instance_num} instances: union view {union_view_ms:.1f} ms, '
+          'copied union {copied_union_ms:.1f} ms'.format(**res))
+    results.append(res)
+
+with open('result/bench_sparql_query.json', 'w') as fp:
+    json.dump(results, fp, indent=2)
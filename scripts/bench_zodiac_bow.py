@@ -0,0 +1,60 @@
+import sys, os
+import time
+import json
+import tracemalloc
+os.environ['TRIPLE_STORE_TYPE'] = "rdflib"
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, dir_path + '/..')
+
+from plastering.inferencers.zodiac import ZodiacInterface, get_bow_nbytes
+from plastering.metadata_interface import *
+
+# Compare dense and sparse BoW modes of Zodiac.
+# Usage: python scripts/bench_zodiac_bow.py ap_m [source_building]
+
+target_building = sys.argv[1]
+try:
+    source_buildings = [sys.argv[2]]
+    sample_num_list = [200]
+except:
+    source_buildings = []
+    sample_num_list = []
+ITER_NUM = 5
+
+labeled_list = LabeledMetadata.objects(building=target_building)
+target_srcids = [labeled['srcid'] for labeled in labeled_list]
+
+results = []
+for sparse_bow in [False, True]:
+    config = {
+        'sparse_bow': sparse_bow,
+        'sample_num_list': sample_num_list,
+        'seed_num': 5,
+    }
+    tracemalloc.start()
+    t0 = time.time()
+    zodiac = ZodiacInterface(target_building=target_building,
+                             target_srcids=target_srcids,
+                             source_buildings=source_buildings,
+                             config=config,
+                             )
+    t1 = time.time()
+    zodiac.learn_auto(iter_num=ITER_NUM, evaluate_flag=False)
+    t2 = time.time()
+    _, peak_mem = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    res = {
+        'mode': 'sparse' if sparse_bow else 'dense',
+        'bow_shape': list(zodiac.total_bow.shape),
+        'bow_mb': get_bow_nbytes(zodiac.total_bow) / 2 ** 20,
+        'peak_mb': peak_mem / 2 ** 20,
+        'init_sec': t1 - t0,
+        'sec_per_iter': (t2 - t1) / ITER_NUM,
+    }
+    print('{mode}: BoW {bow_shape} {bow_mb:.2f} MB, peak {peak_mb:.1f} MB, '
+          'init {init_sec:.2f}s, {sec_per_iter:.2f}s/iter'.format(**res))
+    results.append(res)
+
+with open('result/bench_zodiac_bow_{0}.json'.format(target_building),
+          'w') as fp:
+    json.dump(results, fp, indent=2)
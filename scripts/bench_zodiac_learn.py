@@ -0,0 +1,54 @@
+import sys, os
+import time
+import json
+os.environ['TRIPLE_STORE_TYPE'] = "rdflib"
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, dir_path + '/..')
+
+from plastering.inferencers.zodiac import ZodiacInterface
+from plastering.metadata_interface import *
+
+# Seconds per active-learning iteration of a full learn_auto run
+# for each model update mode of Zodiac.
+# Usage: python scripts/bench_zodiac_learn.py ap_m [n_jobs]
+
+target_building = sys.argv[1]
+try:
+    n_jobs = int(sys.argv[2])
+except:
+    n_jobs = 1
+
+labeled_list = LabeledMetadata.objects(building=target_building)
+target_srcids = [labeled['srcid'] for labeled in labeled_list]
+
+results = []
+for model_update in ['refit', 'warm_start']:
+    config = {
+        'model_update': model_update,
+        'n_jobs': n_jobs,
+        'seed_num': 5,
+    }
+    zodiac = ZodiacInterface(target_building=target_building,
+                             target_srcids=target_srcids,
+                             config=config,
+                             )
+    t0 = time.time()
+    zodiac.learn_auto()
+    t1 = time.time()
+    iter_num = len(zodiac.history)
+    res = {
+        'model_update': model_update,
+        'n_jobs': n_jobs,
+        'iterations': iter_num,
+        'model_fits': zodiac.model_version,
+        'sec_per_iter': (t1 - t0) / iter_num,
+        'final_f1': zodiac.history[-1]['metrics']['f1'],
+        'final_macrof1': zodiac.history[-1]['metrics']['macrof1'],
+    }
+    print('{model_update}: {iterations} iterations, {model_fits} fits, '
+          '{sec_per_iter:.2f}s/iter, f1 {final_f1:.3f}'.format(**res))
+    results.append(res)
+
+with open('result/bench_zodiac_learn_{0}.json'.format(target_building),
+          'w') as fp:
+    json.dump(results, fp, indent=2)
@@ -5,6 +5,8 @@ from plastering.timeseries_interface import *
 '''
 -b specifies the building name, which is the name used for storing data in DB
 -p specifies the path to the directory for time series data files
+-k specifies the timeseries backend, arctic or local
+   (TIMESERIES_BACKEND or arctic by default)
 
 this interface requires the following dependency:
     https://github.com/manahl/arctic
@@ -20,18 +22,21 @@ python timeserie.init -b uva_csv -p /path_to_uva_cse_data_files/
 parser = argparse.ArgumentParser()
 parser.add_argument('-b', type=str, dest='building', required=True)
 parser.add_argument('-p', type=str, dest='path', required=True)
+parser.add_argument('-k', type=str, dest='backend', default=None,
+                    choices=['arctic', 'local'])
 
 args = parser.parse_args()
 building = args.building
 path = args.path
+backend = args.backend
 print ('------storing data for %s from %s------'%(building, path))
 
 #write to DB
-write_wrapper(building, path, 1)
+write_wrapper(building, path, 1, backend=backend)
 
 #test loading from DB
 print ('------testing loading function for %s------'%building)
-res = read_from_db(building)
+res = read_from_db(building, backend=backend)
 for point,data in res.items():
     print ('data for %s loaded with %d entries'%(point, len(data.data)))
 
@@ -0,0 +1,105 @@
+from rdflib import URIRef, RDF, Graph
+
+from plastering.rdf_wrapper import *
+from plastering.rdf_wrapper import rdflib_wrapper
+
+g = BrickGraph(empty=False)
+hierarchy = g.hierarchy
+
+assert get_top_class('zone_temperature_sensor') == 'temperature_sensor'
+assert get_top_class('occupied_command') == 'command'
+assert is_subclass('zone_temperature_sensor', 'temperature_sensor')
+assert is_subclass('zone_temperature_sensor', 'zone_temperature_sensor')
+assert not is_subclass('temperature_sensor', 'zone_temperature_sensor')
+
+# The index should agree with the SPARQL property path it replaces.
+qstr = """
+select ?tagset where {
+    ?tagset rdfs:subClassOf+ bf:TagSet.
+}
+"""
+tagsets = set(row['tagset'] for row in g.query_sparql(qstr))
+assert tagsets == set(g.get_all_tagsets())
+
+pred_g = BrickGraph(empty=True)
+pred_g.insert_triple((URIRef(pred_g.BASE + 'vav1'), RDF.type,
+                      pred_g.BRICK['vav']))
+pred_g.insert_triple((URIRef(pred_g.BASE + 'znt1'), RDF.type,
+                      pred_g.BRICK['zone_temperature_sensor']))
+assert pred_g.get_vavs() == [URIRef(pred_g.BASE + 'vav1')]
+
+# Queries over the union view return the same rows, duplicates included,
+# as the graph materialized by adding the schema. The order of path
+# results is not stable in rdflib, so rows are compared sorted.
+pred_g.insert_triple((URIRef(pred_g.BASE + 'znt2'), RDF.type,
+                      pred_g.BRICK['zone_temperature_sensor']))
+pred_g.insert_triple((URIRef(pred_g.BASE + 'sat1'), RDF.type,
+                      pred_g.BRICK['supply_air_temperature_sensor']))
+def to_rows(res):
+    return sorted(sorted((str(k), str(v)) for k, v in row.items())
+                  for row in res)
+for qstr in ['select ?s where { ?s a/rdfs:subClassOf* brick:temperature_sensor . }',
+             'select ?s where { ?s a/rdfs:subClassOf* brick:vav . }',
+             'select ?s ?o where { ?s a ?o . }',
+             'select ?p where { ?p rdfs:subClassOf+ brick:sensor . }',
+             ]:
+    materialized_g = pred_g.g + rdflib_wrapper.schema_g
+    expected = materialized_g.query(pred_g.sparql_prefix + qstr).bindings
+    assert to_rows(pred_g.query_sparql(qstr)) == to_rows(expected), qstr
+assert len(pred_g.query_sparql(
+    'select ?s where { ?s a/rdfs:subClassOf* brick:temperature_sensor . }')) == 3
+
+# Terms passed as bindings reuse one prepared query.
+vav1 = URIRef(pred_g.BASE + 'vav1')
+pred_g.insert_triple((URIRef(pred_g.BASE + 'znt1'), pred_g.BF['isPointOf'],
+                      vav1))
+pred_g.insert_triple((URIRef(pred_g.BASE + 'vav2'), RDF.type,
+                      pred_g.BRICK['vav']))
+hits = rdflib_wrapper._prepare_query.cache_info().hits
+assert pred_g.get_vav_points(vav1) == [URIRef(pred_g.BASE + 'znt1')]
+assert pred_g.get_vav_points(URIRef(pred_g.BASE + 'vav2')) == []
+assert rdflib_wrapper._prepare_query.cache_info().hits > hits
+assert get_point_type(pred_g.g, vav1) == 'vav'
+
+# The union graph keeps a triple of both graphs once, and serializes
+# with the schema unless include_schema=False.
+schema_len = len(rdflib_wrapper.schema_g)
+overlay_g = BrickGraph(empty=False)
+schema_triple = next(iter(rdflib_wrapper.schema_g))
+overlay_g.insert_triple(schema_triple)
+overlay_g.insert_triple((vav1, RDF.type, overlay_g.BRICK['vav']))
+assert len(overlay_g.g) == schema_len + 1
+assert len(list(overlay_g.g.triples(schema_triple))) == 1
+assert len(Graph().parse(data=overlay_g.g.serialize(format='turtle'),
+                         format='turtle')) == schema_len + 1
+assert len(Graph().parse(data=overlay_g.g.serialize(format='turtle',
+                                                    include_schema=False),
+                         format='turtle')) == 1
+# Prefixes bound later are seen by queries.
+overlay_g.g.get_init_ns()
+overlay_g.g.bind('ex', 'http://example.org/building#')
+overlay_g.insert_triple((URIRef('http://example.org/building#vav3'),
+                         RDF.type, overlay_g.BRICK['vav']))
+assert len(overlay_g.query_sparql('select ?t where { ex:vav3 a ?t . }')) == 1
+print('brick hierarchy test passed')
+
+# Class names resolve in the namespace of the loaded schema version.
+import os
+import tempfile
+from plastering.rdf_wrapper.brick_hierarchy import get_brick_hierarchy
+schema_dir = tempfile.mkdtemp()
+schema_files = []
+for filename in ['brick/Brick_1_0_2.ttl', 'brick/BrickFrame_1_0_2.ttl']:
+    with open(filename) as fp:
+        ttl = fp.read().replace('/schema/1.0.2/', '/schema/1.0.3/')
+    schema_file = os.path.join(schema_dir, os.path.basename(filename))
+    with open(schema_file, 'w') as fp:
+        fp.write(ttl)
+    schema_files.append(schema_file)
+hierarchy_103 = get_brick_hierarchy(rdflib_wrapper.load_schema(*schema_files))
+assert str(hierarchy_103.BRICK) == 'https://brickschema.org/schema/1.0.3/Brick#'
+assert hierarchy_103.is_subclass('zone_temperature_sensor', 'temperature_sensor')
+assert hierarchy_103.get_top_class('zone_temperature_sensor') == \
+    'temperature_sensor'
+assert len(hierarchy_103.get_all_tagsets()) == len(hierarchy.get_all_tagsets())
+print('brick hierarchy test for another version passed')
@@ -0,0 +1,26 @@
+import numpy as np
+
+from plastering.data_feature_extractor import data_feature_extractor
+
+# Shared statistics give the same features as computing them directly,
+# also for float32 inputs where rounding depends on how numpy is called.
+rng = np.random.RandomState(0)
+for X in [rng.rand(40, 301).astype(np.float32),
+          (rng.randn(30, 500) * 100).astype(np.float32),
+          rng.randn(20, 256)]:
+    dfe = data_feature_extractor(X)
+    gao = dfe.getF_2015_Gao()
+    percentiles = np.vstack([np.percentile(X, q, axis=1)
+                             for q in [2, 9, 25, 75, 91, 98]]).T
+    assert np.array_equal(gao[:, 8:14], percentiles)
+    assert np.array_equal(gao[:, 0], np.min(X, 1))
+    assert np.array_equal(gao[:, 1], np.median(X, 1))
+    assert np.array_equal(gao[:, 3], np.max(X, 1))
+    balaji = dfe.getF_2015_Balaji()
+    assert np.array_equal(balaji[:, 3], np.percentile(X, 25, axis=1))
+    assert np.array_equal(balaji[:, 4], np.percentile(X, 75, axis=1))
+    # Features from get_features match the ones computed one by one.
+    features = data_feature_extractor(X).get_features()
+    for f, F in zip(dfe.functions, features):
+        assert np.array_equal(F, getattr(dfe, f)(), equal_nan=True), f
+print('data feature extractor test passed')
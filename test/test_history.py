@@ -0,0 +1,60 @@
+import os
+import random
+import tempfile
+
+import numpy as np
+
+from plastering.history import HistoryRecorder
+
+# Record random evaluations and rebuild every entry from the deltas,
+# in memory and from the JSONL file.
+random.seed(0)
+srcids = ['srcid_{0}'.format(i) for i in range(200)]
+labels = ['zone_temperature_sensor', 'supply_air_flow_sensor',
+          'occupied_command', None]
+filename = os.path.join(tempfile.mkdtemp(), 'history.jsonl')
+history = HistoryRecorder(filename, checkpoint_interval=7)
+
+entries = []
+pred = {srcid: random.choice(labels) for srcid in srcids}
+training_srcids = []
+for i in range(30):
+    training_srcids.append(srcids[i])
+    for srcid in random.sample(srcids, 10):
+        pred[srcid] = random.choice(labels)
+    if i == 20: # all tagsets predictions
+        pred = {srcid: random.sample(labels[:3], 2) for srcid in srcids}
+    if i == 25: # a srcid that is not predicted anymore
+        del pred[srcids[0]]
+    entry = {
+        'metrics': {'f1': np.float64(i / 30)},
+        'total_training_srcids': list(training_srcids),
+        'target_building_training_srcids': training_srcids[::2],
+        'pred': dict(pred),
+    }
+    entries.append(entry)
+    history.append(entry)
+
+assert len(history) == 30
+assert history[-1] == entries[-1]
+assert [history[i] for i in range(30)] == entries
+assert list(history) == entries
+assert history[3:9] == entries[3:9]
+loaded = HistoryRecorder.load(filename)
+assert list(loaded) == entries
+assert loaded[12] == entries[12]
+
+# Reordered training srcids are stored as a full list.
+entry = dict(entries[-1], total_training_srcids=training_srcids[::-1])
+history.append(entry)
+assert history[-1] == entry
+assert history[-2] == entries[-1]
+print('history recorder test passed')
+
+# Keys other than the known ones are kept as they are.
+entry = dict(entries[-1], timestamp=np.float64(1.5), notes={'query': 'q1'})
+history.append(entry)
+assert history[-1] == entry
+assert HistoryRecorder.load(filename)[-1] == entry
+assert 'timestamp' not in history[-2]
+print('history recorder extra keys test passed')
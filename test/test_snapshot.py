@@ -0,0 +1,29 @@
+import tempfile
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+from plastering.snapshot import *
+
+state_dir = os.path.join(tempfile.mkdtemp(), 'state')
+bow = sp.random(100, 30, density=0.1, format='csr', dtype=np.float64)
+inverse = np.arange(100)
+objects = {'training_srcids': ['a', 'b'], 'th_ptr': 3}
+
+assert not has_state(state_dir)
+save_snapshot(state_dir, {'bow': bow, 'inverse': inverse}, objects,
+              {'framework': 'test'})
+assert has_state(state_dir)
+
+state, arrays, loaded_objects = load_snapshot(state_dir)
+assert state['framework'] == 'test'
+assert (arrays['bow'] != bow).nnz == 0
+assert (arrays['inverse'] == inverse).all()
+assert loaded_objects == objects
+
+# Saving again replaces the previous snapshot.
+save_snapshot(state_dir, {}, {'th_ptr': 4})
+state, arrays, loaded_objects = load_snapshot(state_dir)
+assert arrays == {} and loaded_objects == {'th_ptr': 4}
+print('snapshot test passed')
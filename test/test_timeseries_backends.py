@@ -0,0 +1,84 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from plastering.timeseries_interface import *
+
+# Ingest csv files into the local backend and read them back.
+csv_dir = tempfile.mkdtemp()
+store_dir = tempfile.mkdtemp()
+backend = 'local'
+
+timestamps = pd.date_range('2017-01-20', periods=5000, freq='min')
+for i in range(3):
+    pd.DataFrame({
+        'timestamp': timestamps.strftime('%Y-%m-%d %H:%M:%S'),
+        'value': np.arange(5000) + i,
+    }).to_csv(os.path.join(csv_dir, 'point_{0}.csv'.format(i)), index=False)
+
+store = get_store(backend, root=store_dir)
+lib = store.get_library('test_building', create=True)
+rows = write_chunks(lib, 'point_0',
+                    iter_csv_chunks(os.path.join(csv_dir, 'point_0.csv'),
+                                    chunk_rows=1200))
+assert rows == 5000
+df = pd.read_csv(os.path.join(csv_dir, 'point_1.csv'),
+                 index_col=0, parse_dates=True)
+lib.write('point_1', df.rename(columns={'value': 'data'}))
+assert sorted(lib.list_symbols()) == ['point_0', 'point_1']
+
+ts, values = lib.read_range('point_0')
+assert isinstance(values, np.memmap) # Zero-copy read
+assert (values == np.arange(5000)).all()
+assert (ts == timestamps.values).all()
+
+# Range reads
+ts, values = lib.read_range('point_1', DEFAULT_START_TIME.datetime,
+                            arrow.get(2017, 1, 20, 1).datetime)
+assert len(values) == 61 and values[0] == 1
+ts, values = lib.read_range('point_1', arrow.get(2017, 1, 20, 1).datetime,
+                            max_samples=10)
+assert len(values) == 10 and values[0] == 61
+
+# Out of order appends are merged.
+df = lib.read('point_1')
+lib.write('point_2', df[2500:])
+lib.append('point_2', df[:2500])
+assert (lib.read('point_2')['data'].values == df['data'].values).all()
+
+srcids, X = read_matrix('test_building', ['point_2', 'point_0', 'none'],
+                        max_samples=3000, backend=backend)
+assert srcids == ['point_2', 'point_0']
+assert X.shape == (2, 3000) and X.dtype == np.float64
+assert (X[1] == np.arange(3000)).all()
+
+# An interrupted append is not read and is overwritten by the next one.
+point_dir = lib._symbol_dir('point_0')
+with open(os.path.join(point_dir, 'date.0.bin'), 'ab') as fp:
+    fp.write(b'\x00' * 12)
+ts, values = lib.read_range('point_0')
+assert len(ts) == len(values) == 5000
+lib.append('point_0', pd.DataFrame(
+    {'data': [1.0]}, index=pd.DatetimeIndex([timestamps[-1] +
+                                             pd.Timedelta(minutes=1)])))
+ts, values = lib.read_range('point_0')
+assert len(ts) == len(values) == 5001 and values[-1] == 1.0
+assert ts[-1] == timestamps[-1] + pd.Timedelta(minutes=1)
+# Rewrites go to the next generation of files.
+assert sorted(os.listdir(lib._symbol_dir('point_2'))) == \
+    ['data.1.bin', 'date.1.bin', 'meta.json']
+
+# Status strings are dropped and empty values kept as NaN.
+with open(os.path.join(csv_dir, 'point_3.csv'), 'w') as fp:
+    fp.write('timestamp,value\n2017-01-20 00:00:00,1.5\n'
+             '2017-01-20 00:01:00,OFFLINE\n2017-01-20 00:02:00,\n'
+             '2017-01-20 00:03:00,2\n')
+chunks = list(iter_csv_chunks(os.path.join(csv_dir, 'point_3.csv'),
+                              chunk_rows=2))
+ts = np.concatenate([chunk[0].values for chunk in chunks])
+values = np.concatenate([chunk[1] for chunk in chunks])
+assert len(ts) == 3 and ts[-1] == np.datetime64('2017-01-20T00:03:00')
+assert values[0] == 1.5 and np.isnan(values[1]) and values[2] == 2
+print('timeseries backends test passed')
@@ -0,0 +1,78 @@
+import os
+import json
+import tempfile
+import threading
+
+from plastering.tracer import Tracer
+
+# Nested spans from several threads, a profiled phase and both exports.
+trace_dir = tempfile.mkdtemp()
+tracer = Tracer(profile_dir=os.path.join(trace_dir, 'profile'))
+tracer.profile_phases.add('fit')
+
+def work(i):
+    with tracer.span('iteration', iter=i):
+        tracer.count('db_queries')
+        with tracer.span('fit'):
+            tracer.count('model_fits', 2)
+            sum(range(10000))
+
+threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+
+assert tracer.counters == {'db_queries': 4, 'model_fits': 8}
+summary = tracer.get_summary()
+# Counts of a phase include the ones of its inner phases.
+assert summary[('phase', 'iteration')]['num'] == 4
+assert summary[('phase', 'iteration')]['counters'] == \
+    {'db_queries': 4, 'model_fits': 8}
+assert summary[('phase', 'fit')]['counters'] == {'model_fits': 8}
+for span in tracer.get_trace()['spans']:
+    if span['name'] == 'fit':
+        assert os.path.isfile(span['args']['profile'])
+
+tracer.save(os.path.join(trace_dir, 'trace.json'))
+tracer.save(os.path.join(trace_dir, 'chrome.json'), 'chrome')
+with open(os.path.join(trace_dir, 'trace.json')) as fp:
+    assert len(json.load(fp)['spans']) == 8
+with open(os.path.join(trace_dir, 'chrome.json')) as fp:
+    events = json.load(fp)['traceEvents']
+assert len(events) == 8 and all(event['ph'] == 'X' for event in events)
+tracer.print_summary()
+
+# Profiled phases of concurrent threads do not overlap, and a profiled
+# phase inside another one is covered by the outer profile.
+tracer.reset()
+tracer.profile_phases.add('predict')
+
+def work_nested(i):
+    with tracer.span('fit'):
+        sum(range(10000))
+        with tracer.span('predict'):
+            sum(range(10000))
+
+threads = [threading.Thread(target=work_nested, args=(i,)) for i in range(4)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+spans = tracer.get_trace()['spans']
+fits = [span for span in spans if span['name'] == 'fit']
+assert len(fits) == 4 and all('profile' in span['args'] for span in fits)
+assert not any('profile' in span['args'] for span in spans
+               if span['name'] == 'predict')
+for prev, span in zip(fits, fits[1:]):
+    assert prev['start'] + prev['dur'] <= span['start']
+
+# Only the latest max_spans spans are kept.
+small_tracer = Tracer(max_spans=3)
+for i in range(5):
+    with small_tracer.span('iteration', iter=i):
+        small_tracer.count('db_queries')
+spans = small_tracer.get_trace()['spans']
+assert [span['args']['iter'] for span in spans] == [2, 3, 4]
+assert small_tracer.counters == {'db_queries': 5}
+print('tracer test passed')
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from plastering.rdf_wrapper.virtuoso_wrapper import BrickEndpoint
+from plastering.rdf_wrapper.common import *
+
+# A local stand-in of the Virtuoso SPARQL endpoint. It answers every
+# select query with one binding and records updates and connections.
+updates = []
+client_ports = set()
+active = [0, 0] # current, max concurrent read queries
+lock = threading.Lock()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body):
+        body = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/sparql-results+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with lock:
+            client_ports.add(self.client_address[1])
+            active[0] += 1
+            active[1] = max(active)
+        time.sleep(0.05)
+        params = parse_qs(urlparse(self.path).query)
+        with lock:
+            active[0] -= 1
+        self._reply({
+            'head': {'vars': ['s']},
+            'results': {'bindings': [
+                {'s': {'type': 'uri', 'value': params['query'][0].strip()}}
+            ]},
+        })
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        params = parse_qs(self.rfile.read(length).decode('utf-8'))
+        with lock:
+            client_ports.add(self.client_address[1])
+            updates.append(params['update'][0])
+        self._reply({'head': {'vars': []}, 'boolean': True})
+
+
+server = ThreadingHTTPServer(('localhost', 0), StandInHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = 'http://localhost:{0}/sparql'.format(server.server_address[1])
+
+be = BrickEndpoint(url, BRICK_VERSION, load_schema=False,
+                   max_concurrency=2, insert_chunk_size=300)
+
+res = be.query('select ?s where {?s ?p ?o}')
+assert res == [{'s': 'select ?s where {?s ?p ?o}'}]
+
+# Read queries run concurrently up to max_concurrency over reused
+# connections, one per thread (the caller and the two workers).
+qstrs = ['q{0}'.format(i) for i in range(10)]
+res = be.query_many(qstrs)
+assert [row[0]['s'] for row in res] == qstrs
+assert active[1] == 2, active
+assert len(client_ports) <= 3, client_ports
+res = be.query_many(qstrs)
+assert len(client_ports) <= 3, client_ports
+
+# Inserts are chunked.
+triples = [(BASE['p{0}'.format(i)], RDF.type, BRICK['zone_temperature_sensor'])
+           for i in range(700)]
+be.add_triples(triples)
+assert len(updates) == 3
+assert sum(q.count(' .\n') for q in updates) == 700
+
+# Async variant
+async def run_async():
+    res = await asyncio.gather(*[be.aquery(q) for q in qstrs[:4]])
+    await be.aadd_triples(triples[:10])
+    return res
+res = asyncio.run(run_async())
+assert [row[0]['s'] for row in res] == qstrs[:4]
+assert len(updates) == 4
+
+be.close()
+
+# Without schema files given, the default Brick files are loaded by their
+# absolute paths.
+del updates[:]
+be = BrickEndpoint(url, BRICK_VERSION, load_schema=True)
+assert len(updates) == 2
+assert 'file:///' in updates[0] and 'Brick_1_0_2.ttl' in updates[0]
+assert 'BrickFrame_1_0_2.ttl' in updates[1]
+try:
+    be.load_ttlfile(None)
+except Exception as e:
+    assert 'not found' in str(e)
+else:
+    assert False, 'A missing TTL file was loaded'
+be.close()
+server.shutdown()
+print('virtuoso wrapper test passed')
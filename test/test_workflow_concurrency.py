@@ -0,0 +1,88 @@
+import random
+
+from rdflib import RDF
+
+from plastering.workflow import Workflow, NodeProcess
+from plastering.inferencers.inferencer import Inferencer
+
+# Stand-in frameworks that need no database. Each predicts the labels of
+# its prior and draws the others from the random module.
+LABELS = ['zone_temperature_sensor', 'supply_air_flow_sensor',
+          'occupied_command']
+target_srcids = ['srcid_{0}'.format(i) for i in range(30)]
+
+
+class StandIn(Inferencer):
+
+    def __init__(self, target_building, target_srcids, config={}):
+        super(StandIn, self).__init__(target_building=target_building,
+                                      target_srcids=target_srcids,
+                                      framework_name='standin',
+                                      config=config)
+
+    def update_model(self, new_srcids):
+        self.training_srcids += new_srcids
+
+    def select_informative_samples(self, sample_num):
+        return random.sample(self.target_srcids, sample_num)
+
+    def predict(self, target_srcids=None):
+        prior = {}
+        if self.prior_g:
+            prior = self.prior_g.get_instance_tuples()
+        pred_g = self.new_graph(empty=True)
+        pred_confidences = {}
+        pred_points = [prior.get(srcid, random.choice(LABELS))
+                       for srcid in self.target_srcids]
+        self.add_preds(pred_g, pred_confidences, self.target_srcids,
+                       pred_points, [1.0] * len(pred_points))
+        self.pred_g = pred_g
+        self.pred_confidences = pred_confidences
+        return pred_g
+
+
+def run(config):
+    random.seed(0)
+    f_config = {'target_building': 'synthetic',
+                'target_srcids': target_srcids}
+    graph = {'a': (f_config, {'b': (f_config, {}), 'c': (f_config, {})}),
+             'd': (f_config, {})}
+    workflow = Workflow(target_srcids, 'synthetic',
+                        {name: StandIn for name in 'abcd'}, graph,
+                        config=config)
+    # As Workflow.update_model without the labels from the database.
+    res = workflow._traverse_wrapper(
+        workflow.f_head, ['update_prior', 'predict'],
+        [{}, {'target_srcids': target_srcids}],
+        [['pred_g', 'pred_confidences'], []])
+    preds = [g.get_instance_tuples() for (node, func_name), g in res.items()
+             if func_name == 'predict' and g is not None]
+    nodes = list(workflow.f_head.nexts)
+    samples = workflow.select_informative_samples(3)
+    return workflow, nodes, preds, samples
+
+workflow, nodes, preds, samples = run({'max_concurrent_nodes': 3})
+assert all(isinstance(node.f, NodeProcess) for node in nodes)
+assert len(preds) == 4 and all(len(pred) == 30 for pred in preds)
+# Children predict the prior given by their parent in another process.
+a_pred = nodes[0].f.pred_g.get_instance_tuples()
+for child in nodes[0].nexts:
+    assert child.f.pred_g.get_instance_tuples() == a_pred
+nodes[0].f.update_model(target_srcids[:2])
+assert nodes[0].f.get_state()[1]['training_srcids'] == target_srcids[:2]
+workflow.close()
+
+# Each process has its own generator, so results do not depend on the
+# scheduling of the nodes.
+workflow, _, preds_again, samples_again = run({'max_concurrent_nodes': 3})
+assert preds_again == preds and samples_again == samples
+workflow.close()
+
+# Frameworks without their own generator cannot run in threads.
+try:
+    run({'max_concurrent_nodes': 3, 'node_executor': 'thread'})
+except Exception as e:
+    assert 'cannot run in threads' in str(e)
+else:
+    assert False, 'Frameworks sharing the random module ran in threads'
+print('workflow concurrency test passed')
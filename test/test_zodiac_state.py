@@ -0,0 +1,103 @@
+import os
+import tempfile
+
+import numpy as np
+
+from plastering.inferencers import zodiac as zodiac_module
+from plastering.inferencers.zodiac import ZodiacInterface
+from plastering.common import POINT_TAGSET
+from plastering.snapshot import has_state
+
+# Learn a synthetic building, save the state at the end of learn_auto and
+# restore it into a new ZodiacInterface. Metadata and labels come from the
+# dicts below instead of the database.
+point_types = {
+    'ZN-T': 'zone_temperature_sensor',
+    'SA-F': 'supply_air_flow_sensor',
+    'SAT-SP': 'supply_air_temperature_setpoint',
+    'OCC-CMD': 'occupied_command',
+}
+wings = ['north', 'south', 'east', 'west']
+rooms = ['lab', 'office', 'lobby', 'hall', 'conf', 'kitchen']
+metadata = {}
+labels = {}
+for i in range(40):
+    for j, (name, point_type) in enumerate(sorted(point_types.items())):
+        srcid = 'srcid_{0}_{1}'.format(i, j)
+        metadata[srcid] = {
+            'VendorGivenName': '{0}.{1}-{2}.{3}'.format(
+                wings[i % 4], rooms[i % 6], 100 + i, name),
+            'BACnetName': 'VAV{0} {1}'.format(i, name),
+        }
+        labels[srcid] = point_type
+target_srcids = sorted(metadata.keys())
+
+
+class Labeled(dict):
+
+    def __init__(self, point_tagset):
+        super(Labeled, self).__init__(point_tagset=point_tagset)
+        self.point_tagset = point_tagset
+        self.tagsets = [point_tagset]
+
+
+class Labels(list):
+
+    def first(self):
+        return self[0] if self else None
+
+
+def load_metadata_cache(pgid=None, srcids=None, label_fields=None):
+    return ({srcid: metadata[srcid] for srcid in srcids},
+            {srcid: {POINT_TAGSET: labels[srcid]} for srcid in srcids})
+
+zodiac_module.load_metadata_cache = load_metadata_cache
+
+
+class SyntheticZodiac(ZodiacInterface):
+
+    def query_labels(self, srcid=None, **query):
+        return Labels([Labeled(labels[srcid])] if srcid in labels else [])
+
+
+state_dir = os.path.join(tempfile.mkdtemp(), 'zodiac_state')
+config = {
+    'state_dir': state_dir,
+    'resume_state': True,
+    'n_estimators': 20,
+    'seed_num': 2,
+    'random_seed': 0,
+}
+
+zodiac = SyntheticZodiac(target_building='synthetic',
+                         target_srcids=target_srcids,
+                         config=dict(config))
+assert not has_state(state_dir)
+zodiac.learn_auto(iter_num=2, evaluate_flag=False)
+assert has_state(state_dir)
+pred = zodiac.predict(output_format='json')
+
+loaded = SyntheticZodiac(target_building='synthetic',
+                         target_srcids=target_srcids,
+                         config=dict(config))
+assert loaded.training_srcids == zodiac.training_srcids
+assert loaded.available_srcids == zodiac.available_srcids
+assert loaded.th_ptr == zodiac.th_ptr
+assert loaded.model_version == zodiac.model_version
+assert (loaded.total_bow != zodiac.total_bow).nnz == 0
+assert loaded.cluster_map == zodiac.cluster_map
+# The restored model predicts the same without being fit again.
+assert (loaded.predict(output_format='json') == pred).all()
+assert loaded.model_version == zodiac.model_version
+
+# Snapshots of other target srcids or configs are not loaded.
+for kwargs in [{'target_srcids': target_srcids[:-1], 'config': dict(config)},
+               {'target_srcids': target_srcids,
+                'config': dict(config, n_estimators=30)}]:
+    try:
+        SyntheticZodiac(target_building='synthetic', **kwargs)
+    except Exception as e:
+        assert 'snapshot' in str(e)
+    else:
+        assert False, 'A mismatched snapshot was loaded'
+print('zodiac state test passed')